@@ -1,15 +1,31 @@
 import json
-import nltk
-from textblob import TextBlob
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 from collections import Counter
+from lazy_resources import register
 
-# Download necessary NLTK data
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
+def nltk_data(resource, package):
+    # Download NLTK data only when it is not installed yet
+    import nltk
+    try:
+        nltk.data.find(resource)
+    except LookupError:
+        nltk.download(package, quiet=True)
+
+def load_stopwords():
+    nltk_data('corpora/stopwords', 'stopwords')
+    from nltk.corpus import stopwords
+    return set(stopwords.words('english'))
+
+def load_tokenizer():
+    nltk_data('tokenizers/punkt', 'punkt')
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+# NLTK data, fetched on first use rather than on import
+stop_words = register('nltk:stopwords', load_stopwords)
+tokenizer = register('nltk:punkt', load_tokenizer)
 
 def analyze_sentiment(text):
+    from textblob import TextBlob
     blob = TextBlob(text)
     sentiment = blob.sentiment.polarity
     if sentiment > 0.05:
@@ -21,9 +37,8 @@ def analyze_sentiment(text):
 
 def extract_keywords(text, num_keywords=5):
     # Tokenize and remove stopwords
-    stop_words = set(stopwords.words('english'))
-    words = word_tokenize(text.lower())
-    words = [word for word in words if word.isalnum() and word not in stop_words]
+    words = tokenizer.get()(text.lower())
+    words = [word for word in words if word.isalnum() and word not in stop_words.get()]
     
     # Count word frequencies
     word_freq = Counter(words)
@@ -70,5 +85,6 @@ def process_announcements(input_file, output_file):
     
     print(f"Analysis results have been saved to {output_file}")
 
-# Process the announcements
-process_announcements('adgm_announcements.json', 'announcement_analysis.txt')
\ No newline at end of file
+if __name__ == "__main__":
+    # Process the announcements
+    process_announcements('adgm_announcements.json', 'announcement_analysis.txt')
@@ -0,0 +1,241 @@
+from array import array
+import mmap
+import sys
+
+# Navigation header the ADGM detail pages put in front of every announcement
+CONTENT_PREFIX = 'Announcement\nHome\nMedia\nAnnouncements\n'
+
+# How each record's content is stored in the blob
+NO_CONTENT = 0
+VERBATIM = 1
+PREFIX_STRIPPED = 2
+PREFIX_AND_TITLE_STRIPPED = 3
+
+FIELDS = ('title', 'date', 'source', 'content', 'tags', 'url', 'alternate_urls')
+
+
+class TextBlob:
+    """Strings packed back to back into one UTF-8 buffer and decoded on access.
+
+    The buffer is a bytearray while the blob is being built and can be moved to
+    a file and memory-mapped afterwards, so the bytes live in the page cache
+    shared by every worker instead of on each worker's heap.
+    """
+
+    __slots__ = ('buffer', 'offsets')
+
+    def __init__(self, buffer=None, offsets=None):
+        self.buffer = bytearray() if buffer is None else buffer
+        self.offsets = array('Q', [0]) if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return str(self.buffer[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def raw(self, i):
+        """Encoded bytes of the i-th string."""
+        if i < 0:
+            i += len(self)
+        return bytes(self.buffer[self.offsets[i]:self.offsets[i + 1]])
+
+    def size(self, i):
+        """Encoded length of the i-th string."""
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def append(self, text):
+        if not isinstance(self.buffer, bytearray):
+            self.buffer = bytearray(self.buffer)
+        self.buffer += text.encode('utf-8')
+        self.offsets.append(len(self.buffer))
+        return len(self) - 1
+
+    def freeze(self):
+        """Drop the spare capacity bytearray keeps for appends."""
+        if isinstance(self.buffer, bytearray):
+            self.buffer = bytes(self.buffer)
+
+    def map_to(self, path):
+        """Write the buffer to path and switch to a read-only memory map of it."""
+        with open(path, 'wb') as f:
+            f.write(self.buffer)
+        if not self.buffer:
+            return
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class TagLists:
+    """Per-record tag tuples (or other string tuples) stored as ids into one table of distinct names."""
+
+    __slots__ = ('names', 'offsets', 'ids')
+
+    def __init__(self, names, offsets, ids):
+        self.names = names
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def from_tuples(cls, tag_tuples):
+        names = TextBlob()
+        positions = {}
+        offsets = array('Q', [0])
+        ids = array('I')
+        for tags in tag_tuples:
+            for tag in tags:
+                if tag not in positions:
+                    positions[tag] = names.append(tag)
+                ids.append(positions[tag])
+            offsets.append(len(ids))
+        names.freeze()
+        return cls(names, offsets, ids)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, doc_id):
+        return tuple(self.names[i] for i in self.ids[self.offsets[doc_id]:self.offsets[doc_id + 1]])
+
+
+class Announcement:
+    """Read-only view of one record in an AnnouncementStore.
+
+    Supports attribute access for templates and the dict-style get/[]/in used
+    by the search code; the content is only decoded when it is read.
+    """
+
+    __slots__ = ('store', 'doc_id')
+
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.doc_id = doc_id
+
+    @property
+    def title(self):
+        return self.store.titles[self.doc_id]
+
+    @property
+    def date(self):
+        return self.store.dates[self.doc_id]
+
+    @property
+    def source(self):
+        return self.store.sources[self.doc_id]
+
+    @property
+    def url(self):
+        return self.store.urls[self.doc_id]
+
+    @property
+    def tags(self):
+        return list(self.store.tags[self.doc_id])
+
+    @property
+    def content(self):
+        return self.store.content(self.doc_id)
+
+    @property
+    def alternate_urls(self):
+        return list(self.store.alternate_urls[self.doc_id])
+
+    def __contains__(self, key):
+        if key == 'content':
+            return self.store.content_kinds[self.doc_id] != NO_CONTENT
+        if key == 'alternate_urls':
+            # Only records merged from captures at other URLs have them
+            return bool(self.store.alternate_urls[self.doc_id])
+        return key in FIELDS
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [field for field in FIELDS if field in self]
+
+    def to_dict(self):
+        return {field: self[field] for field in self.keys()}
+
+    def __repr__(self):
+        return f"Announcement({self.doc_id}, {self.title!r})"
+
+
+class AnnouncementStore:
+    """Column-oriented, memory-compact storage for announcement records.
+
+    Titles, dates, sources, URLs and alternate URLs live in parallel lists, tags
+    and sources are interned, and the contents share one TextBlob with the repeated ADGM
+    navigation header (and the title it repeats) stripped off. Indexing the
+    store yields Announcement views.
+    """
+
+    def __init__(self, announcements=(), content_path=None):
+        self.titles = []
+        self.dates = []
+        self.sources = []
+        self.urls = []
+        self.tags = []
+        self.alternate_urls = []
+        self.content_kinds = bytearray()
+        self.contents = TextBlob()
+        for announcement in announcements:
+            self.append(announcement)
+        self.contents.freeze()
+        if content_path:
+            self.contents.map_to(content_path)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __getitem__(self, doc_id):
+        if doc_id < 0:
+            doc_id += len(self)
+        if not 0 <= doc_id < len(self):
+            raise IndexError(doc_id)
+        return Announcement(self, doc_id)
+
+    def __iter__(self):
+        return (Announcement(self, doc_id) for doc_id in range(len(self)))
+
+    def append(self, announcement):
+        """Add an announcement dict and return its id."""
+        title = announcement.get('title', '')
+        self.titles.append(title)
+        self.dates.append(announcement.get('date', ''))
+        self.sources.append(sys.intern(announcement.get('source', '')))
+        self.urls.append(announcement.get('url', ''))
+        self.tags.append(tuple(sys.intern(tag) for tag in announcement.get('tags', [])))
+        self.alternate_urls.append(tuple(announcement.get('alternate_urls', ())))
+
+        if 'content' not in announcement:
+            kind, stored = NO_CONTENT, ''
+        else:
+            content = announcement['content']
+            kind, stored = VERBATIM, content
+            if content.startswith(CONTENT_PREFIX):
+                kind, stored = PREFIX_STRIPPED, content[len(CONTENT_PREFIX):]
+                if stored.startswith(title + '\n'):
+                    kind, stored = PREFIX_AND_TITLE_STRIPPED, stored[len(title) + 1:]
+        self.content_kinds.append(kind)
+        self.contents.append(stored)
+        return len(self.titles) - 1
+
+    def content(self, doc_id):
+        """Decode the full content of a record ('' when it has none)."""
+        kind = self.content_kinds[doc_id]
+        stored = self.contents[doc_id]
+        if kind == PREFIX_STRIPPED:
+            return CONTENT_PREFIX + stored
+        if kind == PREFIX_AND_TITLE_STRIPPED:
+            return CONTENT_PREFIX + self.titles[doc_id] + '\n' + stored
+        return stored
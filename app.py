@@ -1,23 +1,67 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g
 import json
 import os
-from fuzzywuzzy import fuzz
+import time
+import metrics
+from announcement_store import AnnouncementStore
+from search_index import AnnouncementIndex, min_shared_grams, page_bounds
+from snapshot import load_snapshot, snapshot_path
+
+try:
+    from semantic_index import SemanticIndex, semantic_index_path
+except ImportError:
+    # numpy/scipy/scikit-learn are only needed for mode=semantic and /similar
+    SemanticIndex = None
 
 app = Flask(__name__)
+metrics.instrument(app)
+metrics.watch_cache('min_shared_grams', min_shared_grams)
 
 # Load the announcements from the JSON file
 json_file_path = 'adgm_announcements_20240915_182338.json'
-if os.path.exists(json_file_path):
+snapshot_file_path = snapshot_path(json_file_path)
+load_started = time.perf_counter()
+index = None
+if os.path.exists(snapshot_file_path):
+    # The snapshot already holds the records and the search index, so
+    # loading it is just a memory map
+    try:
+        index = load_snapshot(snapshot_file_path)
+    except ValueError as e:
+        # Written by an older version; rebuild from the JSON instead
+        print(f"Warning: ignoring {snapshot_file_path}: {e}")
+if index is not None:
+    corpus_source = 'snapshot'
+elif os.path.exists(json_file_path):
     with open(json_file_path, 'r') as f:
-        data = json.load(f)
-        announcements = data['announcements']
+        # Only the compact store is kept; the parsed dicts are dropped here
+        announcements = AnnouncementStore(json.load(f)['announcements'])
+    # Build the search index once so requests only score likely candidates
+    index = AnnouncementIndex(announcements)
+    corpus_source = 'json'
 else:
     print(f"Warning: {json_file_path} not found. Starting with empty announcements list.")
-    announcements = []
+    index = AnnouncementIndex(AnnouncementStore())
+    corpus_source = 'empty'
+metrics.record_corpus(len(index), time.perf_counter() - load_started, corpus_source)
+
+def load_semantic_index(announcements):
+    """Load the persisted TF-IDF index, building it when it has not been saved."""
+    if SemanticIndex is None:
+        return None
+    semantic_file_path = semantic_index_path(json_file_path)
+    if os.path.exists(semantic_file_path):
+        try:
+            return SemanticIndex.load(semantic_file_path, announcements)
+        except ValueError as e:
+            # Saved for another crawl than the one loaded
+            print(f"Warning: rebuilding the TF-IDF index: {e}")
+    return SemanticIndex.build(announcements)
 
-def fuzzy_search(query, text, threshold=70):
-    """Perform fuzzy search on text."""
-    return fuzz.partial_ratio(query.lower(), text.lower()) >= threshold
+load_started = time.perf_counter()
+semantic_index = load_semantic_index(index.announcements)
+if semantic_index is not None:
+    metrics.INDEX_BUILD_SECONDS.observe(time.perf_counter() - load_started, index='semantic', source=corpus_source)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -30,26 +74,39 @@ def search_announcements():
     if not tags or tags == ['']:
         return render_template('results.html', results=[], tags="None provided")
 
-    results = []
-    for announcement in announcements:
-        match = False
-        for tag in tags:
-            # Check tags
-            if any(fuzzy_search(tag, t) for t in announcement.get('tags', [])):
-                match = True
-                break
-            # Check title
-            if fuzzy_search(tag, announcement.get('title', '')):
-                match = True
-                break
-            # Check content (if available)
-            if 'content' in announcement and fuzzy_search(tag, announcement['content']):
-                match = True
-                break
-        if match:
-            results.append(announcement)
-
-    return render_template('results.html', results=results, tags=', '.join(tags))
+    try:
+        limit, offset = page_bounds(request.args.get('limit'), request.args.get('offset'))
+    except ValueError:
+        limit, offset = page_bounds(None, None)
+
+    mode = request.args.get('mode', 'fuzzy')
+    if mode == 'semantic' and semantic_index is not None:
+        started = time.perf_counter()
+        total, page = semantic_index.search(' '.join(tags), limit=limit, offset=offset)
+        g.timings['scoring'] = time.perf_counter() - started
+    else:
+        mode = 'fuzzy'
+        total, page = index.ranked_search(tags, limit=limit, offset=offset, timings=g.timings)
+    results = [announcement for _, announcement in page]
+    g.mode, g.result_count = mode, total
+
+    started = time.perf_counter()
+    response = render_template('results.html', results=results, tags=', '.join(tags), mode=mode,
+                               query=request.args.get('tags', ''), total=total, limit=limit, offset=offset)
+    g.timings['rendering'] = time.perf_counter() - started
+    return response
+
+@app.route('/similar/<int:doc_id>', methods=['GET'])
+def similar_announcements(doc_id):
+    if semantic_index is None or not 0 <= doc_id < len(semantic_index):
+        return render_template('index.html'), 404
+
+    g.mode = 'semantic'
+    started = time.perf_counter()
+    results = [announcement for _, announcement in semantic_index.similar(doc_id)]
+    g.timings['scoring'] = time.perf_counter() - started
+    title = semantic_index.announcements[doc_id].title
+    return render_template('results.html', results=results, tags=f"similar to \"{title}\"", total=0)
 
 @app.errorhandler(404)
 def not_found(error):
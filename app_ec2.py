@@ -1,38 +1,203 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 import json
+import os
+import tempfile
+import threading
+import time
 import boto3
 from botocore.exceptions import ClientError
-from fuzzywuzzy import fuzz
+from announcement_store import AnnouncementStore
+import metrics
+from search_index import AnnouncementIndex, min_shared_grams, page_bounds, SNIPPET_LENGTH
+from snapshot import load_snapshot, snapshot_path
+
+try:
+    from semantic_index import SemanticIndex, semantic_index_path
+except ImportError:
+    # numpy/scipy/scikit-learn are only needed for mode=semantic and /similar
+    SemanticIndex = None
 import logging
 
 app = Flask(__name__)
+metrics.instrument(app)
+metrics.watch_cache('min_shared_grams', min_shared_grams)
 
 # Configure logging
 logging.basicConfig(filename='app.log', level=logging.DEBUG, 
                     format='%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+logger = logging.getLogger(__name__)
 
-# Initialize S3 client
-s3 = boto3.client('s3')
+# Initialize S3 client (S3_ENDPOINT_URL points it at a local S3 stand-in)
+s3 = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL'))
 
 # S3 bucket and file details
 BUCKET_NAME = 'crypto-crawler-bucket321'
 FILE_NAME = 'adgm_announcements_20240915_182338.json'
+SNAPSHOT_NAME = snapshot_path(FILE_NAME)
+
+# Local directory snapshots are downloaded to before being memory-mapped
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', tempfile.gettempdir())
+
+# Seconds between checks for a new crawl on S3 (0 disables the refresher)
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', '300'))
+
+def fetch_announcements(etag=None):
+    """Download the announcements unless the S3 object still has the given ETag.
+
+    Returns (announcements, etag); announcements is None when the object
+    has not changed.
+    """
+    params = {'Bucket': BUCKET_NAME, 'Key': FILE_NAME}
+    if etag:
+        params['IfNoneMatch'] = etag
+    try:
+        response = s3.get_object(**params)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return None, etag
+        raise
+    content = response['Body'].read().decode('utf-8')
+    data = json.loads(content)
+    return data['announcements'], response.get('ETag')
+
+def fetch_snapshot(etag=None):
+    """Download the prebuilt index snapshot unless it still has the given ETag.
+
+    Returns (index, etag); index is None when the object has not changed.
+    """
+    params = {'Bucket': BUCKET_NAME, 'Key': SNAPSHOT_NAME}
+    if etag:
+        params['IfNoneMatch'] = etag
+    try:
+        response = s3.get_object(**params)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return None, etag
+        raise
+    fd, path = tempfile.mkstemp(suffix='.snap', dir=SNAPSHOT_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response['Body'].iter_chunks():
+                f.write(chunk)
+        new_index = load_snapshot(path)
+    finally:
+        # The memory map stays valid after the file is unlinked
+        os.unlink(path)
+    return new_index, response.get('ETag')
+
+def fetch_semantic_index(announcements):
+    """Download the persisted TF-IDF index for announcements, building it if it is not on S3."""
+    if SemanticIndex is None:
+        return None
+    key = semantic_index_path(FILE_NAME)
+    try:
+        response = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+        return SemanticIndex.build(announcements)
+    fd, path = tempfile.mkstemp(suffix='.npz', dir=SNAPSHOT_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response['Body'].iter_chunks():
+                f.write(chunk)
+        semantic = SemanticIndex.load(path, announcements)
+    except ValueError as e:
+        # Saved for a different crawl than the one just loaded
+        logger.warning(f"Rebuilding TF-IDF index: {e}")
+        semantic = SemanticIndex.build(announcements)
+    finally:
+        os.unlink(path)
+    return semantic
 
 def load_announcements_from_s3():
     try:
-        response = s3.get_object(Bucket=BUCKET_NAME, Key=FILE_NAME)
-        content = response['Body'].read().decode('utf-8')
-        data = json.loads(content)
-        return data['announcements']
+        announcements, _ = fetch_announcements()
+        return announcements
     except ClientError as e:
         logger.error(f"Error loading announcements from S3: {e}")
         return []
 
-announcements = load_announcements_from_s3()
+def refresh_index():
+    """Rebuild the index if the S3 object changed. Returns True when a new index was swapped in."""
+    global index, semantic_index, corpus_etag
+    # Prefer the snapshot, which needs no parsing or index build
+    key = SNAPSHOT_NAME
+    started = time.perf_counter()
+    try:
+        new_index, etag = fetch_snapshot(corpus_etag)
+    except (ClientError, ValueError) as e:
+        if isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+        if isinstance(e, ValueError):
+            # Written by an older version; rebuild from the JSON instead
+            logger.warning(f"Ignoring s3://{BUCKET_NAME}/{SNAPSHOT_NAME}: {e}")
+        key = FILE_NAME
+        announcements, etag = fetch_announcements(corpus_etag)
+        # Build off the request path
+        new_index = AnnouncementIndex(AnnouncementStore(announcements)) if announcements is not None else None
+    if new_index is None:
+        # The conditional GET is the corpus cache: a 304 is a hit
+        metrics.CORPUS_REFRESHES.inc(result='not_modified')
+        logger.debug(f"s3://{BUCKET_NAME}/{key} unchanged (ETag {etag})")
+        return False
+    loaded = time.perf_counter()
+    source = 'snapshot' if key == SNAPSHOT_NAME else 'json'
+
+    # Rebinding a global is atomic, so searches keep using whichever complete
+    # index they started with. The semantic index carries its own store, so it
+    # stays consistent even if a request reads it before index is rebound.
+    new_semantic_index = fetch_semantic_index(new_index.announcements)
+    index, semantic_index, corpus_etag = new_index, new_semantic_index, etag
+    metrics.record_corpus(len(new_index), loaded - started, source)
+    if new_semantic_index is not None:
+        metrics.INDEX_BUILD_SECONDS.observe(time.perf_counter() - loaded, index='semantic', source=source)
+    metrics.CORPUS_REFRESHES.inc(result='reloaded')
+    logger.info(f"Loaded {len(new_index)} announcements from s3://{BUCKET_NAME}/{key} (ETag {etag})")
+    return True
+
+def refresh_forever(stop_event, interval=REFRESH_INTERVAL):
+    """Poll S3 for a new corpus every interval seconds until stop_event is set."""
+    while not stop_event.wait(interval):
+        try:
+            refresh_index()
+        except Exception as e:
+            metrics.CORPUS_REFRESHES.inc(result='error')
+            logger.error(f"Error refreshing announcements from S3: {e}")
+
+def start_refresher(interval=REFRESH_INTERVAL):
+    """Start the background refresher thread and return its stop event."""
+    stop_event = threading.Event()
+    thread = threading.Thread(target=refresh_forever, args=(stop_event, interval),
+                              name='corpus-refresher', daemon=True)
+    thread.start()
+    return stop_event
+
+# Build the search index once so requests only score likely candidates
+corpus_etag = None
+index = AnnouncementIndex(AnnouncementStore())
+semantic_index = None
+try:
+    refresh_index()
+except ClientError as e:
+    metrics.CORPUS_REFRESHES.inc(result='error')
+    logger.error(f"Error loading announcements from S3: {e}")
+
+refresher = start_refresher() if REFRESH_INTERVAL > 0 else None
 
-def fuzzy_search(query, text, threshold=70):
-    """Perform fuzzy search on text."""
-    return fuzz.partial_ratio(query.lower(), text.lower()) >= threshold
+def to_hit(score, announcement):
+    """JSON form of a search hit; only a snippet of the content is sent so payloads stay bounded."""
+    return {
+        "id": announcement.doc_id,
+        "title": announcement.get('title', ''),
+        "date": announcement.get('date', ''),
+        "source": announcement.get('source', ''),
+        "tags": announcement.get('tags', []),
+        "url": announcement.get('url', ''),
+        "alternate_urls": announcement.get('alternate_urls', []),
+        "snippet": announcement.get('content', '')[:SNIPPET_LENGTH],
+        "score": score
+    }
 
 @app.route('/search', methods=['GET'])
 def search_announcements():
@@ -41,26 +206,55 @@ def search_announcements():
     if not tags or tags == ['']:
         return jsonify({"error": "No tags provided"}), 400
 
-    results = []
-    for announcement in announcements:
-        match = False
-        for tag in tags:
-            # Check tags
-            if any(fuzzy_search(tag, t) for t in announcement.get('tags', [])):
-                match = True
-                break
-            # Check title
-            if fuzzy_search(tag, announcement.get('title', '')):
-                match = True
-                break
-            # Check content (if available)
-            if 'content' in announcement and fuzzy_search(tag, announcement['content']):
-                match = True
-                break
-        if match:
-            results.append(announcement)
-
-    return jsonify({"results": results})
+    try:
+        limit, offset = page_bounds(request.args.get('limit'), request.args.get('offset'))
+    except ValueError:
+        return jsonify({"error": "Invalid limit or offset"}), 400
+
+    # Anything but semantic is a fuzzy search; the metrics label only ever sees the two
+    mode = 'semantic' if request.args.get('mode') == 'semantic' else 'fuzzy'
+    g.mode = mode
+    if mode == 'semantic':
+        # Take one reference so a concurrent reload cannot change the index mid-request
+        current_index = semantic_index
+        if current_index is None:
+            return jsonify({"error": "Semantic search is not available"}), 400
+        started = time.perf_counter()
+        total, page = current_index.search(' '.join(tags), limit=limit, offset=offset)
+        g.timings['scoring'] = time.perf_counter() - started
+    else:
+        current_index = index
+        total, page = current_index.ranked_search(tags, limit=limit, offset=offset, timings=g.timings)
+    g.result_count = total
+
+    started = time.perf_counter()
+    results = [to_hit(score, announcement) for score, announcement in page]
+    next_offset = offset + limit if offset + limit < total else None
+    response = jsonify({"results": results, "total": total, "limit": limit, "offset": offset, "next_offset": next_offset})
+    g.timings['serialization'] = time.perf_counter() - started
+    return response
+
+@app.route('/similar/<int:doc_id>', methods=['GET'])
+def similar_announcements(doc_id):
+    current_index = semantic_index
+    if current_index is None:
+        return jsonify({"error": "Semantic search is not available"}), 400
+    if not 0 <= doc_id < len(current_index):
+        return jsonify({"error": "Not found"}), 404
+
+    try:
+        limit, _ = page_bounds(request.args.get('limit'), None)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    g.mode = 'semantic'
+    started = time.perf_counter()
+    similar = current_index.similar(doc_id, limit=limit)
+    scored = time.perf_counter()
+    response = jsonify({"id": doc_id, "results": [to_hit(score, announcement) for score, announcement in similar]})
+    g.timings['scoring'] = scored - started
+    g.timings['serialization'] = time.perf_counter() - scored
+    return response
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,150 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmark_search import git_commit, peak_rss_mb
+from fixture_server import FixtureServer, FixtureSite
+
+CRAWLERS = ['crawler2', 'crawler_s3']
+
+
+def children_peak_rss_mb():
+    """Peak RSS of the largest finished child process (the Playwright driver and browser)."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Stopwatch:
+    """Wrap a function to count its calls and the seconds spent in them."""
+
+    def __init__(self, function, count=lambda args, result: 1):
+        self.function = function
+        self.measure = count
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = self.function(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.calls += 1
+        self.items += self.measure(args, result)
+        return result
+
+
+def run_crawler(name, base_url, args):
+    """Run one crawler end to end against the fixture server, in its own process.
+
+    The crawlers read their settings when they are imported, so the
+    environment is set up first.
+    """
+    os.environ.update({'ADGM_BASE_URL': base_url, 'CRAWL_HEADLESS': '1', 'CRAWL_PROFILE': args.profile})
+    os.environ.pop('HTTP_CACHE_DIR', None)
+    if args.polite_rate:
+        os.environ['POLITE_RATE'] = str(args.polite_rate)
+    os.chdir(tempfile.mkdtemp(prefix=f'benchmark_{name}_'))
+
+    from collections import Counter
+    import crawl_pipeline
+    import detail_fetcher
+    from record_sink import JsonlSink
+    crawler = __import__(name)
+    listing = Stopwatch(crawler.list_announcements, lambda args, result: len(result))
+    crawler.list_announcements = listing
+    # Tagging runs in the pipeline's worker processes, so its numbers come
+    # from the pipeline's own counters
+    pipelines = []
+    start = crawl_pipeline.CrawlPipeline.start
+    crawl_pipeline.CrawlPipeline.start = lambda self: pipelines.append(self) or start(self)
+    details = Stopwatch(detail_fetcher.DetailFetcher.fetch, lambda args, result: sum(1 for url in args[1] if url))
+    detail_fetcher.DetailFetcher.fetch = lambda self, urls: details(self, urls)
+
+    started = time.perf_counter()
+    if name == 'crawler_s3':
+        from playwright.sync_api import sync_playwright
+        # Keep the output local; the upload is not what is being measured
+        crawler.save_announcements_to_s3 = lambda sink, file_name: sink.finalize(file_name)
+        with sync_playwright() as playwright, detail_fetcher.DetailFetcher(
+                launch_options={'headless': True}, context_options={'user_agent': crawler.USER_AGENT},
+                first_party=crawler.ADGM_DOMAINS) as fetcher:
+            crawler.run(playwright, fetcher, profile=args.profile, sink=JsonlSink('crawler_s3'))
+    else:
+        crawler.run(profile=args.profile)
+    wall = time.perf_counter() - started
+    stats = sum((pipeline.stats for pipeline in pipelines), Counter())
+
+    return {
+        "benchmark": "crawl",
+        "crawler": name,
+        "profile": args.profile,
+        "wall_seconds": round(wall, 3),
+        "listing_pages": listing.calls,
+        "announcements": listing.items,
+        "pages_per_second": round(listing.calls / wall, 3) if wall else None,
+        # Reading the items off listing pages already in the browser
+        "listing_parse_ms_per_page": round(listing.seconds * 1000 / listing.calls, 2) if listing.calls else None,
+        "detail_fetches": details.items,
+        "detail_seconds": round(details.seconds, 3),
+        "detail_fetches_per_second": round(details.items / details.seconds, 2) if details.seconds else None,
+        "tagged": stats['tagged'],
+        # Time the tag workers spent running spaCy, whether or not anything waited on it
+        "tag_seconds": round(stats['tag_seconds'], 3),
+        # Time the sink stage waited on tags the fetch stage had already handed over
+        "tag_wait_seconds": round(stats['tag_wait_seconds'], 3),
+        # Time the browser waited for the fetch stage to take a listing page
+        "discovery_wait_seconds": round(stats['discovery_wait_seconds'], 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "browser_peak_rss_mb": round(children_peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawlers end to end against the local fixture server.")
+    parser.add_argument('--crawlers', nargs='+', choices=CRAWLERS, default=CRAWLERS)
+    parser.add_argument('--pages', type=int, default=5, help="ADGM listing pages served")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of responses that are 429/503")
+    parser.add_argument('--script-rendered', type=float, default=0.0,
+                        help="Share of detail pages only a browser can read")
+    parser.add_argument('--profile', choices=['full', 'lean'], default='lean')
+    parser.add_argument('--polite-rate', type=float, help="Initial requests/s per host (POLITE_RATE)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    run = {"commit": git_commit(), "python": platform.python_version(),
+           "timestamp": datetime.now().isoformat(timespec='seconds'),
+           "latency": args.latency, "failure_rate": args.failure_rate, "script_rendered": args.script_rendered}
+    site = FixtureSite(args.pages, args.seed, args.script_rendered)
+    with FixtureServer(site, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+                       seed=args.seed) as server:
+        for name in args.crawlers:
+            before = server.stats.copy()
+            # A fresh interpreter per crawler keeps settings and peak memory apart
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                try:
+                    row = pool.apply(run_crawler, (name, server.url, args))
+                except Exception as e:
+                    print(f"{name} failed: {e}", file=sys.stderr)
+                    continue
+            served = server.stats - before
+            row.update({"served_" + kind: count for kind, count in sorted(served.items())})
+            line = json.dumps({**run, **row})
+            print(line)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+
+if __name__ == "__main__":
+    main()
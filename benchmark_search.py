@@ -0,0 +1,113 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from announcement_store import AnnouncementStore
+from search_index import AnnouncementIndex
+from synthetic_corpus import generate_announcements, load_sample, sample_queries
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(size, args):
+    """Benchmark one corpus size; runs in its own process so peak memory is per size."""
+    sample = load_sample()
+    started = time.perf_counter()
+    store = AnnouncementStore(generate_announcements(size, args.seed, sample))
+    generated = time.perf_counter()
+    index = AnnouncementIndex(store)
+    built = time.perf_counter()
+
+    semantic = None
+    if args.mode in ('semantic', 'both'):
+        from semantic_index import SemanticIndex
+        semantic = SemanticIndex.build(store)
+    semantic_built = time.perf_counter()
+
+    queries = sample_queries(args.queries, args.seed, sample)
+    modes = ['fuzzy', 'semantic'] if args.mode == 'both' else [args.mode]
+    rows = []
+    for mode in modes:
+        latencies = []
+        matches = []
+        wall_started = time.perf_counter()
+        for terms in queries:
+            query_started = time.perf_counter()
+            if mode == 'fuzzy':
+                total, _ = index.ranked_search(terms, limit=args.limit)
+            else:
+                total, _ = semantic.search(' '.join(terms), limit=args.limit)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            matches.append(total)
+        wall = time.perf_counter() - wall_started
+        latencies.sort()
+        rows.append({
+            "benchmark": "search",
+            "mode": mode,
+            "records": size,
+            "queries": len(queries),
+            "limit": args.limit,
+            "generate_seconds": round(generated - started, 3),
+            "index_build_seconds": round((built - generated) if mode == 'fuzzy' else (semantic_built - built), 3),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "throughput_qps": round(len(queries) / wall, 2) if wall else None,
+            "mean_matches": round(sum(matches) / len(matches), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /search on synthetic corpora.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=['fuzzy', 'semantic', 'both'], default='fuzzy')
+    parser.add_argument('--output', help="Append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    run = {"commit": git_commit(), "python": platform.python_version(),
+           "timestamp": datetime.now().isoformat(timespec='seconds')}
+    for size in args.sizes:
+        with multiprocessing.Pool(1) as pool:
+            rows = pool.apply(run_size, (size, args))
+        for row in rows:
+            line = json.dumps({**run, **row})
+            print(line)
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from benchmark_search import git_commit
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Entry points whose import should stay cheap now that models load lazily
+MODULES = ['tagging', 'crawl_pipeline', 'crawl_engine', 'crawler2', 'crawler_s3', 'crawler2_vara', 'crawler2_fab',
+           'crawler_lambda', 'analyze_announcements']
+# Command lines timed end to end, interpreter startup included
+COMMANDS = [['crawl_engine.py', '--help'], ['benchmark_crawl.py', '--help']]
+
+# Runs in a fresh interpreter: import one module, then optionally load
+# everything it registered, and report both times
+CHILD = """
+import json, sys, time
+sys.path[:0] = [{root!r}, {lambda_dir!r}]
+started = time.perf_counter()
+__import__({module!r})
+imported = time.perf_counter() - started
+import lazy_resources
+registered = sorted(lazy_resources.REGISTRY)
+warm = None
+if {warm_up!r}:
+    started = time.perf_counter()
+    lazy_resources.warm_up()
+    warm = time.perf_counter() - started
+from benchmark_search import peak_rss_mb
+print(json.dumps({{"import": imported, "warm_up": warm, "registered": registered, "peak_rss_mb": peak_rss_mb()}}))
+"""
+
+
+def time_import(module, warm_up):
+    code = CHILD.format(root=ROOT, lambda_dir=os.path.join(ROOT, 'lambda'), module=module, warm_up=warm_up)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        # Most often a dependency that is not installed here
+        return {"error": (result.stderr.strip().splitlines() or ['failed'])[-1]}
+    return {**json.loads(result.stdout.strip().splitlines()[-1]), "wall": wall}
+
+
+def time_command(command):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable] + command, cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - started, result.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and CLI startup time of the entry points.")
+    parser.add_argument('--modules', nargs='+', default=MODULES)
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per module (median reported)")
+    parser.add_argument('--warm-up', action='store_true', help="Also time loading every registered resource")
+    parser.add_argument('--output', help="Append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    run = {"commit": git_commit(), "python": platform.python_version(),
+           "timestamp": datetime.now().isoformat(timespec='seconds')}
+    rows = []
+    for module in args.modules:
+        runs = [time_import(module, args.warm_up and repeat == 0) for repeat in range(args.repeat)]
+        if 'error' in runs[0]:
+            rows.append({"benchmark": "startup", "module": module, "error": runs[0]['error']})
+            continue
+        rows.append({"benchmark": "startup", "module": module,
+                     "import_ms": round(statistics.median(run['import'] for run in runs) * 1000, 1),
+                     "process_ms": round(statistics.median(run['wall'] for run in runs) * 1000, 1),
+                     "warm_up_ms": round(runs[0]['warm_up'] * 1000, 1) if runs[0]['warm_up'] is not None else None,
+                     "registered": runs[0]['registered'],
+                     "peak_rss_mb": round(max(run['peak_rss_mb'] for run in runs), 1)})
+    for command in COMMANDS:
+        timings = [time_command(command) for _ in range(args.repeat)]
+        rows.append({"benchmark": "startup", "command": ' '.join(command),
+                     "process_ms": round(statistics.median(seconds for seconds, _ in timings) * 1000, 1),
+                     "exit_code": timings[0][1]})
+
+    for row in rows:
+        line = json.dumps({**run, **row})
+        print(line)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+if __name__ == "__main__":
+    main()
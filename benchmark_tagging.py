@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+from datetime import datetime
+import spacy
+from benchmark_search import git_commit, peak_rss_mb
+from nlp_cache import NlpCache
+from synthetic_corpus import generate_announcements
+import tagging
+
+
+def tag_one_by_one(nlp, texts):
+    """The old way: the full pipeline, one nlp() call per announcement."""
+    return [tagging.tags_from_doc(nlp(text)) for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-text and batched spaCy tagging.")
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[16, 64, 256])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Append results as JSON lines to this file")
+    args = parser.parse_args()
+
+    texts = [announcement['title'] + " " + announcement['content']
+             for announcement in generate_announcements(args.records, args.seed)]
+    run = {"commit": git_commit(), "python": platform.python_version(),
+           "timestamp": datetime.now().isoformat(timespec='seconds'), "records": len(texts),
+           "disabled": tagging.DISABLED_COMPONENTS}
+
+    # Time the model, not the persistent cache or loading it
+    tagging.cache.set(None)
+    tagging.model.get()
+    full = spacy.load("en_core_web_sm")
+    started = time.perf_counter()
+    expected = tag_one_by_one(full, texts)
+    baseline = time.perf_counter() - started
+    rows = [{"benchmark": "tagging", "method": "nlp", "batch_size": 1, "processes": 1,
+             "seconds": round(baseline, 3), "texts_per_second": round(len(texts) / baseline, 1),
+             "speedup": 1.0, "identical": True}]
+
+    for processes in args.processes:
+        for batch_size in args.batch_sizes:
+            started = time.perf_counter()
+            tags = tagging.extract_tags_batch(texts, batch_size=batch_size, n_process=processes)
+            seconds = time.perf_counter() - started
+            rows.append({"benchmark": "tagging", "method": "pipe", "batch_size": batch_size,
+                         "processes": processes, "seconds": round(seconds, 3),
+                         "texts_per_second": round(len(texts) / seconds, 1),
+                         "speedup": round(baseline / seconds, 2), "identical": tags == expected})
+
+    # A re-crawl of an unchanged archive: the first run fills an empty
+    # cache, the second only reads it
+    with tempfile.TemporaryDirectory() as directory:
+        tagging.cache.set(NlpCache(os.path.join(directory, 'nlp_cache.db')))
+        for method in ('cache_cold', 'cache_warm'):
+            started = time.perf_counter()
+            tags = tagging.extract_tags_batch(texts)
+            seconds = time.perf_counter() - started
+            rows.append({"benchmark": "tagging", "method": method, "batch_size": tagging.TAG_BATCH_SIZE,
+                         "processes": tagging.TAG_PROCESSES, "seconds": round(seconds, 3),
+                         "texts_per_second": round(len(texts) / seconds, 1),
+                         "speedup": round(baseline / seconds, 2), "identical": tags == expected})
+        tagging.cache.get().close()
+        tagging.cache.set(None)
+
+    for row in rows:
+        line = json.dumps({**run, **row, "peak_rss_mb": round(peak_rss_mb(), 1)})
+        print(line)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+from abc import ABC, abstractmethod
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import time
+from datetime import datetime
+from playwright.async_api import async_playwright
+from tagging import extract_tags_batch, model as tagging_model
+from dedup import Deduplicator
+from detail_fetcher import DetailFetcher
+from http_cache import HttpCache
+from listing_fields import (ADGM_BASE_URL, ADGM_DOMAINS, ADGM_FIELDS, ADGM_ITEMS, FAB_FIELDS, FAB_ITEMS,
+                            VARA_FIELDS, VARA_ITEMS, async_extract_items)
+from page_profile import (CRAWL_PROFILE, async_apply_profile, async_first_item_html, async_scroll_to_end,
+                          async_wait_for_new_listing, load_state, log_page_timing)
+from politeness import SCHEDULER
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class NextButton:
+    """Pagination by clicking a "next" control until it is gone or max_pages is reached."""
+
+    def __init__(self, selector, max_pages):
+        self.selector = selector
+        self.max_pages = max_pages
+
+    async def pages(self, page, source, profile):
+        item_selector = source.item_selectors[0]
+        await page.wait_for_selector(item_selector, timeout=30000)
+        page_number = 1
+        while True:
+            yield page_number
+            if page_number >= self.max_pages:
+                return
+            next_button = await page.query_selector(self.selector)
+            if not next_button:
+                logger.info(f"{source.name}: reached the last page")
+                return
+            started = time.perf_counter()
+            previous = await async_first_item_html(page, item_selector)
+            async with SCHEDULER.aslot(source.listing_url) as slot:
+                await next_button.click()
+                # The next page is ready once its items have replaced these
+                await async_wait_for_new_listing(page, item_selector, previous)
+                if profile == 'full':
+                    await page.wait_for_load_state('networkidle')
+                slot.report(text=await page.title())
+            page_number += 1
+            log_page_timing(f"{source.name} listing page {page_number}", started, profile)
+
+
+class ScrollToEnd:
+    """A single page whose items are lazy-loaded once it is scrolled to the bottom."""
+
+    async def pages(self, page, source, profile):
+        await page.wait_for_selector('body', timeout=10000)
+        if not await async_scroll_to_end(page, ', '.join(source.item_selectors)):
+            logger.warning(f"{source.name}: no items showed up after scrolling")
+        yield 1
+
+
+class Source(ABC):
+    """A site the engine crawls.
+
+    Subclasses set the listing URL, the item selectors (tried in order until
+    one matches), the listing_fields read from every item, the pagination
+    strategy and the first-party domains, and turn extracted fields (plus
+    the detail page content, for sources that have detail pages) into a
+    record.
+    """
+
+    name = None
+    listing_url = None
+    item_selectors = []
+    fields = {}
+    pagination = None
+    domains = []
+    file_prefix = None
+    output_key = 'announcements'
+
+    async def items(self, page):
+        """The fields of every item on the current listing page, read in one round trip."""
+        return await async_extract_items(page, self.item_selectors, self.fields)
+
+    def detail_url(self, fields):
+        """URL of the detail page to fetch for an item, or None."""
+        return None
+
+    @abstractmethod
+    def record(self, fields, content):
+        """The record of one item."""
+
+    def tag_text(self, record):
+        return record['title'] + " " + record['content']
+
+    def save(self, records, file_name):
+        data = {self.output_key: records}
+        with open(file_name, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False, indent=2))
+        logger.info(f"Saved {len(records)} {self.name} records to {file_name}")
+
+
+class ADGMSource(Source):
+    name = 'adgm'
+    listing_url = f"{ADGM_BASE_URL}/media/announcements"
+    item_selectors = ADGM_ITEMS
+    fields = ADGM_FIELDS
+    pagination = NextButton('.bottom-nav__item_revert:not(.disabled)', max_pages=5)
+    domains = ADGM_DOMAINS
+    file_prefix = 'adgm_announcements'
+
+    def detail_url(self, fields):
+        return f"{ADGM_BASE_URL}{fields['link']}" if fields['link'] else None
+
+    def record(self, fields, content):
+        return {
+            "title": fields['title'],
+            "date": fields['date'],
+            "source": fields['source'],
+            "content": content,
+            "tags": [],
+            "url": self.detail_url(fields) or ''
+        }
+
+    def save(self, records, file_name):
+        # Also writes the search snapshot and TF-IDF index the apps load
+        from crawler2 import save_announcements_to_file
+        save_announcements_to_file(records, file_name)
+
+
+class VARASource(Source):
+    name = 'vara'
+    listing_url = "https://www.vara.ae/en/news/"
+    item_selectors = VARA_ITEMS
+    fields = VARA_FIELDS
+    pagination = ScrollToEnd()
+    domains = ['vara.ae']
+    file_prefix = 'vara_announcements'
+
+    def record(self, fields, content):
+        return {
+            "title": fields['title'],
+            "date": fields['date'],
+            "content": fields['content'],
+            "tags": [],
+            "url": f"https://www.vara.ae{fields['link']}" if fields['link'] else 'No URL found'
+        }
+
+
+class FABSource(Source):
+    name = 'fab'
+    listing_url = "https://www.bankfab.com/en-ae/personal/credit-cards/offers"
+    item_selectors = FAB_ITEMS
+    fields = FAB_FIELDS
+    pagination = ScrollToEnd()
+    domains = ['bankfab.com']
+    file_prefix = 'fab_credit_card_offers'
+    output_key = 'offers'
+
+    def record(self, fields, content):
+        return {
+            "title": fields['title'],
+            "description": fields['description'],
+            "tags": []
+        }
+
+    def tag_text(self, record):
+        return record['title'] + " " + record['description']
+
+
+SOURCES = {source.name: source for source in (ADGMSource(), VARASource(), FABSource())}
+
+
+class FileSink:
+    """Collects the tagged records of every source and saves one file per source on close."""
+
+    def __init__(self):
+        self.records = {}
+        self.sources = {}
+
+    def add(self, source, record):
+        self.sources[source.name] = source
+        self.records.setdefault(source.name, []).append(record)
+
+    def close(self):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for name, records in self.records.items():
+            source = self.sources[name]
+            try:
+                # One record per announcement, however often it was listed
+                with Deduplicator.from_records(records) as canonical:
+                    source.save(list(canonical.records()), f'{source.file_prefix}_{timestamp}.json')
+            except Exception as e:
+                logger.error(f"Error saving {name} records: {str(e)}")
+
+
+class CrawlEngine:
+    """Crawl several sources at once with one browser, one tagger and one sink.
+
+    Every source gets its own browser context (cookies, cache routes and
+    request blocking stay isolated) and crawls concurrently with the others.
+    Listing pages are handed to a single tagging stage, so the spaCy model
+    is loaded once and runs on one worker thread off the event loop; tagged
+    records go to the sink in page order per source.
+    """
+
+    def __init__(self, sources, sink, profile=CRAWL_PROFILE, cache=None, launch_options=None):
+        self.sources = sources
+        self.sink = sink
+        self.profile = profile
+        self.cache = cache
+        self.launch_options = launch_options or {}
+
+    def run(self):
+        asyncio.run(self.crawl_all())
+        self.sink.close()
+
+    async def crawl_all(self):
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(**self.launch_options)
+            queue = asyncio.Queue()
+            tagger = asyncio.create_task(self.tag_stage(queue))
+            try:
+                results = await asyncio.gather(*(self.crawl(browser, source, queue) for source in self.sources),
+                                               return_exceptions=True)
+                for source, result in zip(self.sources, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"{source.name}: crawl failed: {str(result)}")
+            finally:
+                await queue.put(None)
+                await tagger
+                await browser.close()
+
+    async def crawl(self, browser, source, queue):
+        context = await browser.new_context(user_agent=USER_AGENT)
+        if self.cache is not None:
+            await context.route('**/*', self.cache.async_route_handler())
+        await async_apply_profile(context, source.domains, self.profile)
+        fetcher = DetailFetcher(context=context, context_options={'user_agent': USER_AGENT}, cache=self.cache,
+                                profile=self.profile, first_party=source.domains)
+        try:
+            page = await context.new_page()
+            started = time.perf_counter()
+            async with SCHEDULER.aslot(source.listing_url) as slot:
+                response = await page.goto(source.listing_url, wait_until=load_state(self.profile))
+                slot.report(response.status if response else None, await page.title())
+            # Opened once the listing page has set the session cookies it copies
+            await fetcher.open()
+            async for page_number in source.pagination.pages(page, source, self.profile):
+                if page_number == 1:
+                    log_page_timing(f"{source.name} listing page 1", started, self.profile)
+                items = await source.items(page)
+                logger.info(f"{source.name}: found {len(items)} items on page {page_number}")
+                contents = await fetcher.fetch_async([source.detail_url(fields) for fields in items])
+                await queue.put((source, [source.record(fields, content) for fields, content in zip(items, contents)]))
+        finally:
+            await fetcher.aclose()
+            await context.close()
+
+    async def tag_stage(self, queue):
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='tagger') as executor:
+            # Load the model while the browser opens the first listing pages
+            executor.submit(tagging_model.get)
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return
+                source, records = batch
+                await loop.run_in_executor(executor, self.tag_records, source, records)
+                for record in records:
+                    self.sink.add(source, record)
+
+    @staticmethod
+    def tag_records(source, records):
+        try:
+            # Extract tags from title and content, the whole page in one batch
+            all_tags = extract_tags_batch(source.tag_text(record) for record in records)
+        except Exception as e:
+            logger.error(f"{source.name}: error tagging {len(records)} records: {str(e)}")
+            return
+        for record, tags in zip(records, all_tags):
+            record['tags'] = tags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl ADGM, VARA and FAB with one browser.")
+    parser.add_argument('sources', nargs='*', choices=sorted(SOURCES), default=sorted(SOURCES))
+    parser.add_argument('--profile', choices=['full', 'lean'], default=CRAWL_PROFILE)
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args()
+
+    cache = HttpCache.from_environment()
+    engine = CrawlEngine([SOURCES[name] for name in args.sources], FileSink(), profile=args.profile,
+                         cache=cache, launch_options={'headless': args.headless})
+    try:
+        engine.run()
+    finally:
+        if cache is not None:
+            logger.info(f"HTTP cache: {cache.summary()}")
+            cache.close()
+        logger.info(f"Request rates: {SCHEDULER.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import Counter
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from crawl_state import prepare_listing, remember_records
+
+logger = logging.getLogger(__name__)
+
+# Listing pages waiting for their detail pages, and pages waiting for tags,
+# before the stage upstream of them has to wait
+PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', '2'))
+# Threads fetching detail pages, each working on its own listing page
+PIPELINE_FETCH_WORKERS = int(os.environ.get('PIPELINE_FETCH_WORKERS', '1'))
+# Processes running spaCy; 0 tags on a thread of this process instead
+TAG_WORKERS = int(os.environ.get('TAG_WORKERS', '1'))
+
+
+def load_tagger():
+    # Load the model when a worker starts rather than on its first batch
+    import tagging
+    tagging.model.get()
+
+
+def tag_texts(texts):
+    """Tags of texts, and the seconds the worker spent extracting them."""
+    from tagging import extract_tags_batch
+    started = time.perf_counter()
+    tags = extract_tags_batch(texts)
+    return tags, time.perf_counter() - started
+
+
+class CrawlPipeline:
+    """Listing pages in, finished records out, with each stage running on its own.
+
+    The crawler's browser thread only discovers listing pages and submit()s
+    their (title, date, source, url) tuples. Fetch threads turn pages into
+    records through the detail fetcher, tag_workers processes run spaCy on
+    them, and a sink thread writes finished pages to the sink in page order,
+    checkpoints it and remembers the records in state. Stages are joined by
+    bounded queues, so a slow stage holds the ones in front of it back
+    instead of letting pages pile up in memory.
+
+    If any stage fails the pipeline stops taking pages, drops what is in
+    flight and close() raises the error; the sink's checkpoint still points
+    at the last page written in full.
+    """
+
+    def __init__(self, fetcher, sink, state=None, tag_workers=TAG_WORKERS, fetch_workers=PIPELINE_FETCH_WORKERS,
+                 queue_size=PIPELINE_QUEUE_SIZE):
+        self.fetcher = fetcher
+        self.sink = sink
+        self.state = state
+        self.fetch_workers = max(1, fetch_workers)
+        self.listing_queue = queue.Queue(max(1, queue_size))
+        self.tag_queue = queue.Queue(max(1, queue_size))
+        if tag_workers > 0:
+            # Forking a process that runs browser threads is unsafe
+            self.tagger = ProcessPoolExecutor(tag_workers, mp_context=multiprocessing.get_context('spawn'),
+                                              initializer=load_tagger)
+        else:
+            self.tagger = ThreadPoolExecutor(1, thread_name_prefix='tagger')
+        self.stats = Counter()
+        self.submitted = 0
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+        self.exhausted = threading.Event()
+        self.fetchers = [threading.Thread(target=self._fetch_stage, name=f'pipeline-fetch-{number}', daemon=True)
+                         for number in range(self.fetch_workers)]
+        self.writer = threading.Thread(target=self._sink_stage, name='pipeline-sink', daemon=True)
+
+    def start(self):
+        for thread in self.fetchers:
+            thread.start()
+        self.writer.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def stop_requested(self):
+        """True once a stage failed, or (with state) a page turned out to hold nothing new."""
+        return self.error is not None or self.exhausted.is_set()
+
+    def submit(self, page_number, listed):
+        """Queue a listing page; blocks while the fetch stage is PIPELINE_QUEUE_SIZE pages behind."""
+        if self.error is not None:
+            raise self.error
+        started = time.perf_counter()
+        self.listing_queue.put((self.submitted, page_number, listed))
+        self.submitted += 1
+        self._count('discovery_wait_seconds', time.perf_counter() - started)
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def _fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+                logger.error(f"Crawl pipeline stopped: {str(error)}")
+
+    def _fetch_stage(self):
+        while True:
+            item = self.listing_queue.get()
+            if item is None:
+                return
+            sequence, page_number, listed = item
+            if self.error is not None:
+                continue
+            try:
+                started = time.perf_counter()
+                records, untagged, fresh = prepare_listing(listed, self.fetcher.fetch, self.state)
+                self._count('fetch_seconds', time.perf_counter() - started)
+                self._count('pages_fetched')
+                logger.info(f"Fetched {len(records)} announcements from page {page_number} "
+                            f"({fresh} new or changed)")
+                if self.state is not None and not fresh:
+                    logger.info(f"Everything on page {page_number} is already known")
+                    self.exhausted.set()
+                texts = [records[position]['title'] + " " + records[position]['content'] for position in untagged]
+                future = self.tagger.submit(tag_texts, texts) if texts else None
+                self.tag_queue.put((sequence, page_number, records, untagged, future))
+            except Exception as e:
+                self._fail(e)
+
+    def _write(self, records, untagged, future):
+        failed = ()
+        if future is not None:
+            started = time.perf_counter()
+            try:
+                tags, seconds = future.result()
+                self._count('tag_seconds', seconds)
+            except Exception as e:
+                logger.error(f"Error tagging {len(untagged)} announcements: {str(e)}")
+                tags = [[] for _ in untagged]
+                # Written untagged, but not remembered, so the next crawl tags them
+                failed = untagged
+                self._count('tag_failures', len(untagged))
+            for position, record_tags in zip(untagged, tags):
+                records[position]['tags'] = record_tags
+            self._count('tag_wait_seconds', time.perf_counter() - started)
+            self._count('tagged', len(untagged) - len(failed))
+        # New announcements push older ones onto later pages, so a resumed
+        # crawl can meet ones it has already written
+        self.sink.write(record for record in records if not record['url'] or record['url'] not in self.sink.urls)
+        if self.state is not None:
+            remember_records(records, self.state, failed)
+        self._count('records', len(records))
+
+    def _sink_stage(self):
+        # Fetch threads can finish pages out of order; write them in the
+        # order they were submitted
+        waiting = {}
+        written = 0
+        while True:
+            item = self.tag_queue.get()
+            if item is None:
+                return
+            sequence, page_number, records, untagged, future = item
+            if self.error is not None:
+                if future is not None:
+                    future.cancel()
+                continue
+            waiting[sequence] = (page_number, records, untagged, future)
+            try:
+                while written in waiting:
+                    page_number, records, untagged, future = waiting.pop(written)
+                    self._write(records, untagged, future)
+                    self.sink.checkpoint(page_number)
+                    written += 1
+            except Exception as e:
+                self._fail(e)
+
+    def close(self):
+        """Finish every submitted page, stop the stages and raise the first stage error, if any."""
+        if not self.closed:
+            self._shutdown()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        """Drop the pages in flight and stop the stages, for a crawl that failed upstream."""
+        if not self.closed:
+            with self.lock:
+                self.error = self.error or RuntimeError("Crawl aborted")
+            self._shutdown()
+
+    def _shutdown(self):
+        self.closed = True
+        for _ in self.fetchers:
+            self.listing_queue.put(None)
+        for thread in self.fetchers:
+            thread.join()
+        self.tag_queue.put(None)
+        self.writer.join()
+        self.tagger.shutdown(cancel_futures=self.error is not None)
+        logger.info(f"Crawl pipeline: {self.summary()}")
+
+    def summary(self):
+        return ', '.join(f"{name} {value:.1f}" if isinstance(value, float) else f"{name} {value}"
+                         for name, value in sorted(self.stats.items())) or 'no pages'
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+# SQLite file that remembers what earlier crawls have already captured
+CRAWL_STATE_PATH = os.environ.get('CRAWL_STATE_PATH', 'crawl_state.db')
+# Stop paging and skip known announcements (set to 0 for a full crawl)
+CRAWL_INCREMENTAL = os.environ.get('CRAWL_INCREMENTAL', '0') != '0'
+# Days a known announcement is trusted before its detail page is fetched again;
+# with HTTP_CACHE_DIR set that refetch is a conditional request
+CRAWL_MAX_AGE_DAYS = float(os.environ.get('CRAWL_MAX_AGE_DAYS', '7'))
+
+
+def text_hash(*parts):
+    """Hash of the given strings with whitespace normalized."""
+    normalized = '\x1f'.join(' '.join((part or '').split()) for part in parts)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class CrawlState:
+    """Persistent record of every announcement URL earlier crawls have captured.
+
+    Each URL keeps a hash of its listing entry (title and source; ADGM shows
+    relative dates, so the date is left out), a hash of the title and content
+    the tags were extracted from, and the full record. A listing entry whose
+    hash is unchanged needs neither a detail fetch nor tagging; a changed
+    entry whose fetched title and content hash the same reuses the stored
+    tags. Safe to share between the stages of a crawl pipeline.
+
+    The listing entry does not change when only the body of an announcement
+    is edited, so an entry whose detail page was last fetched more than
+    max_age_days ago counts as changed and is fetched again.
+    """
+
+    def __init__(self, path=CRAWL_STATE_PATH, max_age_days=CRAWL_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age = timedelta(days=max_age_days)
+        self.lock = threading.Lock()
+        # URLs known() handed back this crawl, whose records were not fetched again
+        self.reused = set()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS seen (
+            url TEXT PRIMARY KEY,
+            listing_hash TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            record TEXT NOT NULL,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            fetched_at TEXT NOT NULL DEFAULT ''
+        )""")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(seen)")}
+        if 'fetched_at' not in columns:
+            # Written before fetch times were kept; every record is due for a refetch
+            self.db.execute("ALTER TABLE seen ADD COLUMN fetched_at TEXT NOT NULL DEFAULT ''")
+        self.db.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def _row(self, url):
+        with self.lock:
+            return self.db.execute("SELECT listing_hash, content_hash, record, fetched_at FROM seen WHERE url = ?",
+                                   (url,)).fetchone()
+
+    def known(self, url, title, source):
+        """The stored record for an unchanged listing entry, or None if it is new, changed or due for a refetch."""
+        if not url:
+            return None
+        row = self._row(url)
+        if row is None or row[0] != text_hash(title, source):
+            return None
+        if row[3] < (datetime.now() - self.max_age).isoformat(timespec='seconds'):
+            return None
+        with self.lock:
+            self.reused.add(url)
+        return json.loads(row[2])
+
+    def known_tags(self, url, title, content):
+        """Tags stored for url if its title and content have not changed since, else None."""
+        row = self._row(url) if url else None
+        if row is None or row[1] != text_hash(title, content):
+            return None
+        return json.loads(row[2]).get('tags')
+
+    def remember(self, record, seen_at=None):
+        """Store or refresh a record captured by the current crawl.
+
+        Records known() handed back keep their fetch time; the rest were just
+        fetched.
+        """
+        url = record.get('url')
+        if not url:
+            return
+        seen_at = seen_at or datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            fetched = url not in self.reused
+            self.reused.discard(url)
+            self.db.execute("""INSERT INTO seen (url, listing_hash, content_hash, record, first_seen, last_seen,
+                                                 fetched_at)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)
+                               ON CONFLICT(url) DO UPDATE SET listing_hash = excluded.listing_hash,
+                                   content_hash = excluded.content_hash, record = excluded.record,
+                                   last_seen = excluded.last_seen,
+                                   fetched_at = CASE WHEN ? THEN excluded.fetched_at ELSE seen.fetched_at END""",
+                            (url, text_hash(record.get('title', ''), record.get('source', '')),
+                             text_hash(record.get('title', ''), record.get('content', '')),
+                             json.dumps(record, ensure_ascii=False), seen_at, seen_at, seen_at, fetched))
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def records(self, exclude=()):
+        """Stored records not in exclude, most recently seen first."""
+        exclude = set(exclude)
+        for url, record in self.db.execute("SELECT url, record FROM seen ORDER BY last_seen DESC, rowid"):
+            if url not in exclude:
+                yield json.loads(record)
+
+    def import_snapshot(self, path):
+        """Seed the store from an existing JSON snapshot; returns how many records were new."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        announcements = data['announcements'] if isinstance(data, dict) else data
+        seen_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')
+        added = 0
+        for announcement in announcements:
+            url = announcement.get('url')
+            if url and self._row(url) is None:
+                self.remember(announcement, seen_at)
+                added += 1
+        self.commit()
+        return added
+
+
+def prepare_listing(listed, fetch, state=None):
+    """Reuse what state knows of one listing page and fetch the rest, without tagging.
+
+    listed holds (title, date, source, url) tuples in page order; fetch takes
+    a list of URLs (None to skip) and returns their contents in order.
+    Returns the records in page order, the positions of the records that
+    still need tags (their tags are None) and how many records were new or
+    changed.
+    """
+    records = [None] * len(listed)
+    if state is not None:
+        for position, (title, date, source, url) in enumerate(listed):
+            record = state.known(url, title, source)
+            if record is not None:
+                # Listing dates are relative, so keep the one shown today
+                records[position] = {**record, "date": date}
+
+    urls = [url if record is None else None for (*_, url), record in zip(listed, records)]
+    contents = fetch(urls) if any(urls) else [""] * len(urls)
+    fresh = 0
+    untagged = []
+    for position, ((title, date, source, url), content) in enumerate(zip(listed, contents)):
+        if records[position] is not None:
+            continue
+        fresh += 1
+        tags = state.known_tags(url, title, content) if state is not None else None
+        if tags is None:
+            untagged.append(position)
+        records[position] = {
+            "title": title,
+            "date": date,
+            "source": source,
+            "content": content,
+            "tags": tags,
+            "url": url or ''
+        }
+    return records, untagged, fresh
+
+
+def remember_records(records, state, untagged=()):
+    """Remember the finished records of a page; those at the untagged positions are left for the next crawl."""
+    untagged = set(untagged)
+    for position, record in enumerate(records):
+        # A failed detail fetch or tagging run is retried by the next crawl
+        if record.get('content') and position not in untagged:
+            state.remember(record)
+    state.commit()
+
+
+def merge_listing(listed, fetch, tag, state=None):
+    """Build the records of one listing page, fetching and tagging only what state does not know.
+
+    See prepare_listing; tag takes a list of (title, content) pairs and
+    returns their tags in order, so the whole page is tagged in one batch.
+    Returns the records in page order and how many of them were new or
+    changed.
+    """
+    records, untagged, fresh = prepare_listing(listed, fetch, state)
+    if untagged:
+        pairs = [(records[position]['title'], records[position]['content']) for position in untagged]
+        for position, tags in zip(untagged, tag(pairs)):
+            records[position]['tags'] = tags
+
+    if state is not None:
+        remember_records(records, state)
+    return records, fresh
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python crawl_state.py <announcements.json> [...]")
+        sys.exit(1)
+
+    with CrawlState() as state:
+        for snapshot in sys.argv[1:]:
+            print(f"Imported {state.import_snapshot(snapshot)} new announcements from {snapshot}")
+        print(f"{CRAWL_STATE_PATH} now knows {len(state)} announcements")
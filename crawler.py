@@ -11,13 +11,21 @@ from bs4 import BeautifulSoup
 import csv
 import os
 import time
-import random
 import logging
+from page_profile import CRAWL_PROFILE, log_page_timing
+from politeness import SCHEDULER
+
+# URL patterns Chrome skips under the lean profile (images are switched off
+# through blink settings)
+LEAN_BLOCKED_URLS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.mp4', '*.webm', '*.mp3',
+                     '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+                     '*facebook.net*', '*hotjar.com*']
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class ADGMCryptoBlockchainCrawler:
-    def __init__(self):
+    def __init__(self, profile=CRAWL_PROFILE):
+        self.profile = profile
         self.base_url = "https://www.adgm.com/media/announcements"
         self.announcements = []
         self.download_folder = "announcements"
@@ -38,12 +46,20 @@ class ADGMCryptoBlockchainCrawler:
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
         chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+        if self.profile == 'lean':
+            # Skip images and stop waiting once the DOM is parsed; the waits
+            # below are for the elements the extractor reads
+            chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+            chrome_options.page_load_strategy = 'eager'
         
         driver_path = ChromeDriverManager().install()
         service = ChromeService(driver_path)
         
         self.driver = webdriver.Chrome(service=service, options=chrome_options)
         self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        if self.profile == 'lean':
+            self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': LEAN_BLOCKED_URLS})
 
     def crawl_announcements(self):
         page = 1
@@ -52,14 +68,17 @@ class ADGMCryptoBlockchainCrawler:
             logging.info(f"Crawling page {page}: {url}")
             
             try:
-                self.driver.get(url)
-                WebDriverWait(self.driver, 30).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(5)  # Wait for any JavaScript to load
+                started = time.perf_counter()
+                with SCHEDULER.slot(url) as slot:
+                    self.driver.get(url)
+                    WebDriverWait(self.driver, 30).until(
+                        EC.presence_of_element_located((By.TAG_NAME, "body"))
+                    )
+                    denied = "Access Denied" in self.driver.title or "403 Forbidden" in self.driver.page_source
+                    slot.report(403 if denied else None)
                 
                 # Check if the page has loaded correctly
-                if "Access Denied" in self.driver.title or "403 Forbidden" in self.driver.page_source:
+                if denied:
                     logging.error("Access denied or forbidden. The website might be blocking automated access.")
                     break
                 
@@ -67,6 +86,7 @@ class ADGMCryptoBlockchainCrawler:
                 WebDriverWait(self.driver, 30).until(
                     EC.presence_of_element_located((By.CLASS_NAME, "announcement-item"))
                 )
+                log_page_timing(f"Listing page {page}", started, self.profile)
             except TimeoutException:
                 logging.warning(f"Timeout occurred while loading page {page}. Stopping.")
                 break
@@ -111,16 +131,19 @@ class ADGMCryptoBlockchainCrawler:
                 except Exception as e:
                     logging.error(f"Error processing announcement: {e}")
 
+            # The scheduler spaces out the next request to the site
             page += 1
-            time.sleep(random.uniform(3, 7))  # Increased delay between requests
 
     def download_announcement(self, url):
         try:
-            self.driver.get(url)
+            started = time.perf_counter()
+            with SCHEDULER.slot(url) as slot:
+                self.driver.get(url)
+                slot.report(text=self.driver.title)
             WebDriverWait(self.driver, 30).until(
                 EC.presence_of_element_located((By.CLASS_NAME, "announcement-detail"))
             )
-            time.sleep(3)  # Wait for any JavaScript to load
+            log_page_timing(f"Announcement {url}", started, self.profile)
             soup = BeautifulSoup(self.driver.page_source, 'html.parser')
             content = soup.find('div', class_='announcement-detail')
             return content.get_text(strip=True) if content else ""
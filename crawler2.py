@@ -2,95 +2,41 @@ from playwright.sync_api import sync_playwright, TimeoutError
 import time
 import json
 from datetime import datetime
-import spacy
-from collections import Counter
 import logging
+from announcement_store import AnnouncementStore
+from dedup import Deduplicator
+from search_index import AnnouncementIndex
+from snapshot import snapshot_path, write_snapshot
+try:
+    from semantic_index import SemanticIndex, semantic_index_path
+except ImportError:
+    # numpy/scipy/scikit-learn only build the optional TF-IDF index
+    SemanticIndex = None
+from detail_fetcher import DetailFetcher
+from crawl_pipeline import CrawlPipeline
+from crawl_state import CRAWL_INCREMENTAL, CrawlState
+from http_cache import HttpCache
+from listing_fields import ADGM_BASE_URL, ADGM_DOMAINS, ADGM_FIELDS, ADGM_ITEMS, extract_items
+from page_profile import (CRAWL_HEADLESS, CRAWL_PROFILE, apply_profile, first_item_html, load_state,
+                          log_page_timing, wait_for_new_listing)
+from politeness import SCHEDULER
+from record_sink import JsonlSink
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load the English NLP model
-nlp = spacy.load("en_core_web_sm")
+LISTING_URL = f"{ADGM_BASE_URL}/media/announcements"
 
-def extract_tags(text, max_tags=5):
-    # Process the text with spaCy
-    doc = nlp(text)
-    
-    # Extract named entities
-    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'GPE', 'PRODUCT']]
-    
-    # Extract noun phrases
-    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
-    
-    # Combine entities and noun phrases
-    potential_tags = entities + noun_phrases
-    
-    # Count occurrences and get the most common tags
-    tag_counts = Counter(potential_tags)
-    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
-    
-    return top_tags
-
-def extract_announcements(page):
-    announcements = []
-    elements = page.query_selector_all('.element.level3')
-    logger.info(f"Found {len(elements)} announcement elements")
-    
-    for element in elements:
-        try:
-            authority = element.query_selector('.title .helvetica-light')
-            title = element.query_selector('.subhead-2.cl-black.level3')
-            date = element.query_selector('.date-1.cl-gray9')
-            link = element.get_attribute('href')
-
-            # Extract content from the linked page
-            content = ""
-            if link:
-                try:
-                    with page.context.new_page() as content_page:
-                        content_page.goto(f"https://www.adgm.com{link}", wait_until="networkidle")
-                        
-                        # Try different selectors for content
-                        selectors = [
-                            '.announcement-content',
-                            '.content-area',
-                            'main',
-                            'article',
-                            'body'  # Fallback to entire body if specific content area not found
-                        ]
-                        
-                        for selector in selectors:
-                            content_element = content_page.query_selector(selector)
-                            if content_element:
-                                content = content_element.inner_text()
-                                if content.strip():
-                                    break
-
-                        if not content.strip():
-                            logger.warning(f"Empty content for link: https://www.adgm.com{link}")
-                except Exception as e:
-                    logger.error(f"Error extracting content from https://www.adgm.com{link}: {str(e)}")
-
-            title_text = title.inner_text() if title else ''
-            content_text = content
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
-            # Extract tags from title and content
-            tags = extract_tags(title_text + " " + content_text)
-
-            announcement = {
-                "title": title_text,
-                "date": date.inner_text() if date else '',
-                "source": authority.inner_text() if authority else 'ADGM',
-                "content": content_text,
-                "tags": tags,
-                "url": f"https://www.adgm.com{link}" if link else ''
-            }
-            announcements.append(announcement)
-        except Exception as e:
-            logger.error(f"Error extracting announcement: {str(e)}")
-    
-    return announcements
+def list_announcements(page):
+    """Return (title, date, source, url) of each announcement on the current listing page."""
+    # Every field of every item in one round trip to the browser
+    items = extract_items(page, ADGM_ITEMS, ADGM_FIELDS)
+    logger.info(f"Found {len(items)} announcement elements")
+    return [(item['title'], item['date'], item['source'], f"{ADGM_BASE_URL}{item['link']}" if item['link'] else None)
+            for item in items]
 
 def save_announcements_to_file(announcements, file_name):
     # Convert announcements to JSON
@@ -105,53 +51,123 @@ def save_announcements_to_file(announcements, file_name):
     except Exception as e:
         logger.error(f"Error saving to file: {str(e)}")
 
-def run():
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)  # Set to False for debugging
+    save_search_indexes(announcements, file_name)
+
+def save_search_indexes(announcements, file_name):
+    # Write the prebuilt search index next to the JSON for fast server startup
+    try:
+        write_snapshot(AnnouncementIndex(announcements), snapshot_path(file_name))
+        logger.info(f"Saved search snapshot to {snapshot_path(file_name)}")
+    except Exception as e:
+        logger.error(f"Error saving snapshot: {str(e)}")
+
+    # Persist the TF-IDF matrix for semantic search and /similar
+    if SemanticIndex is None:
+        logger.info("Skipping the TF-IDF index: numpy, scipy or scikit-learn is not installed")
+        return
+    try:
+        SemanticIndex.build(announcements).save(semantic_index_path(file_name))
+        logger.info(f"Saved TF-IDF index to {semantic_index_path(file_name)}")
+    except Exception as e:
+        logger.error(f"Error saving TF-IDF index: {str(e)}")
+
+def go_to_next_page(page, page_number, profile):
+    """Click through to the listing page after page_number; False on the last page."""
+    next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
+    if not next_button:
+        logger.info("Reached the last page")
+        return False
+
+    started = time.perf_counter()
+    previous = first_item_html(page, '.element.level3')
+    with SCHEDULER.slot(LISTING_URL) as slot:
+        next_button.click()
+        # The next page is ready once its items have replaced these
+        wait_for_new_listing(page, '.element.level3', previous)
+        if profile == 'full':
+            page.wait_for_load_state('networkidle')
+        slot.report(text=page.title())
+    log_page_timing(f"Listing page {page_number + 1}", started, profile)
+    return True
+
+def run(incremental=CRAWL_INCREMENTAL, profile=CRAWL_PROFILE):
+    # In incremental mode only new or changed announcements are fetched and
+    # tagged, and paging stops at the first page with nothing new
+    state = CrawlState() if incremental else None
+    # Listing and detail responses go through HTTP_CACHE_DIR when it is set
+    cache = HttpCache.from_environment()
+    # Records go to disk as each page is done; an interrupted crawl resumes
+    # from its last finished page on the next run
+    sink = JsonlSink('crawler2')
+    with sync_playwright() as p, DetailFetcher(launch_options={'headless': CRAWL_HEADLESS},
+                                               context_options={'user_agent': USER_AGENT},
+                                               cache=cache, profile=profile,
+                                               first_party=ADGM_DOMAINS) as fetcher:
+        browser = p.chromium.launch(headless=CRAWL_HEADLESS)  # Leave CRAWL_HEADLESS off for debugging
         context = browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+            user_agent=USER_AGENT
         )
+        if cache is not None:
+            context.route('**/*', cache.route_handler())
+        apply_profile(context, ADGM_DOMAINS, profile)
         page = context.new_page()
+        # Detail pages, tagging and the sink run behind the listing pages,
+        # skipping what an earlier crawl already captured
+        pipeline = CrawlPipeline(fetcher, sink, state).start()
         
         try:
-            page.goto("https://www.adgm.com/media/announcements")
+            started = time.perf_counter()
+            with SCHEDULER.slot(LISTING_URL) as slot:
+                response = page.goto(LISTING_URL, wait_until=load_state(profile))
+                slot.report(response.status if response else None, page.title())
             logger.info("Page loaded, waiting for content...")
             
             # Wait for the main content to load
             page.wait_for_selector('.element.level3', timeout=30000)
+            # Detail pages are requested with the cookies the listing page set
+            fetcher.share_session(context)
+            log_page_timing("Listing page 1", started, profile)
             
             logger.info(f"Page title: {page.title()}")
             logger.info(f"Current URL: {page.url}")
             
-            all_announcements = []
             page_number = 1
             max_pages = 5  # Set a maximum number of pages to scrape
 
-            while page_number <= max_pages:
+            # Skip the pages an interrupted crawl already wrote to the sink
+            while page_number <= min(sink.page, max_pages - 1):
+                if not go_to_next_page(page, page_number, profile):
+                    break
+                page_number += 1
+
+            while sink.page < page_number <= max_pages:
                 logger.info(f"Scraping page {page_number}")
                 
                 # Take a screenshot for debugging
                 page.screenshot(path=f"adgm_page_{page_number}.png")
                 logger.info(f"Screenshot saved as adgm_page_{page_number}.png")
                 
-                announcements = extract_announcements(page)
-                all_announcements.extend(announcements)
-                
-                next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
-                if not next_button:
-                    logger.info("Reached the last page")
+                pipeline.submit(page_number, list_announcements(page))
+                if pipeline.stop_requested:
                     break
                 
-                next_button.click()
-                page.wait_for_load_state('networkidle')
+                if not go_to_next_page(page, page_number, profile):
+                    break
                 page_number += 1
-                time.sleep(3)  # Additional wait to ensure page is fully loaded
 
-            logger.info(f"Total announcements extracted: {len(all_announcements)}")
+            pipeline.close()
+            logger.info(f"Total announcements extracted: {sink.count}")
+            if state is not None:
+                # The snapshot still holds the whole archive, not just this crawl
+                sink.write(state.records(exclude=sink.urls))
             
             # Save to local file
             file_name = f'adgm_announcements_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            save_announcements_to_file(all_announcements, file_name)
+            # One record per announcement, however often it was listed or archived
+            with Deduplicator.from_records(sink.records()) as canonical:
+                canonical.finalize(file_name)
+                save_search_indexes(AnnouncementStore(canonical.records()), file_name)
+            sink.discard()
             
         except TimeoutError:
             logger.error("Timeout waiting for content to load")
@@ -160,7 +176,15 @@ def run():
         except Exception as e:
             logger.error(f"An error occurred: {str(e)}")
         finally:
+            pipeline.abort()
             browser.close()
+            sink.close()
+            if state is not None:
+                state.close()
+            if cache is not None:
+                logger.info(f"HTTP cache: {cache.summary()}")
+                cache.close()
+            logger.info(f"Request rates: {SCHEDULER.summary()}")
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -2,35 +2,18 @@ from playwright.sync_api import sync_playwright, TimeoutError
 import time
 import json
 from datetime import datetime
-import spacy
-from collections import Counter
 import logging
+from tagging import extract_tags_batch
+from listing_fields import FAB_FIELDS, FAB_ITEMS, extract_items
+from page_profile import CRAWL_PROFILE, apply_profile, load_state, log_page_timing, scroll_to_end
+from politeness import SCHEDULER
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load the English NLP model
-nlp = spacy.load("en_core_web_sm")
-
-def extract_tags(text, max_tags=5):
-    # Process the text with spaCy
-    doc = nlp(text)
-    
-    # Extract named entities
-    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'GPE', 'PRODUCT']]
-    
-    # Extract noun phrases
-    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
-    
-    # Combine entities and noun phrases
-    potential_tags = entities + noun_phrases
-    
-    # Count occurrences and get the most common tags
-    tag_counts = Counter(potential_tags)
-    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
-    
-    return top_tags
+# Hosts the lean profile treats as first-party
+FAB_DOMAINS = ['bankfab.com']
 
 def extract_offers(page):
     offers = []
@@ -41,35 +24,24 @@ def extract_offers(page):
         # Log the page content for debugging
         logger.info(f"Page content: {page.content()[:1000]}...")  # Log first 1000 characters
         
-        # Try to find offer elements directly
-        offer_elements = page.query_selector_all('.offer-item')
+        # Every field of every offer in one round trip to the browser,
+        # from the first of the item selectors that matches
+        items = extract_items(page, FAB_ITEMS, FAB_FIELDS)
         
-        if not offer_elements:
-            logger.warning("No offer items found. Trying alternative selectors...")
-            # Try alternative selectors
-            offer_elements = page.query_selector_all('.card-offer-item')  # Example alternative selector
+        logger.info(f"Found {len(items)} offer elements")
         
-        logger.info(f"Found {len(offer_elements)} offer elements")
-        
-        for offer in offer_elements:
-            try:
-                title = offer.query_selector('.offer-title')
-                description = offer.query_selector('.offer-description')
-                
-                title_text = title.inner_text().strip() if title else "No title found"
-                description_text = description.inner_text().strip() if description else "No description found"
-                
-                # Extract tags from title and description
-                tags = extract_tags(title_text + " " + description_text)
-                
-                offer_data = {
-                    "title": title_text,
-                    "description": description_text,
-                    "tags": tags
-                }
-                offers.append(offer_data)
-            except Exception as e:
-                logger.error(f"Error extracting offer: {str(e)}")
+        for item in items:
+            offer_data = {
+                "title": item['title'],
+                "description": item['description'],
+                "tags": []
+            }
+            offers.append(offer_data)
+
+        # Extract tags from title and description, all offers in one batch
+        all_tags = extract_tags_batch(offer["title"] + " " + offer["description"] for offer in offers)
+        for offer_data, tags in zip(offers, all_tags):
+            offer_data["tags"] = tags
     except Exception as e:
         logger.error(f"Error in extract_offers: {str(e)}")
     
@@ -88,16 +60,20 @@ def save_offers_to_file(offers, file_name):
     except Exception as e:
         logger.error(f"Error saving to file: {str(e)}")
 
-def run():
+def run(profile=CRAWL_PROFILE):
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=False)  # Set to False for debugging
         context = browser.new_context(
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         )
+        apply_profile(context, FAB_DOMAINS, profile)
         page = context.new_page()
         
         try:
-            page.goto("https://www.bankfab.com/en-ae/personal/credit-cards/offers")
+            started = time.perf_counter()
+            with SCHEDULER.slot("https://www.bankfab.com/en-ae/personal/credit-cards/offers") as slot:
+                response = page.goto("https://www.bankfab.com/en-ae/personal/credit-cards/offers", wait_until=load_state(profile))
+                slot.report(response.status if response else None, page.title())
             logger.info("Page loaded, waiting for content...")
             
             logger.info(f"Page title: {page.title()}")
@@ -107,9 +83,13 @@ def run():
             page.screenshot(path="fab_offers_page_initial.png")
             logger.info("Initial screenshot saved as fab_offers_page_initial.png")
             
-            # Scroll to load all content
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            time.sleep(5)  # Wait for any lazy-loaded content
+            # Scroll until no more lazy-loaded items show up
+            loaded = scroll_to_end(page, '.offer-item, .card-offer-item')
+            if loaded:
+                logger.info(f"{loaded} items loaded after scrolling")
+            else:
+                logger.warning("No items showed up after scrolling")
+            log_page_timing("Offers page", started, profile)
             
             # Take another screenshot after scrolling
             page.screenshot(path="fab_offers_page_scrolled.png")
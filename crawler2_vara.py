@@ -2,66 +2,40 @@ from playwright.sync_api import sync_playwright, TimeoutError
 import time
 import json
 from datetime import datetime
-import spacy
-from collections import Counter
 import logging
+from tagging import extract_tags_batch
+from listing_fields import VARA_FIELDS, VARA_ITEMS, extract_items
+from page_profile import CRAWL_PROFILE, apply_profile, load_state, log_page_timing, scroll_to_end
+from politeness import SCHEDULER
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load the English NLP model
-nlp = spacy.load("en_core_web_sm")
-
-def extract_tags(text, max_tags=5):
-    # Process the text with spaCy
-    doc = nlp(text)
-    
-    # Extract named entities
-    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'GPE', 'PRODUCT']]
-    
-    # Extract noun phrases
-    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
-    
-    # Combine entities and noun phrases
-    potential_tags = entities + noun_phrases
-    
-    # Count occurrences and get the most common tags
-    tag_counts = Counter(potential_tags)
-    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
-    
-    return top_tags
+# Hosts the lean profile treats as first-party
+VARA_DOMAINS = ['vara.ae']
 
 def extract_announcements(page):
     announcements = []
-    elements = page.query_selector_all('.news-item')
-    logger.info(f"Found {len(elements)} news items")
+    # Every field of every item in one round trip to the browser
+    items = extract_items(page, VARA_ITEMS, VARA_FIELDS)
+    logger.info(f"Found {len(items)} news items")
     
-    for element in elements:
-        try:
-            title = element.query_selector('h3')
-            date = element.query_selector('.date')
-            content = element.query_selector('.excerpt')
-            link = element.query_selector('a')
-
-            title_text = title.inner_text().strip() if title else "No title found"
-            date_text = date.inner_text().strip() if date else "No date found"
-            content_text = content.inner_text().strip() if content else "No content found"
-            link_href = link.get_attribute('href') if link else None
+    for item in items:
+        announcement = {
+            "title": item['title'],
+            "date": item['date'],
+            "content": item['content'],
+            "tags": [],
+            "url": f"https://www.vara.ae{item['link']}" if item['link'] else 'No URL found'
+        }
+        announcements.append(announcement)
 
-            # Extract tags from title and content
-            tags = extract_tags(title_text + " " + content_text)
-
-            announcement = {
-                "title": title_text,
-                "date": date_text,
-                "content": content_text,
-                "tags": tags,
-                "url": f"https://www.vara.ae{link_href}" if link_href else 'No URL found'
-            }
-            announcements.append(announcement)
-        except Exception as e:
-            logger.error(f"Error extracting announcement: {str(e)}")
+    # Extract tags from title and content, all items in one batch
+    all_tags = extract_tags_batch(announcement["title"] + " " + announcement["content"]
+                                  for announcement in announcements)
+    for announcement, tags in zip(announcements, all_tags):
+        announcement["tags"] = tags
     
     return announcements
 
@@ -78,16 +52,20 @@ def save_announcements_to_file(announcements, file_name):
     except Exception as e:
         logger.error(f"Error saving to file: {str(e)}")
 
-def run():
+def run(profile=CRAWL_PROFILE):
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=False)  # Set to False for debugging
         context = browser.new_context(
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         )
+        apply_profile(context, VARA_DOMAINS, profile)
         page = context.new_page()
         
         try:
-            page.goto("https://www.vara.ae/en/news/")
+            started = time.perf_counter()
+            with SCHEDULER.slot("https://www.vara.ae/en/news/") as slot:
+                response = page.goto("https://www.vara.ae/en/news/", wait_until=load_state(profile))
+                slot.report(response.status if response else None, page.title())
             logger.info("Page loaded, waiting for content...")
             
             # Take an initial screenshot
@@ -103,9 +81,13 @@ def run():
             # Log the page content for debugging
             logger.info(f"Page content: {page.content()[:500]}...")  # Log first 500 characters
             
-            # Scroll to load all content
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-            time.sleep(5)  # Wait for any lazy-loaded content
+            # Scroll until no more lazy-loaded items show up
+            loaded = scroll_to_end(page, '.news-item')
+            if loaded:
+                logger.info(f"{loaded} items loaded after scrolling")
+            else:
+                logger.warning("No items showed up after scrolling")
+            log_page_timing("News page", started, profile)
             
             # Take another screenshot after scrolling
             page.screenshot(path="vara_page_scrolled.png")
@@ -3,125 +3,113 @@ import time
 import json
 import os
 from datetime import datetime
-import spacy
-from collections import Counter
 import boto3
 import logging
-from tenacity import retry, stop_after_attempt, wait_fixed
+from tenacity import retry, stop_after_attempt
 import random
 import requests
 from bs4 import BeautifulSoup
+import tempfile
+from announcement_store import AnnouncementStore
+from dedup import Deduplicator
+from search_index import AnnouncementIndex
+from snapshot import snapshot_path, write_snapshot
+try:
+    from semantic_index import SemanticIndex, semantic_index_path
+except ImportError:
+    # numpy/scipy/scikit-learn only build the optional TF-IDF index
+    SemanticIndex = None
+from detail_fetcher import DetailFetcher
+from crawl_pipeline import CrawlPipeline
+from crawl_state import CRAWL_INCREMENTAL, CrawlState
+from http_cache import HttpCache
+from lazy_resources import register
+from listing_fields import ADGM_BASE_URL, ADGM_DOMAINS, ADGM_FIELDS, ADGM_ITEMS, extract_items
+from page_profile import (CRAWL_HEADLESS, CRAWL_PROFILE, apply_profile, first_item_html, load_state,
+                          log_page_timing, wait_for_new_listing)
+from politeness import SCHEDULER
+from record_sink import S3JsonlSink
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load the English NLP model
-nlp = spacy.load("en_core_web_sm")
-
 # S3 bucket ARN
 S3_BUCKET_ARN = "arn:aws:s3:::crypto-crawler-bucket321"
 
-def extract_tags(text, max_tags=5):
-    # Process the text with spaCy
-    doc = nlp(text)
-    
-    # Extract named entities
-    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'GPE', 'PRODUCT']]
-    
-    # Extract noun phrases
-    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
-    
-    # Combine entities and noun phrases
-    potential_tags = entities + noun_phrases
-    
-    # Count occurrences and get the most common tags
-    tag_counts = Counter(potential_tags)
-    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
-    
-    return top_tags
-
-def extract_announcements(page):
-    announcements = []
-    elements = page.query_selector_all('.element.level3')
-    logger.info(f"Found {len(elements)} elements on the page")
-    for element in elements:
-        authority = element.query_selector('.title .helvetica-light')
-        title = element.query_selector('.subhead-2.cl-black.level3')
-        date = element.query_selector('.date-1.cl-gray9')
-        link = element.get_attribute('href')
-
-        # Extract content from the linked page
-        content = ""
-        if link:
-            try:
-                content_page = page.context.new_page()
-                content_page.goto(f"https://www.adgm.com{link}", wait_until="networkidle")
-                
-                # Try different selectors for content
-                selectors = [
-                    '.announcement-content',
-                    '.content-area',
-                    'main',
-                    'article',
-                    'body'  # Fallback to entire body if specific content area not found
-                ]
-                
-                for selector in selectors:
-                    content_element = content_page.query_selector(selector)
-                    if content_element:
-                        content = content_element.inner_text()
-                        if content.strip():
-                            break
+LISTING_URL = f"{ADGM_BASE_URL}/media/announcements"
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+EXTRA_HTTP_HEADERS = {
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+def list_announcements(page):
+    """Return (title, date, source, url) of each announcement on the current listing page."""
+    # Every field of every item in one round trip to the browser
+    items = extract_items(page, ADGM_ITEMS, ADGM_FIELDS)
+    logger.info(f"Found {len(items)} elements on the page")
+    return [(item['title'], item['date'], item['source'], f"{ADGM_BASE_URL}{item['link']}" if item['link'] else None)
+            for item in items]
 
-                if not content.strip():
-                    logger.warning(f"Empty content for link: https://www.adgm.com{link}")
-            except Exception as e:
-                logger.error(f"Error extracting content from https://www.adgm.com{link}: {str(e)}")
-            finally:
-                content_page.close()
-
-        title_text = title.inner_text() if title else ''
-        content_text = content
-
-        # Extract tags from title and content
-        tags = extract_tags(title_text + " " + content_text)
-
-        announcement = {
-            "title": title_text,
-            "date": date.inner_text() if date else '',
-            "source": authority.inner_text() if authority else 'ADGM',
-            "content": content_text,
-            "tags": tags,
-            "url": f"https://www.adgm.com{link}" if link else ''
-        }
-        logger.info(f"Extracted announcement: {title_text}")
-        announcements.append(announcement)
-    return announcements
-
-def save_announcements_to_s3(announcements, file_name):
+def save_announcements_to_s3(sink, file_name):
     # Extract bucket name from ARN
     bucket_name = S3_BUCKET_ARN.split(':')[-1]
     
     # Create an S3 client
     s3 = boto3.client('s3')
     
-    # Convert announcements to JSON
-    data = {"announcements": announcements}
-    json_data = json.dumps(data, ensure_ascii=False, indent=2)
-    
-    # Upload the file to S3
+    # Stream the records into the JSON snapshot and upload the file to S3
     try:
-        s3.put_object(Bucket=bucket_name, Key=file_name, Body=json_data)
-        logger.info(f"Saved {len(announcements)} announcements to s3://{bucket_name}/{file_name}")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local_path = os.path.join(temp_dir, file_name)
+            count = sink.finalize(local_path)
+            s3.upload_file(local_path, bucket_name, file_name)
+        logger.info(f"Saved {count} announcements to s3://{bucket_name}/{file_name}")
     except Exception as e:
         logger.error(f"Error saving to S3: {str(e)}")
 
-@retry(stop=stop_after_attempt(3), wait=wait_fixed(5))
+    # The indexes need every record at once; the store keeps them compact
+    announcements = AnnouncementStore(sink.records())
+
+    # Upload the prebuilt search index next to the JSON for fast server startup
+    snapshot_name = snapshot_path(file_name)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local_path = os.path.join(temp_dir, snapshot_name)
+            write_snapshot(AnnouncementIndex(announcements), local_path)
+            s3.upload_file(local_path, bucket_name, snapshot_name)
+        logger.info(f"Saved search snapshot to s3://{bucket_name}/{snapshot_name}")
+    except Exception as e:
+        logger.error(f"Error saving snapshot to S3: {str(e)}")
+
+    # Persist the TF-IDF matrix for semantic search and /similar
+    if SemanticIndex is None:
+        logger.info("Skipping the TF-IDF index: numpy, scipy or scikit-learn is not installed")
+        return
+    semantic_name = semantic_index_path(file_name)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            local_path = os.path.join(temp_dir, semantic_name)
+            SemanticIndex.build(announcements).save(local_path)
+            s3.upload_file(local_path, bucket_name, semantic_name)
+        logger.info(f"Saved TF-IDF index to s3://{bucket_name}/{semantic_name}")
+    except Exception as e:
+        logger.error(f"Error saving TF-IDF index to S3: {str(e)}")
+
+# No fixed wait between attempts: a denied attempt slows the host down in
+# the scheduler, so the retry waits for its next slot
+@retry(stop=stop_after_attempt(3))
 def navigate_to_page(page, url):
-    page.goto(url)
-    page.wait_for_load_state('networkidle')
-    if "Access Denied" in page.title():
+    with SCHEDULER.slot(url) as slot:
+        response = page.goto(url)
+        page.wait_for_load_state('networkidle')
+        slot.report(response.status if response else None, page.title())
+    if slot.denied:
         raise Exception("Access Denied")
 
 def get_free_proxies():
@@ -141,27 +129,55 @@ def get_free_proxies():
                 continue
     return proxy_list
 
-proxies = get_free_proxies()
+# Scraped on first proxies.get(), not whenever this module is imported
+proxies = register('free_proxies', get_free_proxies)
 
-def run(playwright):
+def go_to_next_page(page, page_number, profile):
+    """Click through to the listing page after page_number; False on the last page."""
+    next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
+    if not next_button:
+        logger.info("Reached the last page")
+        return False
+
+    started = time.perf_counter()
+    previous = first_item_html(page, '.element.level3')
+    with SCHEDULER.slot(LISTING_URL) as slot:
+        next_button.click()
+        # The next page is ready once its items have replaced these
+        wait_for_new_listing(page, '.element.level3', previous)
+        if profile == 'full':
+            page.wait_for_load_state('networkidle')
+        slot.report(text=page.title())
+    log_page_timing(f"Listing page {page_number + 1}", started, profile)
+    return True
+
+def run(playwright, fetcher, state=None, cache=None, profile=CRAWL_PROFILE, sink=None):
+    # Records are streamed to S3 as each page is done; an interrupted crawl
+    # (or a failed attempt) resumes from its last finished page
+    if sink is None:
+        sink = S3JsonlSink('crawler_s3', S3_BUCKET_ARN.split(':')[-1],
+                           f'adgm_announcements_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jsonl')
     for attempt in range(3):  # Try 3 times
+        pipeline = None
         try:
-            browser = playwright.chromium.launch(headless=False)  # Set to True for production
+            browser = playwright.chromium.launch(headless=CRAWL_HEADLESS)  # Set CRAWL_HEADLESS=1 for production
             context = browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                extra_http_headers={
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                }
+                user_agent=USER_AGENT,
+                extra_http_headers=EXTRA_HTTP_HEADERS
             )
+            if cache is not None:
+                context.route('**/*', cache.route_handler())
+            apply_profile(context, ADGM_DOMAINS, profile)
             page = context.new_page()
             
             logger.info(f"Attempt {attempt + 1}: Accessing the page")
-            page.goto("https://www.adgm.com/media/announcements", timeout=60000)
-            page.wait_for_load_state('networkidle')
+            started = time.perf_counter()
+            with SCHEDULER.slot(LISTING_URL) as slot:
+                response = page.goto(LISTING_URL, timeout=60000, wait_until=load_state(profile))
+                if profile == 'full':
+                    page.wait_for_load_state('networkidle')
+                slot.report(response.status if response else None, page.title())
+            log_page_timing("Listing page 1", started, profile)
             
             if "Access Denied" not in page.title():
                 logger.info("Successfully accessed the page")
@@ -171,44 +187,79 @@ def run(playwright):
                 
                 logger.info(f"Page title: {page.title()}")
                 logger.info(f"Number of .element.level3 elements: {len(page.query_selector_all('.element.level3'))}")
+                # Detail pages are requested with the cookies the listing page set
+                fetcher.share_session(context)
+                # Detail pages, tagging and the sink run behind the listing
+                # pages, skipping what an earlier crawl already captured
+                pipeline = CrawlPipeline(fetcher, sink, state).start()
                 
-                all_announcements = []
                 page_number = 1
                 max_pages = 5
 
-                while page_number <= max_pages:
+                # Skip the pages an earlier attempt or run already wrote to the sink
+                while page_number <= min(sink.page, max_pages - 1):
+                    if not go_to_next_page(page, page_number, profile):
+                        break
+                    page_number += 1
+
+                while sink.page < page_number <= max_pages:
                     logger.info(f"Scraping page {page_number}")
                     try:
                         page.wait_for_selector('.element.level3', timeout=30000)
-                        announcements = extract_announcements(page)
-                        logger.info(f"Extracted {len(announcements)} announcements from page {page_number}")
-                        all_announcements.extend(announcements)
-                        
-                        next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
-                        if not next_button:
-                            logger.info("Reached the last page")
+                        pipeline.submit(page_number, list_announcements(page))
+                        if pipeline.stop_requested:
                             break
                         
-                        next_button.click()
+                        if not go_to_next_page(page, page_number, profile):
+                            break
                         page_number += 1
-                        page.wait_for_load_state('networkidle')
                     except PlaywrightTimeoutError:
                         logger.error(f"Timeout error on page {page_number}")
                         break
+                pipeline.close()
+                browser.close()
+                break
         except Exception as e:
             logger.error(f"Error with attempt {attempt + 1}: {str(e)}")
+            if pipeline:
+                # The next attempt resumes after the last page the sink finished
+                pipeline.abort()
             if browser:
                 browser.close()
     else:
         logger.error("Failed to access the page after trying multiple attempts")
+        sink.close()
         return
 
-    logger.info(f"Total announcements extracted: {len(all_announcements)}")
+    logger.info(f"Total announcements extracted: {sink.count}")
+    if state is not None:
+        # The snapshot still holds the whole archive, not just this crawl
+        sink.write(state.records(exclude=sink.urls))
+    if isinstance(sink, S3JsonlSink):
+        sink.complete()
     
     # Save to S3
     file_name = f'adgm_announcements_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-    save_announcements_to_s3(all_announcements, file_name)
+    # One record per announcement, however often it was listed or archived
+    with Deduplicator.from_records(sink.records()) as canonical:
+        save_announcements_to_s3(canonical, file_name)
+    sink.discard()
 
 if __name__ == "__main__":
-    with sync_playwright() as playwright:
-        run(playwright)
\ No newline at end of file
+    # Listing and detail responses go through HTTP_CACHE_DIR when it is set
+    cache = HttpCache.from_environment()
+    with sync_playwright() as playwright, DetailFetcher(
+            launch_options={'headless': CRAWL_HEADLESS},
+            context_options={'user_agent': USER_AGENT, 'extra_http_headers': EXTRA_HTTP_HEADERS},
+            cache=cache, first_party=ADGM_DOMAINS) as fetcher:
+        # In incremental mode only new or changed announcements are fetched
+        # and tagged, and paging stops at the first page with nothing new
+        if CRAWL_INCREMENTAL:
+            with CrawlState() as state:
+                run(playwright, fetcher, state, cache)
+        else:
+            run(playwright, fetcher, cache=cache)
+    if cache is not None:
+        logger.info(f"HTTP cache: {cache.summary()}")
+        cache.close()
+    logger.info(f"Request rates: {SCHEDULER.summary()}")
\ No newline at end of file
@@ -0,0 +1,337 @@
+import argparse
+from array import array
+from collections import Counter
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+from record_sink import read_records, write_snapshot_json
+
+logger = logging.getLogger(__name__)
+
+# Words per shingle, and the share of shingles two records must have in
+# common (estimated Jaccard similarity) to count as the same announcement
+DEDUP_SHINGLE_WORDS = int(os.environ.get('DEDUP_SHINGLE_WORDS', '3'))
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', '0.8'))
+# Shorter texts are only matched by URL or exact text: a title alone is too
+# little for a signature to tell two announcements apart
+DEDUP_MIN_WORDS = int(os.environ.get('DEDUP_MIN_WORDS', '12'))
+
+# MinHash signature of LSH_BANDS bands of LSH_ROWS values. Records sharing a
+# band are compared; at a Jaccard similarity of 0.8 two records share one
+# with a probability of 1 - (1 - 0.8 ** 4) ** 16, over 99.9%
+LSH_BANDS = 16
+LSH_ROWS = 4
+MERSENNE_PRIME = (1 << 61) - 1
+_seeds = random.Random(0)
+PERMUTATIONS = [(_seeds.randrange(1, MERSENNE_PRIME), _seeds.randrange(MERSENNE_PRIME))
+                for _ in range(LSH_BANDS * LSH_ROWS)]
+
+# "1 day ago", "3 weeks ago", "yesterday": they change between crawls of
+# the same announcement, in dates and in captured page text alike
+RELATIVE_DATE = re.compile(r'\b(?:\d+|an?|one)\s+(?:second|minute|hour|day|week|month|year)s?\s+ago\b'
+                           r'|\b(?:today|yesterday)\b', re.IGNORECASE)
+WORD = re.compile(r'\w+')
+# Placeholders the crawlers write when a field is missing
+MISSING_URLS = {'', 'No URL found'}
+MISSING_TEXTS = {'No title found', 'No content found', 'No description found'}
+
+# Commit the store every this many records
+COMMIT_EVERY = 500
+
+
+def normalize_record(record):
+    """The record in the current schema; early snapshots used authority and link."""
+    record = dict(record)
+    if 'url' not in record and 'link' in record:
+        record['url'] = record.pop('link')
+    if 'source' not in record and 'authority' in record:
+        record['source'] = record.pop('authority')
+    record.setdefault('tags', [])
+    return record
+
+
+def normalize_url(url):
+    if not url or url.strip() in MISSING_URLS:
+        return None
+    url = url.strip().split('#')[0]
+    scheme, _, rest = url.partition('://')
+    host, slash, path = rest.partition('/')
+    return f"{scheme.lower()}://{host.lower()}{slash}{path.rstrip('/')}"
+
+
+def words_of(record):
+    # Placeholders say nothing about the announcement; two records that only share them are not duplicates
+    text = ' '.join(value for value in (record.get(field) or '' for field in ('title', 'content', 'description'))
+                    if value.strip() not in MISSING_TEXTS)
+    return WORD.findall(RELATIVE_DATE.sub(' ', text).lower())
+
+
+def minhash(words, shingle=DEDUP_SHINGLE_WORDS):
+    """MinHash signature of the word shingles of words."""
+    hashes = {int.from_bytes(hashlib.blake2b(' '.join(words[start:start + shingle]).encode('utf-8'),
+                                             digest_size=8).digest(), 'big') % MERSENNE_PRIME
+              for start in range(max(1, len(words) - shingle + 1))}
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def bands(signature):
+    """(band, bucket) pairs of a signature; the bucket is a hash of the band's rows."""
+    return [(band, int.from_bytes(hashlib.blake2b(repr(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]).encode(),
+                                                  digest_size=8).digest(), 'big') >> 1)
+            for band in range(LSH_BANDS)]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the shingles behind two signatures."""
+    return sum(a == b for a, b in zip(signature, other)) / len(signature)
+
+
+def is_relative_date(date):
+    return bool(date) and bool(RELATIVE_DATE.search(date))
+
+
+def merge_records(kept, other):
+    """One record from two captures of the same announcement; kept wins ties."""
+    merged = dict(kept)
+    for key, value in other.items():
+        if merged.get(key) in (None, [], *MISSING_URLS, *MISSING_TEXTS):
+            merged[key] = value
+    # An absolute date beats "4 days ago"
+    if is_relative_date(kept.get('date')) and other.get('date') and not is_relative_date(other['date']):
+        merged['date'] = other['date']
+    # The longer content is the fuller capture, and its tags go with it
+    if len((other.get('content') or '').strip()) > len((kept.get('content') or '').strip()):
+        merged['content'] = other['content']
+        if other.get('tags'):
+            merged['tags'] = other['tags']
+    for url in other.get('alternate_urls', []):
+        add_alternate_url(merged, url)
+    return merged
+
+
+def add_alternate_url(record, url):
+    """Note another URL the announcement of record was captured at, unless it already has it."""
+    normalized = normalize_url(url)
+    known = [record.get('url')] + record.get('alternate_urls', [])
+    if normalized and normalized not in {normalize_url(other) for other in known}:
+        record['alternate_urls'] = record.get('alternate_urls', []) + [url]
+
+
+def iter_snapshot(path, chunk_size=1 << 16):
+    """Stream the records of a JSON snapshot ({"announcements": [...]} or a bare list) or JSON lines file.
+
+    Only one record and one chunk of the file are in memory at a time.
+    """
+    if path.endswith('.jsonl'):
+        yield from read_records(path)
+        return
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        # The records are the snapshot's one array
+        start = buffer.find('[')
+        while start < 0:
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer += more
+            start = buffer.find('[')
+        buffer = buffer[start + 1:]
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            if buffer.startswith(']'):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buffer += more
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+class Deduplicator:
+    """One canonical record per announcement, however many snapshots and crawls captured it.
+
+    Records are the same announcement when their URLs match, when their
+    normalized text (lowercased, relative dates dropped) is identical, or
+    when the MinHash signatures of long enough texts put their similarity
+    at DEDUP_THRESHOLD or more. Candidates come from LSH band buckets, so
+    each record is compared with a handful of others rather than all of them.
+    Duplicates are merged into the first record seen with merge_records(),
+    unless both have a URL and the URLs differ. Then the first record is
+    kept as it is and the duplicate's URL is added to its alternate_urls, so
+    no captured URL is lost.
+
+    Everything lives in an SQLite file (a temporary one by default), so
+    memory stays flat however many records go through. records() and
+    finalize() make it a drop-in for a sink when writing the snapshot.
+    """
+
+    def __init__(self, path=None):
+        self.temp_dir = None
+        if path is None:
+            self.temp_dir = tempfile.TemporaryDirectory(prefix='dedup_')
+            path = os.path.join(self.temp_dir.name, 'dedup.db')
+        self.path = path
+        self.stats = Counter()
+        self.pending = 0
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS canonical (id INTEGER PRIMARY KEY, record TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS texts (digest TEXT PRIMARY KEY, id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS signatures (signature_id INTEGER PRIMARY KEY, signature BLOB NOT NULL,
+                                                   id INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL,
+                                              signature_id INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+        """)
+        self.db.commit()
+
+    @classmethod
+    def from_records(cls, records, path=None):
+        dedup = cls(path)
+        dedup.add_all(records)
+        return dedup
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM canonical").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+
+    def _near(self, signature, buckets):
+        """Id of the most similar canonical record at DEDUP_THRESHOLD or above, or None."""
+        best = None
+        compared = set()
+        for band, bucket in buckets:
+            for signature_id, other, record_id in self.db.execute(
+                    "SELECT s.signature_id, s.signature, s.id FROM bands b JOIN signatures s USING (signature_id) "
+                    "WHERE b.band = ? AND b.bucket = ?", (band, bucket)):
+                if signature_id in compared:
+                    continue
+                compared.add(signature_id)
+                score = similarity(signature, array('q', other))
+                if score >= DEDUP_THRESHOLD and (best is None or score > best[0]):
+                    best = (score, record_id)
+        return best[1] if best else None
+
+    def add(self, record):
+        """Fold a record in; returns its canonical id and how it matched (new, url, text or near)."""
+        record = normalize_record(record)
+        url = normalize_url(record.get('url'))
+        words = words_of(record)
+        digest = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=16).hexdigest() if words else None
+        signature = minhash(words) if len(words) >= DEDUP_MIN_WORDS else None
+        buckets = bands(signature) if signature else None
+
+        record_id, how = None, 'new'
+        row = self.db.execute("SELECT id FROM urls WHERE url = ?", (url,)).fetchone() if url else None
+        if row:
+            record_id, how = row[0], 'url'
+        elif digest and (row := self.db.execute("SELECT id FROM texts WHERE digest = ?", (digest,)).fetchone()):
+            record_id, how = row[0], 'text'
+        elif signature:
+            record_id = self._near(signature, buckets)
+            how = 'near' if record_id is not None else 'new'
+
+        if record_id is None:
+            record_id = self.db.execute("INSERT INTO canonical (record) VALUES (?)",
+                                        (json.dumps(record, ensure_ascii=False),)).lastrowid
+        else:
+            kept = json.loads(self.db.execute("SELECT record FROM canonical WHERE id = ?", (record_id,)).fetchone()[0])
+            kept_url = normalize_url(kept.get('url'))
+            if url and kept_url and url != kept_url:
+                # Same text at another address: keep the address, not a blend of the two captures
+                add_alternate_url(kept, record['url'].strip())
+                self.stats['alternate'] += 1
+            else:
+                kept = merge_records(kept, record)
+            self.db.execute("UPDATE canonical SET record = ? WHERE id = ?",
+                            (json.dumps(kept, ensure_ascii=False), record_id))
+        # Every variant's URL, text and signature lead to the canonical record
+        if url:
+            self.db.execute("INSERT OR IGNORE INTO urls VALUES (?, ?)", (url, record_id))
+        if digest:
+            self.db.execute("INSERT OR IGNORE INTO texts VALUES (?, ?)", (digest, record_id))
+        if signature and how != 'text':
+            signature_id = self.db.execute("INSERT INTO signatures (signature, id) VALUES (?, ?)",
+                                           (array('q', signature).tobytes(), record_id)).lastrowid
+            self.db.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                [(band, bucket, signature_id) for band, bucket in buckets])
+
+        self.stats['records'] += 1
+        self.stats[how] += 1
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.db.commit()
+            self.pending = 0
+        return record_id, how
+
+    def add_all(self, records):
+        for record in records:
+            self.add(record)
+        self.db.commit()
+        return self
+
+    def add_snapshot(self, path):
+        """Stream a snapshot file in; returns how many of its records were new announcements."""
+        before = self.stats['new']
+        self.add_all(iter_snapshot(path))
+        return self.stats['new'] - before
+
+    def records(self):
+        """The canonical records, in the order their announcements were first seen."""
+        for (record,) in self.db.execute("SELECT record FROM canonical ORDER BY id"):
+            yield json.loads(record)
+
+    def finalize(self, file_name, indent=2):
+        """Write the {"announcements": [...]} snapshot of the canonical records; returns the count."""
+        with open(file_name, 'w', encoding='utf-8') as f:
+            count = write_snapshot_json(self.records(), f, indent)
+        logger.info(f"Saved {count} announcements to {file_name} ({self.summary()})")
+        return count
+
+    def summary(self):
+        duplicates = self.stats['url'] + self.stats['text'] + self.stats['near']
+        return (f"{self.stats['records']} records, {self.stats['new']} announcements, {duplicates} duplicates "
+                f"({self.stats['url']} by URL, {self.stats['text']} by text, {self.stats['near']} near; "
+                f"{self.stats['alternate']} at another URL)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge snapshots into one canonical record per announcement.")
+    parser.add_argument('output', help="Snapshot to write")
+    parser.add_argument('snapshots', nargs='+',
+                        help="Snapshot (.json) or crawl (.jsonl) files; on ties the earlier file's record wins")
+    parser.add_argument('--db', help="Keep the dedup store in this file (default: a temporary one)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with Deduplicator(args.db) as dedup:
+        for path in args.snapshots:
+            print(f"{path}: {dedup.add_snapshot(path)} new announcements")
+        dedup.finalize(args.output)
+        print(dedup.summary())
+
+
+if __name__ == "__main__":
+    main()
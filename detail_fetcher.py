@@ -0,0 +1,418 @@
+import asyncio
+from collections import Counter
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from playwright.async_api import async_playwright
+from http_cache import response_text
+from page_profile import CRAWL_PROFILE, async_apply_profile
+from politeness import SCHEDULER
+
+try:
+    import httpx
+except ImportError:
+    # Without httpx the static tier falls back to a pooled requests session
+    httpx = None
+
+try:
+    import h2  # noqa: F401 (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2 = httpx is not None
+except ImportError:
+    HTTP2 = False
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    # No parser, no static tier: every page goes through the browser
+    BeautifulSoup = None
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+logger = logging.getLogger(__name__)
+
+# Selectors tried in order on a detail page; body is the last resort
+CONTENT_SELECTORS = [
+    '.announcement-content',
+    '.content-area',
+    'main',
+    'article',
+    'body'
+]
+
+# Elements whose text a browser never renders
+HIDDEN_TAGS = ['script', 'style', 'noscript', 'template']
+# Elements a browser puts on their own lines in inner_text
+BLOCK_TAGS = ['address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+              'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+              'ol', 'p', 'pre', 'section', 'table', 'tr', 'ul']
+
+# Detail pages loaded at once, overall and against any single host
+DETAIL_CONCURRENCY = int(os.environ.get('DETAIL_CONCURRENCY', '4'))
+DETAIL_PER_HOST = int(os.environ.get('DETAIL_PER_HOST', '4'))
+
+# Try a plain HTTP GET before opening a browser tab (set to 0 to always render)
+DETAIL_HTTP_FIRST = os.environ.get('DETAIL_HTTP_FIRST', '1') != '0'
+HTTP_TIMEOUT = 30
+
+
+def visible_text(element):
+    """Approximate a browser's inner_text: one line per block, inline text joined by spaces."""
+    for block in element.find_all(BLOCK_TAGS):
+        block.insert_before('\n')
+        block.insert_after('\n')
+    for line_break in element.find_all('br'):
+        line_break.replace_with('\n')
+    lines = (' '.join(line.split()) for line in element.get_text().splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def static_content(html):
+    """Text of the first non-empty content selector in server-rendered HTML.
+
+    body is not tried: a page whose content only shows up in the body is most
+    likely rendered by scripts, so an empty string sends it to the browser.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+    for element in soup(HIDDEN_TAGS):
+        element.decompose()
+    title = soup.title.get_text() if soup.title else ''
+    if "Access Denied" in title:
+        return ""
+    for selector in CONTENT_SELECTORS[:-1]:
+        element = soup.select_one(selector)
+        if element:
+            content = visible_text(element)
+            if content:
+                return content
+    return ""
+
+
+async def fetch_content(context, url, profile=CRAWL_PROFILE, scheduler=SCHEDULER):
+    """Load one detail page in a new tab and return the text of its first non-empty content selector.
+
+    The full profile waits for the network to go idle; the lean one only for
+    the DOM and then for one of the content selectors to show up.
+    """
+    content = ""
+    try:
+        page = await context.new_page()
+        try:
+            async with scheduler.aslot(url) as slot:
+                response = await page.goto(url, wait_until="domcontentloaded" if profile == 'lean' else "networkidle")
+                slot.report(response.status if response else None, await page.title())
+            if profile == 'lean':
+                try:
+                    await page.wait_for_selector(', '.join(CONTENT_SELECTORS[:-1]), timeout=10000)
+                except Exception:
+                    # Fall through to the body selector
+                    pass
+            for selector in CONTENT_SELECTORS:
+                content_element = await page.query_selector(selector)
+                if content_element:
+                    content = await content_element.inner_text()
+                    if content.strip():
+                        break
+        finally:
+            await page.close()
+
+        if not content.strip():
+            logger.warning(f"Empty content for link: {url}")
+    except Exception as e:
+        logger.error(f"Error extracting content from {url}: {str(e)}")
+    return content
+
+
+async def fetch_contents(fetch, urls, concurrency=DETAIL_CONCURRENCY, per_host=DETAIL_PER_HOST):
+    """Run the fetch coroutine function on every URL with a bounded pool of workers.
+
+    Contents come back in the order of urls whatever order the pages finish
+    in; a None URL gives an empty content.
+    """
+    contents = [""] * len(urls)
+    queue = asyncio.Queue()
+    for position, url in enumerate(urls):
+        if url:
+            queue.put_nowait((position, url))
+    host_slots = {}
+
+    async def worker():
+        while True:
+            try:
+                position, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            host = urlsplit(url).netloc
+            slots = host_slots.setdefault(host, asyncio.Semaphore(per_host))
+            async with slots:
+                contents[position] = await fetch(url)
+
+    workers = min(concurrency, queue.qsize())
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return contents
+
+
+class DetailFetcher:
+    """Fetch detail pages concurrently on behalf of a sync Playwright crawler.
+
+    Each page is first requested over a pooled keep-alive HTTP client (HTTP/2
+    when httpx and h2 are installed) and parsed with BeautifulSoup; only pages
+    whose static HTML has no content are loaded in the browser. tier_counts
+    records which tier produced each page.
+
+    The sync API cannot await, so an async Playwright browser with a single
+    shared context runs on an event loop in a background thread, and fetch()
+    blocks until a whole batch of detail pages is in. The browser is only
+    launched the first time a page needs it. Use it as a context manager
+    around the crawl, and call share_session() with the listing crawler's
+    context once the site has set its cookies, so detail requests carry the
+    same session. If the browser cannot be started, the pages that needed it
+    come back empty and the rest of the batch is unaffected.
+
+    This is a second browser next to the crawler's own: sync Playwright
+    objects belong to the thread that created them, and the pipeline fetches
+    from other threads, so the crawler's browser cannot render detail pages.
+    Pages the static tier handles never start it, and close() (or
+    release_browser()) shuts it down whatever failed along the way.
+
+    With an HttpCache both tiers go through it: the HTTP client sends
+    conditional requests for cached pages and the browser context routes its
+    requests through the cache.
+
+    Every request, static or rendered, waits for a slot from the
+    politeness scheduler.
+
+    Callers that already run on an event loop pass their own browser context
+    and use open(), fetch_async() and aclose() instead.
+    """
+
+    def __init__(self, concurrency=DETAIL_CONCURRENCY, per_host=DETAIL_PER_HOST,
+                 launch_options=None, context_options=None, http_first=DETAIL_HTTP_FIRST, cache=None,
+                 profile=CRAWL_PROFILE, first_party=(), context=None, scheduler=SCHEDULER):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.launch_options = launch_options or {}
+        self.context_options = dict(context_options or {})
+        self.http_first = http_first and BeautifulSoup is not None and (httpx is not None or requests is not None)
+        self.cache = cache
+        self.profile = profile
+        self.first_party = list(first_party)
+        self.scheduler = scheduler
+        self.browser_seconds = 0.0
+        self.tier_counts = Counter()
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self.playwright = None
+        self.browser = None
+        self.context = context
+        self.browser_lock = None
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def _http_headers(self):
+        headers = dict(self.context_options.get('extra_http_headers', {}))
+        # Let the client negotiate the encodings it can actually decode
+        headers.pop('Accept-Encoding', None)
+        if 'user_agent' in self.context_options:
+            headers['User-Agent'] = self.context_options['user_agent']
+        return headers
+
+    async def open(self):
+        self.browser_lock = asyncio.Lock()
+        if not self.http_first:
+            return
+        if httpx is not None:
+            self.client = httpx.AsyncClient(
+                http2=HTTP2, headers=self._http_headers(), follow_redirects=True, timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency))
+        else:
+            self.client = requests.Session()
+            self.client.headers.update(self._http_headers())
+            adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+            self.client.mount('https://', adapter)
+            self.client.mount('http://', adapter)
+        if self.context is not None:
+            # The static tier shares the caller's session too
+            await self.adopt_session(await self.context.storage_state())
+
+    async def adopt_session(self, storage_state):
+        """Send the cookies of a Playwright storage_state with every later detail request."""
+        cookies = storage_state.get('cookies', [])
+        if self.client is not None:
+            for cookie in cookies:
+                self.client.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+        if self.browser is not None and self.context is not None:
+            # Our own context is already open; one opened later gets the state from its options
+            await self.context.add_cookies(cookies)
+        self.context_options['storage_state'] = storage_state
+
+    def share_session(self, context):
+        """Carry a sync Playwright context's cookies and local storage over to the detail requests."""
+        self._run(self.adopt_session(context.storage_state()))
+
+    async def aclose(self):
+        try:
+            if self.client is not None:
+                if httpx is not None:
+                    await self.client.aclose()
+                else:
+                    self.client.close()
+                self.client = None
+        finally:
+            await self._close_browser()
+
+    async def _close_browser(self):
+        """Close the browser this fetcher launched, if any; a context passed in by the caller is left open."""
+        browser, playwright = self.browser, self.playwright
+        self.browser = self.playwright = None
+        if browser is not None:
+            self.context = None
+        try:
+            if browser is not None:
+                await browser.close()
+        finally:
+            if playwright is not None:
+                await playwright.stop()
+
+    def release_browser(self):
+        """Close the fetcher's own browser now (e.g. after a failed crawl); the next page that needs one starts it again."""
+        if self.loop is not None:
+            self._run(self._close_browser())
+
+    async def _browser_context(self):
+        async with self.browser_lock:
+            if self.browser is not None and not self.browser.is_connected():
+                # Our browser died; start a fresh one rather than failing every page
+                await self._close_browser()
+            if self.context is None:
+                try:
+                    if self.playwright is None:
+                        self.playwright = await async_playwright().start()
+                    if self.browser is None:
+                        self.browser = await self.playwright.chromium.launch(**self.launch_options)
+                    context = await self.browser.new_context(**self.context_options)
+                    try:
+                        if self.cache is not None:
+                            await context.route('**/*', self.cache.async_route_handler())
+                        await async_apply_profile(context, self.first_party, self.profile)
+                    except Exception:
+                        await context.close()
+                        raise
+                except Exception:
+                    # Nothing half-started is left running until close()
+                    await self._close_browser()
+                    raise
+                self.context = context
+        return self.context
+
+    async def _get(self, url):
+        """Body of a successful HTML response, or None."""
+        entry = self.cache.lookup(url) if self.cache is not None else None
+        if self.cache is not None and self.cache.offline:
+            self.cache.stats['hit' if entry else 'miss'] += 1
+            return response_text(entry.body, entry.headers) if entry else None
+
+        headers = self.cache.conditional_headers(entry) if self.cache is not None else {}
+        async with self.scheduler.aslot(url) as slot:
+            if httpx is not None:
+                response = await self.client.get(url, headers=headers)
+            else:
+                response = await asyncio.to_thread(self.client.get, url, headers=headers, timeout=HTTP_TIMEOUT)
+            slot.report(response.status_code, response.text[:2048], response.headers.get('retry-after'))
+        if response.status_code == 304 and entry is not None:
+            self.cache.revalidated(entry, response.headers)
+            return response_text(entry.body, entry.headers)
+        if response.status_code != 200 or 'html' not in response.headers.get('content-type', ''):
+            return None
+        if self.cache is not None:
+            self.cache.stats['miss'] += 1
+            self.cache.store(url, response.status_code, response.headers, response.content)
+        return response.text
+
+    async def _fetch(self, url):
+        if self.client is not None:
+            try:
+                html = await self._get(url)
+                content = static_content(html) if html else ""
+            except Exception as e:
+                logger.debug(f"Static fetch of {url} failed: {str(e)}")
+                content = ""
+            if content:
+                self.tier_counts['http'] += 1
+                return content
+        try:
+            context = await self._browser_context()
+        except Exception as e:
+            # The next page that needs the browser tries to start it again
+            logger.error(f"Could not open a browser for {url}: {str(e)}")
+            self.tier_counts['failed'] += 1
+            return ""
+        started = time.perf_counter()
+        content = await fetch_content(context, url, self.profile, self.scheduler)
+        self.browser_seconds += time.perf_counter() - started
+        self.tier_counts['browser' if content.strip() else 'failed'] += 1
+        return content
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='detail-fetcher', daemon=True)
+        self.thread.start()
+        try:
+            self._run(self.open())
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def close(self):
+        if self.loop is None:
+            return
+        try:
+            self._run(self.aclose())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+        logger.info(f"Detail pages by tier: {self.tier_summary()}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tier_summary(self):
+        total = sum(self.tier_counts.values())
+        return ', '.join(f"{tier} {count} ({count / total:.0%})"
+                         for tier, count in self.tier_counts.most_common()) if total else 'none fetched'
+
+    def fetch(self, urls):
+        """Contents of urls, in order, fetched concurrently."""
+        return self._run(self.fetch_async(urls))
+
+    async def fetch_async(self, urls):
+        """Contents of urls, in order, fetched concurrently on the running event loop."""
+        started = time.perf_counter()
+        contents = await fetch_contents(self._fetch, urls, self.concurrency, self.per_host)
+        logger.info(f"Fetched {sum(1 for url in urls if url)} detail pages in "
+                    f"{time.perf_counter() - started:.1f}s (concurrency {self.concurrency}; "
+                    f"{self.tier_summary()})")
+        rendered = self.tier_counts['browser'] + self.tier_counts['failed']
+        if rendered:
+            logger.info(f"Browser detail pages took {self.browser_seconds / rendered:.2f}s each "
+                        f"on average ({self.profile} profile)")
+        return contents
@@ -0,0 +1,249 @@
+import argparse
+from collections import Counter
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+from synthetic_corpus import CorpusModel, generate_announcements, load_sample
+
+# Seconds every response is held back, plus up to FIXTURE_JITTER more
+FIXTURE_LATENCY = float(os.environ.get('FIXTURE_LATENCY', '0.05'))
+FIXTURE_JITTER = float(os.environ.get('FIXTURE_JITTER', '0.05'))
+# Share of requests answered with a 429 or 503 instead of the page
+FIXTURE_FAILURE_RATE = float(os.environ.get('FIXTURE_FAILURE_RATE', '0'))
+
+# Paths of the recorded sites, all served from one local host
+ADGM_LISTING_PATH = '/media/announcements'
+VARA_NEWS_PATH = '/en/news/'
+FAB_OFFERS_PATH = '/en-ae/personal/credit-cards/offers'
+
+ADGM_PAGE_SIZE = 10
+VARA_ITEMS = 12
+FAB_OFFERS = 12
+MERCHANTS = ['Noon', 'Carrefour', 'Emirates', 'Etihad', 'Talabat', 'Careem', 'Booking.com', 'VOX Cinemas',
+             'Sharaf DG', 'Amazon', 'Deliveroo', 'Marriott']
+
+# Listing pages swap in the next page's items client-side after a delay,
+# the way adgm.com loads them, so the crawlers have to wait for the change
+PAGINATION_SCRIPT = """
+<script>
+let current = 1;
+const pages = document.querySelectorAll('template.listing-page');
+const next = document.querySelector('.bottom-nav__item_revert');
+next.addEventListener('click', () => {
+    if (next.classList.contains('disabled')) return;
+    setTimeout(() => {
+        current += 1;
+        document.querySelector('.listing').innerHTML = pages[current - 1].innerHTML;
+        if (current === pages.length) next.classList.add('disabled');
+    }, %d);
+});
+</script>
+"""
+
+# Detail pages whose content only shows up once this script has run
+RENDER_SCRIPT = """
+<script>
+document.querySelector('.announcement-content').innerHTML = %s;
+</script>
+"""
+
+
+def page(title, body):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{escape(title)}</title></head>'
+            f'<body>{body}</body></html>')
+
+
+def paragraphs(text):
+    return ''.join(f'<p>{escape(line)}</p>' for line in text.split('\n') if line.strip())
+
+
+class FixtureSite:
+    """Recorded ADGM, VARA and FAB pages in the DOM shape the crawlers read.
+
+    ADGM announcements come from the snapshots in the repo, topped up with
+    synthetic ones when more pages are asked for than were recorded; VARA
+    news and FAB offers are made from the same corpus. script_rendered is
+    the share of detail pages whose content is filled in by a script, which
+    the detail fetcher's static tier cannot see.
+    """
+
+    def __init__(self, pages=5, seed=0, script_rendered=0.0, pagination_ms=100):
+        sample = load_sample()
+        needed = pages * ADGM_PAGE_SIZE
+        announcements = sample[:needed]
+        if len(announcements) < needed:
+            announcements += list(generate_announcements(needed - len(announcements), seed, sample))
+        self.pages = [announcements[start:start + ADGM_PAGE_SIZE] for start in range(0, needed, ADGM_PAGE_SIZE)]
+        self.details = {urlsplit(announcement['url']).path: announcement for announcement in announcements}
+        chooser = random.Random(seed)
+        self.rendered = {path for path in self.details if chooser.random() < script_rendered}
+        self.pagination_ms = pagination_ms
+
+        model = CorpusModel(sample, seed)
+        self.news = [{"title": model.title(), "date": model.date(), "excerpt": model.sentence(30),
+                      "href": f"/en/news/item-{number}"} for number in range(VARA_ITEMS)]
+        self.offers = [{"title": f"{chooser.choice([5, 10, 15, 20, 25])}% off at {chooser.choice(MERCHANTS)}",
+                        "description": model.sentence(25)} for _ in range(FAB_OFFERS)]
+
+    def adgm_item(self, announcement):
+        return (f'<a class="element level3" href="{escape(urlsplit(announcement["url"]).path)}">'
+                f'<div class="title"><span class="helvetica-light">{escape(announcement.get("source", "ADGM"))}</span></div>'
+                f'<div class="subhead-2 cl-black level3">{escape(announcement["title"])}</div>'
+                f'<div class="date-1 cl-gray9">{escape(announcement["date"])}</div></a>')
+
+    def adgm_listing(self):
+        templates = ''.join(f'<template class="listing-page">{"".join(map(self.adgm_item, items))}</template>'
+                            for items in self.pages)
+        disabled = ' disabled' if len(self.pages) == 1 else ''
+        body = (f'<main><div class="listing">{"".join(map(self.adgm_item, self.pages[0]))}</div>'
+                f'<nav><button class="bottom-nav__item_revert{disabled}">Next</button></nav>{templates}</main>'
+                + PAGINATION_SCRIPT % self.pagination_ms)
+        return page("Announcements | ADGM", body)
+
+    def adgm_detail(self, path):
+        announcement = self.details.get(path)
+        if announcement is None:
+            return None
+        content = paragraphs(announcement['content'])
+        if path in self.rendered:
+            body = '<main><div class="announcement-content"></div></main>' + RENDER_SCRIPT % json.dumps(content)
+        else:
+            body = f'<main><div class="announcement-content">{content}</div></main>'
+        return page(f'{announcement["title"]} | ADGM', body)
+
+    def vara_news(self):
+        items = ''.join(f'<div class="news-item"><a href="{escape(item["href"])}"><h3>{escape(item["title"])}</h3></a>'
+                        f'<span class="date">{escape(item["date"])}</span>'
+                        f'<p class="excerpt">{escape(item["excerpt"])}</p></div>' for item in self.news)
+        return page("News | VARA", f'<main>{items}</main>')
+
+    def fab_offers(self):
+        items = ''.join(f'<div class="offer-item"><h4 class="offer-title">{escape(offer["title"])}</h4>'
+                        f'<p class="offer-description">{escape(offer["description"])}</p></div>'
+                        for offer in self.offers)
+        return page("Credit card offers | FAB", f'<main>{items}</main>')
+
+    def render(self, path):
+        """(kind, html) for a path, or (None, None) when there is no such page."""
+        if path.rstrip('/') == ADGM_LISTING_PATH:
+            return 'listing', self.adgm_listing()
+        if path.startswith(ADGM_LISTING_PATH + '/'):
+            html = self.adgm_detail(path)
+            return ('detail', html) if html else (None, None)
+        if path == VARA_NEWS_PATH:
+            return 'listing', self.vara_news()
+        if path == FAB_OFFERS_PATH:
+            return 'listing', self.fab_offers()
+        return None, None
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        with server.lock:
+            delay = server.latency + server.random.random() * server.jitter
+            failure = server.random.random() < server.failure_rate
+            status = server.random.choice([429, 503]) if failure else None
+        time.sleep(delay)
+
+        if failure:
+            server.count('failed')
+            self.send_response(status)
+            self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(page("Access Denied", "<h1>Access Denied</h1>").encode('utf-8'))
+            return
+
+        kind, html = server.site.render(path)
+        if html is None:
+            server.count('not_found')
+            self.send_error(404)
+            return
+        server.count(kind)
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The crawlers log what they fetch; keep the benchmark output readable
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Local stand-in for the crawled sites with configurable latency and failures.
+
+    Point a crawler at url instead of https://www.adgm.com (and friends);
+    stats counts the listing and detail pages served and the failures
+    injected. Use it as a context manager to serve from a background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, site, port=0, latency=FIXTURE_LATENCY, jitter=FIXTURE_JITTER,
+                 failure_rate=FIXTURE_FAILURE_RATE, seed=0):
+        super().__init__(('127.0.0.1', port), FixtureHandler)
+        self.site = site
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, kind):
+        with self.lock:
+            self.stats[kind] += 1
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fixture-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.thread.join()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded ADGM, VARA and FAB pages locally.")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--pages', type=int, default=5, help="ADGM listing pages")
+    parser.add_argument('--latency', type=float, default=FIXTURE_LATENCY)
+    parser.add_argument('--jitter', type=float, default=FIXTURE_JITTER)
+    parser.add_argument('--failure-rate', type=float, default=FIXTURE_FAILURE_RATE)
+    parser.add_argument('--script-rendered', type=float, default=0.0,
+                        help="Share of detail pages only a browser can read")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    site = FixtureSite(args.pages, args.seed, args.script_rendered)
+    server = FixtureServer(site, args.port, args.latency, args.jitter, args.failure_rate, args.seed)
+    print(f"Serving {len(site.details)} ADGM announcements at {server.url}{ADGM_LISTING_PATH}, "
+          f"VARA at {server.url}{VARA_NEWS_PATH} and FAB at {server.url}{FAB_OFFERS_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {dict(server.stats)}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
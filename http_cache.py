@@ -0,0 +1,240 @@
+from collections import Counter, namedtuple
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+# Directory of the crawl response cache; unset disables caching
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR')
+# 'revalidate' sends conditional requests for cached URLs; 'offline' replays
+# the cache without touching the network and fails everything it lacks
+HTTP_CACHE_MODE = os.environ.get('HTTP_CACHE_MODE', 'revalidate')
+HTTP_CACHE_MAX_MB = int(os.environ.get('HTTP_CACHE_MAX_MB', '1024'))
+
+# Requests the browser routes through the cache; the rest (images, fonts,
+# media) go straight to the network, or are aborted when offline
+CACHED_RESOURCE_TYPES = {'document', 'xhr', 'fetch', 'script', 'stylesheet'}
+
+# Headers that describe the transfer rather than the stored body
+TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+CachedResponse = namedtuple('CachedResponse', ['url', 'status', 'headers', 'body', 'etag', 'last_modified'])
+
+
+def response_text(body, headers):
+    """Decode a cached body with the charset its Content-Type names (UTF-8 otherwise)."""
+    content_type = headers.get('content-type', '')
+    charset = 'utf-8'
+    for parameter in content_type.split(';')[1:]:
+        name, _, value = parameter.strip().partition('=')
+        if name.lower() == 'charset' and value:
+            charset = value.strip('"\'')
+    try:
+        return body.decode(charset, errors='replace')
+    except LookupError:
+        return body.decode('utf-8', errors='replace')
+
+
+class HttpCache:
+    """Content-addressed on-disk cache of crawl responses.
+
+    Bodies are stored once per SHA-256 under objects/, so pages that several
+    URLs serve identically take the space once; an SQLite index maps each URL
+    to its body, status, headers and validators (ETag, Last-Modified). When
+    the bodies outgrow max_bytes the least recently used URLs are dropped.
+    Safe to share between the crawler thread and the detail fetcher thread.
+    """
+
+    def __init__(self, directory, max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+            CREATE TABLE IF NOT EXISTS objects (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    @classmethod
+    def from_environment(cls):
+        """The cache configured by HTTP_CACHE_DIR and HTTP_CACHE_MODE, or None."""
+        if not HTTP_CACHE_DIR:
+            return None
+        return cls(HTTP_CACHE_DIR, offline=HTTP_CACHE_MODE == 'offline')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def lookup(self, url):
+        """The cached response for url, or None."""
+        with self.lock:
+            row = self.db.execute("SELECT digest, status, headers, etag, last_modified FROM entries WHERE url = ?",
+                                  (url,)).fetchone()
+            if row is None:
+                return None
+            digest, status, headers, etag, last_modified = row
+            try:
+                with open(self._object_path(digest), 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                # The body went missing from disk; forget the entry
+                self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return CachedResponse(url, status, json.loads(headers), body, etag, last_modified)
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Request headers that revalidate a cached entry (none when there is no entry)."""
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def store(self, url, status, headers, body):
+        """Cache a successful response and evict old entries if the cache is over size."""
+        headers = {name.lower(): value for name, value in headers.items() if name.lower() not in TRANSFER_HEADERS}
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._object_path(digest)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f'{path}.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(temp_path, path)
+            self.db.execute("INSERT OR IGNORE INTO objects (digest, size) VALUES (?, ?)", (digest, len(body)))
+            old = self.db.execute("SELECT digest FROM entries WHERE url = ?", (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (url, digest, status, json.dumps(headers), headers.get('etag'),
+                             headers.get('last-modified'), time.time()))
+            if old and old[0] != digest:
+                self._drop_unreferenced(old[0])
+            self._evict()
+            self.db.commit()
+        self.stats['stored'] += 1
+
+    def revalidated(self, entry, headers):
+        """Record a 304 for entry, picking up any new validators the server sent."""
+        headers = {name.lower(): value for name, value in headers.items()}
+        with self.lock:
+            self.db.execute("UPDATE entries SET etag = ?, last_modified = ?, last_used = ? WHERE url = ?",
+                            (headers.get('etag', entry.etag), headers.get('last-modified', entry.last_modified),
+                             time.time(), entry.url))
+            self.db.commit()
+        self.stats['revalidated'] += 1
+
+    def _drop_unreferenced(self, digest):
+        if self.db.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return
+        self.db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        try:
+            os.unlink(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        while total > self.max_bytes:
+            row = self.db.execute("SELECT url, digest FROM entries ORDER BY last_used LIMIT 1").fetchone()
+            if row is None:
+                break
+            url, digest = row
+            self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self._drop_unreferenced(digest)
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            self.stats['evicted'] += 1
+
+    def size(self):
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def _routable(self, request):
+        return request.method == 'GET' and request.resource_type in CACHED_RESOURCE_TYPES
+
+    @staticmethod
+    def _fulfill_args(entry):
+        return {'status': entry.status, 'headers': entry.headers, 'body': entry.body}
+
+    def route_handler(self):
+        """Handler for the sync Playwright API: context.route('**/*', cache.route_handler())."""
+        def handle(route):
+            request = route.request
+            if not self._routable(request):
+                return route.abort() if self.offline else route.continue_()
+            entry = self.lookup(request.url)
+            if self.offline:
+                self.stats['hit' if entry else 'miss'] += 1
+                return route.fulfill(**self._fulfill_args(entry)) if entry else route.abort()
+            response = route.fetch(headers={**request.headers, **self.conditional_headers(entry)})
+            if response.status == 304 and entry is not None:
+                self.revalidated(entry, response.headers)
+                return route.fulfill(**self._fulfill_args(entry))
+            self.stats['miss'] += 1
+            body = response.body()
+            if response.status == 200:
+                self.store(request.url, response.status, response.headers, body)
+            route.fulfill(response=response, body=body)
+        return handle
+
+    def async_route_handler(self):
+        """Handler for the async Playwright API: await context.route('**/*', cache.async_route_handler())."""
+        async def handle(route):
+            request = route.request
+            if not self._routable(request):
+                return await (route.abort() if self.offline else route.continue_())
+            entry = self.lookup(request.url)
+            if self.offline:
+                self.stats['hit' if entry else 'miss'] += 1
+                return await (route.fulfill(**self._fulfill_args(entry)) if entry else route.abort())
+            response = await route.fetch(headers={**request.headers, **self.conditional_headers(entry)})
+            if response.status == 304 and entry is not None:
+                self.revalidated(entry, response.headers)
+                return await route.fulfill(**self._fulfill_args(entry))
+            self.stats['miss'] += 1
+            body = await response.body()
+            if response.status == 200:
+                self.store(request.url, response.status, response.headers, body)
+            await route.fulfill(response=response, body=body)
+        return handle
+
+    def summary(self):
+        return ', '.join(f"{name} {count}" for name, count in sorted(self.stats.items())) or 'unused'
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python http_cache.py <cache_dir>")
+        sys.exit(1)
+
+    cache = HttpCache(sys.argv[1])
+    entries = cache.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    print(f"{entries} cached URLs, {cache.size() / (1024 * 1024):.1f} MB in {sys.argv[1]}")
@@ -1,130 +1,286 @@
 import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import boto3
+from botocore.config import Config
 from playwright.sync_api import sync_playwright
-import spacy
-from collections import Counter
-
-# Load the English NLP model
-nlp = spacy.load("en_core_web_sm")
-
-def extract_tags(text, max_tags=5):
-    # Process the text with spaCy
-    doc = nlp(text)
-    
-    # Extract named entities
-    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in ['ORG', 'PERSON', 'GPE', 'PRODUCT']]
-    
-    # Extract noun phrases
-    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
-    
-    # Combine entities and noun phrases
-    potential_tags = entities + noun_phrases
-    
-    # Count occurrences and get the most common tags
-    tag_counts = Counter(potential_tags)
-    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
-    
-    return top_tags
-
-def extract_announcements(page):
-    announcements = []
-    elements = page.query_selector_all('.element.level3')
-    for element in elements:
-        authority = element.query_selector('.title .helvetica-light')
-        title = element.query_selector('.subhead-2.cl-black.level3')
-        date = element.query_selector('.date-1.cl-gray9')
-        link = element.get_attribute('href')
-
-        # Extract content from the linked page
-        content = ""
-        if link:
-            try:
-                content_page = page.context.new_page()
-                content_page.goto(f"https://www.adgm.com{link}", wait_until="networkidle")
-                
-                # Try different selectors for content
-                selectors = [
-                    '.announcement-content',
-                    '.content-area',
-                    'main',
-                    'article',
-                    'body'  # Fallback to entire body if specific content area not found
-                ]
-                
-                for selector in selectors:
-                    content_element = content_page.query_selector(selector)
-                    if content_element:
-                        content = content_element.inner_text()
-                        if content.strip():
-                            break
-
-                if not content.strip():
-                    print(f"Warning: Empty content for link: https://www.adgm.com{link}")
-            except Exception as e:
-                print(f"Error extracting content from https://www.adgm.com{link}: {str(e)}")
-            finally:
-                content_page.close()
-
-        title_text = title.inner_text() if title else ''
-        content_text = content
-
-        # Extract tags from title and content
-        tags = extract_tags(title_text + " " + content_text)
-
-        announcement = {
-            "title": title_text,
-            "date": date.inner_text() if date else '',
-            "source": authority.inner_text() if authority else 'ADGM',
-            "content": content_text,
-            "tags": tags,
-            "url": f"https://www.adgm.com{link}" if link else ''
-        }
-        announcements.append(announcement)
-    return announcements
-
-def save_announcements(announcements, bucket_name, file_name):
-    s3 = boto3.client('s3')
-    data = {"announcements": announcements}
-    json_data = json.dumps(data, ensure_ascii=False)
-    s3.put_object(Bucket=bucket_name, Key=file_name, Body=json_data)
-    print(f"Saved {len(announcements)} announcements to s3://{bucket_name}/{file_name}")
+# Packaged next to this file in lambda_function.zip
+from crawl_pipeline import CrawlPipeline
+from dedup import Deduplicator
+from detail_fetcher import DetailFetcher
+from lazy_resources import register, warm_up
+from listing_fields import ADGM_BASE_URL, ADGM_FIELDS, ADGM_ITEMS, extract_items
+from politeness import SCHEDULER
+from record_sink import MemorySink
+import tagging  # noqa: F401 (registers the spaCy model for warm_up)
 
-def lambda_handler(event, context):
-    with sync_playwright() as playwright:
-        browser = playwright.chromium.launch()
-        context = browser.new_context()
+LISTING_URL = f"{ADGM_BASE_URL}/media/announcements"
+
+BUCKET_NAME = os.environ.get('BUCKET_NAME', 'crypto-crawler-bucket321')
+RESULT_KEY = 'adgm_announcements.json'
+# Where fan-out workers leave their partial results
+PARTS_PREFIX = 'runs/'
+# Listing pages handed to each worker invocation, and workers running at once
+PAGES_PER_WORKER = int(os.environ.get('PAGES_PER_WORKER', '1'))
+FAN_OUT_CONCURRENCY = int(os.environ.get('FAN_OUT_CONCURRENCY', '8'))
+# The function's configured timeout in seconds; a worker invocation is waited on this long at most
+LAMBDA_TIMEOUT = int(os.environ.get('LAMBDA_TIMEOUT', '900'))
+# Seconds a coordinator keeps back from its own timeout to merge the parts it has
+MERGE_RESERVE = int(os.environ.get('MERGE_RESERVE', '60'))
+# Start the browser and load the model during init, not on the first event
+LAMBDA_WARM_UP = os.environ.get('LAMBDA_WARM_UP', '1') != '0'
+
+# Kept for as long as the execution environment stays warm
+playwright = register('playwright', lambda: sync_playwright().start())
+browser = register('chromium', lambda: playwright.get().chromium.launch())
+fetcher = register('detail_fetcher', lambda: DetailFetcher().start())
+s3_client = register('s3', lambda: boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL')))
+
+def live_browser():
+    if not browser.get().is_connected():
+        # The browser died in an earlier invocation
+        browser.reset()
+    return browser.get()
+
+def list_announcements(page):
+    # Every field of every item in one round trip to the browser
+    items = extract_items(page, ADGM_ITEMS, ADGM_FIELDS)
+    return [(item['title'], item['date'], item['source'], f"{ADGM_BASE_URL}{item['link']}" if item['link'] else None)
+            for item in items]
+
+def list_pages(max_pages):
+    """Yield (page_number, listed) for the first max_pages listing pages."""
+    context = live_browser().new_context()
+    try:
         page = context.new_page()
-        page.goto("https://www.adgm.com/media/announcements")
+        with SCHEDULER.slot(LISTING_URL) as slot:
+            response = page.goto(LISTING_URL)
+            slot.report(response.status if response else None, page.title())
+        # Detail pages are requested with the cookies the listing page set
+        fetcher.get().share_session(context)
 
-        all_announcements = []
         page_number = 1
-        max_pages = 1  # Set a maximum number of pages to scrape
-
         while page_number <= max_pages:
-            print(f"Scraping page {page_number}")
-            try:
-                announcements = extract_announcements(page)
-                all_announcements.extend(announcements)
-                
-                next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
+            print(f"Listing page {page_number}")
+            yield page_number, list_announcements(page)
+
+            next_button = page.query_selector('.bottom-nav__item_revert:not(.disabled)')
+            if not next_button or page_number == max_pages:
                 if not next_button:
                     print("Reached the last page")
-                    break
-                
+                break
+            with SCHEDULER.slot(LISTING_URL) as slot:
                 next_button.click()
                 page_number += 1
                 page.wait_for_load_state('networkidle')
-            except Exception as e:
-                print(f"An error occurred on page {page_number}: {str(e)}")
-                break
+                slot.report(text=page.title())
+    finally:
+        context.close()
+
+def build_records(pages, sink):
+    """Fetch and tag the announcements of (page_number, listed) pairs into sink, in page order.
+
+    pages can be a generator still listing them; if it fails, the pages it
+    already yielded are finished before the error is raised.
+    """
+    # Lambda has no /dev/shm for a process pool, so spaCy runs on a thread
+    try:
+        with CrawlPipeline(fetcher.get(), sink, tag_workers=0) as pipeline:
+            for page_number, listed in pages:
+                pipeline.submit(page_number, listed)
+    except Exception:
+        # Don't keep the detail browser of a failed crawl warm; the next page that needs it starts a new one
+        fetcher.get().release_browser()
+        raise
+
+def save_announcements(announcements, bucket_name, file_name, s3):
+    data = {"announcements": announcements}
+    json_data = json.dumps(data, ensure_ascii=False)
+    s3.put_object(Bucket=bucket_name, Key=file_name, Body=json_data)
+    print(f"Saved {len(announcements)} announcements to s3://{bucket_name}/{file_name}")
 
-        browser.close()
+def part_key(run_id, part):
+    return f"{PARTS_PREFIX}{run_id}/part-{part:05d}.jsonl"
 
-    bucket_name = 'crypto-crawler-bucket321'
-    file_name = 'adgm_announcements.json'
-    save_announcements(all_announcements, bucket_name, file_name)
+def crawl(event, s3):
+    """Crawl max_pages listing pages in this invocation."""
+    sink = MemorySink()
+    try:
+        build_records(list_pages(event.get('max_pages', 1)), sink)
+    except Exception as e:
+        print(f"An error occurred on page {sink.page + 1}: {str(e)}")
+    with Deduplicator.from_records(sink.records()) as canonical:
+        all_announcements = list(canonical.records())
 
+    save_announcements(all_announcements, event.get('bucket', BUCKET_NAME), event.get('key', RESULT_KEY), s3)
     return {
         'statusCode': 200,
         'body': json.dumps(f'Scraped and saved {len(all_announcements)} announcements')
-    }
\ No newline at end of file
+    }
+
+def work(event, s3):
+    """Fetch and tag one batch of listing pages and leave the records as a part of the run."""
+    pages = sorted((int(page_number), [tuple(entry) for entry in listed])
+                   for page_number, listed in event['pages'].items())
+    sink = MemorySink()
+    build_records(pages, sink)
+    records = list(sink.records())
+    key = part_key(event['run_id'], event['part'])
+    body = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+    s3.put_object(Bucket=event.get('bucket', BUCKET_NAME), Key=key, Body=body.encode('utf-8'))
+    print(f"Saved part {event['part']} ({len(records)} announcements) to {key}")
+    return {'statusCode': 200, 'part': event['part'], 'key': key, 'records': len(records)}
+
+def merge_parts(run_id, bucket, key, s3, expected=None):
+    """Merge the parts a run's workers left into one snapshot at key; returns (records, missing parts)."""
+    prefix = f"{PARTS_PREFIX}{run_id}/"
+    keys = []
+    token = None
+    while True:
+        listing = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, **({'ContinuationToken': token} if token else {}))
+        keys.extend(item['Key'] for item in listing.get('Contents', []))
+        if not listing.get('IsTruncated'):
+            break
+        token = listing['NextContinuationToken']
+
+    # An announcement published mid-crawl pushes the last one on a listing
+    # page onto the next, so it can be listed twice
+    with Deduplicator() as canonical:
+        # Part numbers follow the listing order
+        for part in sorted(keys):
+            body = s3.get_object(Bucket=bucket, Key=part)['Body'].read().decode('utf-8')
+            canonical.add_all(json.loads(line) for line in body.splitlines() if line.strip())
+        announcements = list(canonical.records())
+    missing = sorted(set(range(expected)) - {int(part[len(prefix) + 5:-6]) for part in keys}) if expected else []
+    save_announcements(announcements, bucket, key, s3)
+    return announcements, missing
+
+def lambda_invoker(function_name):
+    """Invoke this function synchronously as a worker; returns the worker's response.
+
+    invoke(event, timeout) waits at most timeout seconds (by default as long
+    as a worker may run) and never retries on its own: a timed-out or
+    dropped call would run the part again while the first worker is still
+    at it. run_worker decides about retries.
+    """
+    session = boto3.session.Session()
+    lock = threading.Lock()
+
+    def invoke(event, timeout=None):
+        timeout = LAMBDA_TIMEOUT + 10 if timeout is None else max(1, timeout)
+        with lock:
+            # The read timeout is fixed per client; sessions are not thread-safe
+            client = session.client('lambda', config=Config(read_timeout=timeout, retries={'max_attempts': 0}))
+        response = client.invoke(FunctionName=function_name, Payload=json.dumps(event).encode('utf-8'))
+        payload = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            raise RuntimeError(payload.get('errorMessage', response['FunctionError']))
+        return payload
+    return invoke
+
+def coordinate(event, s3, invoke, time_left=lambda: None):
+    """List the pages here and fan their detail pages and tagging out to worker invocations.
+
+    Every PAGES_PER_WORKER listing pages go to a worker as soon as they are
+    listed. A failed worker is invoked once more; parts that still fail are
+    left out of the merged snapshot and reported as missing.
+
+    time_left() gives the seconds this invocation may still spend before it
+    has to merge (None for no limit). Listing, every worker call and its
+    retry stop when it runs out. The parts that are in by then are merged,
+    and a worker that finishes later can be picked up with mode=merge.
+    """
+    run_id = event.get('run_id') or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    bucket = event.get('bucket', BUCKET_NAME)
+    pages_per_worker = event.get('pages_per_worker', PAGES_PER_WORKER)
+
+    def out_of_time():
+        budget = time_left()
+        return budget is not None and budget <= 0
+
+    def run_worker(worker_event):
+        try:
+            return invoke(worker_event, time_left())
+        except Exception as e:
+            if out_of_time():
+                raise
+            print(f"Worker for part {worker_event['part']} failed, retrying: {str(e)}")
+            return invoke(worker_event, time_left())
+
+    futures = []
+    batch = {}
+    executor = ThreadPoolExecutor(max_workers=FAN_OUT_CONCURRENCY)
+
+    def dispatch():
+        worker_event = {'mode': 'worker', 'run_id': run_id, 'bucket': bucket, 'part': len(futures),
+                        'pages': dict(batch)}
+        futures.append(executor.submit(run_worker, worker_event))
+        batch.clear()
+
+    try:
+        for page_number, listed in list_pages(event.get('max_pages', 1)):
+            batch[page_number] = listed
+            if len(batch) >= pages_per_worker:
+                dispatch()
+            if out_of_time():
+                print(f"Out of time after listing page {page_number}")
+                break
+    except Exception as e:
+        print(f"An error occurred while listing: {str(e)}")
+    if batch:
+        dispatch()
+
+    try:
+        for future in futures:
+            budget = time_left()
+            try:
+                future.result(timeout=None if budget is None else max(0, budget))
+            except Exception as e:
+                print(f"A worker failed: {str(e) or type(e).__name__}")
+    finally:
+        # Workers still running are left to write their parts for a later merge
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    key = event.get('key') or f"adgm_announcements_{run_id}.json"
+    announcements, missing = merge_parts(run_id, bucket, key, s3, expected=len(futures))
+    return {
+        'statusCode': 200 if not missing else 206,
+        'run_id': run_id,
+        'key': key,
+        'parts': len(futures),
+        'missing_parts': missing,
+        'body': json.dumps(f'Scraped and saved {len(announcements)} announcements from {len(futures)} workers')
+    }
+
+def lambda_handler(event, context, s3=None, invoke=None):
+    """Entry point. event['mode'] picks what this invocation does:
+
+    crawl (default): list, fetch and tag max_pages pages here.
+    coordinator: list the pages and fan them out to worker invocations.
+    worker: fetch and tag the pages in event['pages'] into a part of a run.
+    merge: merge the parts of event['run_id'] again, e.g. after re-running a failed worker.
+
+    s3 and invoke stand in for the S3 client and worker invocations when
+    the handlers run in-process (see run_local.py).
+    """
+    event = event or {}
+    s3 = s3 or s3_client.get()
+    mode = event.get('mode', 'crawl')
+    if mode == 'coordinator':
+        time_left = ((lambda: context.get_remaining_time_in_millis() / 1000 - MERGE_RESERVE)
+                     if context is not None else lambda: None)
+        return coordinate(event, s3, invoke or lambda_invoker(context.function_name), time_left)
+    if mode == 'worker':
+        return work(event, s3)
+    if mode == 'merge':
+        key = event.get('key') or f"adgm_announcements_{event['run_id']}.json"
+        announcements, _ = merge_parts(event['run_id'], event.get('bucket', BUCKET_NAME), key, s3)
+        return {'statusCode': 200, 'key': key, 'body': json.dumps(f'Merged {len(announcements)} announcements')}
+    return crawl(event, s3)
+
+if LAMBDA_WARM_UP:
+    # Init runs once per execution environment; warm invocations reuse all of it
+    warm_up()
@@ -0,0 +1,48 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The handler's modules sit one directory up (they are zipped next to it)
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Lambda handlers in-process against a local S3 stand-in.")
+    parser.add_argument('--mode', choices=['crawl', 'coordinator'], default='coordinator')
+    parser.add_argument('--s3-dir', default='local_s3', help="Directory standing in for S3")
+    parser.add_argument('--pages', type=int, default=2, help="Listing pages to crawl (max_pages)")
+    parser.add_argument('--pages-per-worker', type=int, default=1)
+    parser.add_argument('--invocations', type=int, default=2,
+                        help="Events to send one after another, to see warm invocations")
+    parser.add_argument('--base-url', help="Crawl this site (e.g. a fixture_server.py URL) instead of ADGM")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.base_url:
+        os.environ['ADGM_BASE_URL'] = args.base_url
+    # Time init the way Lambda would: the import is the cold start
+    started = time.perf_counter()
+    import crawler_lambda
+    from local_s3 import LocalS3
+    print(f"Init took {time.perf_counter() - started:.2f}s")
+
+    s3 = LocalS3(args.s3_dir)
+
+    def invoke(event, timeout=None):
+        # A worker invocation, in this process; JSON round trip as over the wire
+        return crawler_lambda.lambda_handler(json.loads(json.dumps(event)), None, s3=s3)
+
+    for number in range(args.invocations):
+        started = time.perf_counter()
+        response = crawler_lambda.lambda_handler({'mode': args.mode, 'max_pages': args.pages,
+                                                  'pages_per_worker': args.pages_per_worker}, None,
+                                                 s3=s3, invoke=invoke)
+        print(f"Invocation {number + 1} took {time.perf_counter() - started:.2f}s: {json.dumps(response)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LazyResource:
+    """A model or network-fetched resource, built by loader on first get() and kept for the process.
+
+    Concurrent first calls wait for the one load rather than starting their
+    own; a loader that raises is tried again on the next get().
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.value = None
+        self.loaded = False
+        self.load_seconds = None
+
+    def get(self):
+        if self.loaded:
+            return self.value
+        with self.lock:
+            if not self.loaded:
+                started = time.perf_counter()
+                self.value = self.loader()
+                self.load_seconds = time.perf_counter() - started
+                self.loaded = True
+                logger.info(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+        return self.value
+
+    def set(self, value):
+        """Use value from now on instead of what loader would build (e.g. a cache a benchmark controls)."""
+        with self.lock:
+            self.value = value
+            self.loaded = True
+
+    def reset(self):
+        """Forget the loaded value (e.g. a browser that crashed) so the next get() loads it again."""
+        with self.lock:
+            self.value = None
+            self.loaded = False
+
+
+# Every resource registered in this process, by name
+REGISTRY = {}
+REGISTRY_LOCK = threading.Lock()
+
+
+def register(name, loader):
+    """The lazy resource called name, registering loader for it the first time."""
+    with REGISTRY_LOCK:
+        # A module run as a script and imported by name registers twice
+        if name not in REGISTRY:
+            REGISTRY[name] = LazyResource(name, loader)
+        return REGISTRY[name]
+
+
+def warm_up(names=None):
+    """Load the named resources (all registered ones by default) now; returns seconds per resource.
+
+    For servers and workers that would rather pay for the models before
+    their first request than during it.
+    """
+    timings = {}
+    for name in names or list(REGISTRY):
+        started = time.perf_counter()
+        REGISTRY[name].get()
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def summary():
+    return ', '.join(f"{name} {resource.load_seconds:.2f}s" if resource.loaded else f"{name} not loaded"
+                     for name, resource in sorted(REGISTRY.items())) or 'nothing registered'
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python lazy_resources.py <module> [...]")
+        sys.exit(1)
+
+    # Import the given modules and load everything they registered, e.g. to
+    # bake models and NLTK data into an image before it serves traffic
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for module in sys.argv[1:]:
+        __import__(module)
+    for name, seconds in warm_up().items():
+        print(f"{name}: {seconds:.2f}s")
@@ -0,0 +1,78 @@
+# Listing selectors of every crawled site. A field is a plain dict, so it
+# can be handed to the browser as is: the selector of an element within the
+# item (None for the item itself), the attribute to read from it (None for
+# its inner text), a default for when either is missing, and whether to
+# strip the text.
+import os
+
+
+def text(selector, default='', strip=False):
+    """Field: inner text of the first match of selector within an item."""
+    return {'selector': selector, 'attribute': None, 'default': default, 'strip': strip}
+
+
+def attribute(name, selector=None, default=None):
+    """Field: an attribute of the item itself or of its first match of selector."""
+    return {'selector': selector, 'attribute': name, 'default': default, 'strip': False}
+
+
+# Every field of every item of the first item selector that matches, read
+# in the page so a listing costs one round trip instead of several per item
+EXTRACT_ITEMS = """([itemSelectors, fields]) => {
+    for (const itemSelector of itemSelectors) {
+        const items = document.querySelectorAll(itemSelector);
+        if (!items.length) continue;
+        return Array.from(items, item => {
+            const values = {};
+            for (const [name, field] of Object.entries(fields)) {
+                const target = field.selector ? item.querySelector(field.selector) : item;
+                let value = null;
+                if (target) value = field.attribute ? target.getAttribute(field.attribute) : target.innerText;
+                if (value === null || value === undefined) value = field.default;
+                else if (field.strip) value = value.trim();
+                values[name] = value;
+            }
+            return values;
+        });
+    }
+    return [];
+}"""
+
+
+def extract_items(page, item_selectors, fields):
+    """A dict of fields per item on a sync Playwright page, in page order."""
+    return page.evaluate(EXTRACT_ITEMS, [list(item_selectors), fields])
+
+
+async def async_extract_items(page, item_selectors, fields):
+    """A dict of fields per item on an async Playwright page, in page order."""
+    return await page.evaluate(EXTRACT_ITEMS, [list(item_selectors), fields])
+
+
+# Site root, overridable to crawl a local fixture server
+ADGM_BASE_URL = os.environ.get('ADGM_BASE_URL', 'https://www.adgm.com')
+# Hosts the lean profile treats as first-party
+ADGM_DOMAINS = ['adgm.com']
+
+ADGM_ITEMS = ['.element.level3']
+ADGM_FIELDS = {
+    'title': text('.subhead-2.cl-black.level3'),
+    'date': text('.date-1.cl-gray9'),
+    'source': text('.title .helvetica-light', 'ADGM'),
+    'link': attribute('href'),
+}
+
+VARA_ITEMS = ['.news-item']
+VARA_FIELDS = {
+    'title': text('h3', "No title found", strip=True),
+    'date': text('.date', "No date found", strip=True),
+    'content': text('.excerpt', "No content found", strip=True),
+    'link': attribute('href', 'a'),
+}
+
+# FAB has used both class names for its offer cards
+FAB_ITEMS = ['.offer-item', '.card-offer-item']
+FAB_FIELDS = {
+    'title': text('.offer-title', "No title found", strip=True),
+    'description': text('.offer-description', "No description found", strip=True),
+}
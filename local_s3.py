@@ -0,0 +1,74 @@
+import io
+import os
+import shutil
+import sys
+from botocore.exceptions import ClientError
+
+
+class LocalS3:
+    """Directory standing in for the S3 client calls the crawlers make.
+
+    Each bucket is a subdirectory and each key a file under it, so handlers
+    can run in-process (or in tests) without AWS; errors are raised as the
+    ClientErrors boto3 would raise. For a stand-in that speaks the S3 API
+    over HTTP, point S3_ENDPOINT_URL at it instead.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, bucket, key):
+        path = os.path.abspath(os.path.join(self.directory, bucket, key))
+        if not path.startswith(os.path.abspath(os.path.join(self.directory, bucket)) + os.sep):
+            raise ClientError({'Error': {'Code': 'InvalidArgument', 'Message': f"Bad key {key}"}}, 'PutObject')
+        return path
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(Body.encode('utf-8') if isinstance(Body, str) else Body)
+        os.replace(path + '.tmp', path)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        try:
+            with open(self._path(Bucket, Key), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': f"No such key {Key}"}}, 'GetObject')
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        root = os.path.join(self.directory, Bucket)
+        contents = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, root).replace(os.sep, '/')
+                if key.startswith(Prefix) and not key.endswith('.tmp'):
+                    contents.append({'Key': key, 'Size': os.path.getsize(path)})
+        contents.sort(key=lambda item: item['Key'])
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': False}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        for item in Delete['Objects']:
+            try:
+                os.remove(self._path(Bucket, item['Key']))
+            except FileNotFoundError:
+                pass
+        return {'Deleted': [{'Key': item['Key']} for item in Delete['Objects']]}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python local_s3.py <directory> <bucket>")
+        sys.exit(1)
+
+    for item in LocalS3(sys.argv[1]).list_objects_v2(Bucket=sys.argv[2])['Contents']:
+        print(f"{item['Size']:>10}  {item['Key']}")
@@ -0,0 +1,206 @@
+from bisect import bisect_left
+import threading
+import time
+
+# Latency buckets in seconds, from a cached tag lookup to a cold content scan
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Result-count buckets for /search totals
+RESULT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 250, 500, 1000, 5000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [(name, value) for name, value in zip(names, values)] + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """A named family of samples keyed by label values."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value, ()) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, key, value, extra in self.samples():
+            lines.append(f'{name}{_format_labels(self.labels, key, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative bucket counts plus sum and count, as Prometheus expects."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # One bisect and three additions, so timing every request stays cheap
+        position = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Per-bucket counts followed by the sum and the total count
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[position] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            snapshot = [(key, list(counts)) for key, counts in sorted(self.values.items())]
+        samples = []
+        for key, counts in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key, cumulative, (('le', _format_value(bound)),)))
+            samples.append((f'{self.name}_sum', key, counts[-2], ()))
+            samples.append((f'{self.name}_count', key, counts[-1], ()))
+        return samples
+
+
+class Registry:
+    """Metrics of one process, rendered in the Prometheus text format.
+
+    Collectors are called on every scrape, for values such as cache statistics
+    that are cheaper to read on demand than to track on every request.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram('search_request_duration_seconds',
+                                     'Time spent handling a request.', ('endpoint', 'mode', 'status'))
+STAGE_SECONDS = REGISTRY.histogram('search_stage_duration_seconds',
+                                   'Time spent in each stage of a request.', ('endpoint', 'stage'))
+RESULT_COUNT = REGISTRY.histogram('search_results', 'Number of announcements matching a search.',
+                                  ('mode',), RESULT_BUCKETS)
+CORPUS_ANNOUNCEMENTS = REGISTRY.gauge('corpus_announcements', 'Announcements in the loaded corpus.')
+CORPUS_LOADED = REGISTRY.gauge('corpus_loaded_timestamp_seconds', 'Unix time the loaded corpus was swapped in.')
+INDEX_BUILD_SECONDS = REGISTRY.histogram('index_build_duration_seconds',
+                                         'Time spent loading or building an index.', ('index', 'source'))
+CORPUS_REFRESHES = REGISTRY.counter('corpus_refresh_total', 'Checks for a new corpus by result.', ('result',))
+CACHE_HITS = REGISTRY.gauge('cache_hits', 'Hits of in-process caches.', ('cache',))
+CACHE_MISSES = REGISTRY.gauge('cache_misses', 'Misses of in-process caches.', ('cache',))
+
+
+def watch_cache(name, cached_function):
+    """Export the hit and miss counts of a functools.lru_cache function."""
+    def collect():
+        info = cached_function.cache_info()
+        CACHE_HITS.set(info.hits, cache=name)
+        CACHE_MISSES.set(info.misses, cache=name)
+    REGISTRY.add_collector(collect)
+
+
+def record_corpus(records, seconds, source):
+    """Record a newly swapped-in corpus: its size and how long its fuzzy index took to load."""
+    INDEX_BUILD_SECONDS.observe(seconds, index='fuzzy', source=source)
+    CORPUS_ANNOUNCEMENTS.set(records)
+    CORPUS_LOADED.set(time.time())
+
+
+def instrument(app):
+    """Time every request of a Flask app and serve the registry at /metrics.
+
+    Handlers add their own stages to g.timings (a dict of stage name to
+    seconds) and set g.mode and g.result_count; they are recorded once the
+    response is ready.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.started = time.perf_counter()
+        g.timings = {}
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('started', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+        endpoint = request.endpoint or 'unknown'
+        mode = g.get('mode', '')
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, mode=mode,
+                                status=response.status_code)
+        for stage, seconds in g.get('timings', {}).items():
+            STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+        if g.get('result_count') is not None:
+            RESULT_COUNT.observe(g.result_count, mode=mode)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    return app
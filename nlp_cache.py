@@ -0,0 +1,164 @@
+from collections import Counter
+import importlib.metadata
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from crawl_state import text_hash
+
+logger = logging.getLogger(__name__)
+
+# SQLite file of model output for texts seen before; empty disables it
+NLP_CACHE_PATH = os.environ.get('NLP_CACHE_PATH', 'nlp_cache.db')
+NLP_CACHE_MAX_MB = int(os.environ.get('NLP_CACHE_MAX_MB', '256'))
+
+# Stale entries are evicted this many at a time
+EVICT_BATCH = 256
+
+
+def model_id(package):
+    """Name and version of an installed spaCy model package, e.g. en_core_web_sm-3.7.1.
+
+    Read from the package metadata, so cache hits never need the model loaded.
+    """
+    try:
+        return f"{package}-{importlib.metadata.version(package)}"
+    except importlib.metadata.PackageNotFoundError:
+        return package
+
+
+class NlpCache:
+    """Persistent memo of what the NLP models made of each text.
+
+    Entries are keyed by a hash of the whitespace-normalized text, the kind
+    of result (tags, entities, lemmas, summary; with whatever settings shape
+    it) and the model name and version, so a model upgrade misses instead of
+    serving stale output. Values are stored as JSON. When the values outgrow
+    max_bytes the least recently used entries are dropped. Safe to share
+    between threads; separate processes can open the same file.
+    """
+
+    def __init__(self, path=NLP_CACHE_PATH, max_bytes=NLP_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                model TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+        """)
+        self.db.commit()
+
+    @classmethod
+    def from_environment(cls):
+        """The cache at NLP_CACHE_PATH, or None when it is disabled or cannot be opened."""
+        if not NLP_CACHE_PATH:
+            return None
+        try:
+            return cls(NLP_CACHE_PATH)
+        except sqlite3.Error as e:
+            # e.g. a read-only filesystem such as Lambda's
+            logger.warning(f"NLP cache disabled, cannot open {NLP_CACHE_PATH}: {str(e)}")
+            return None
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    @staticmethod
+    def key(kind, model, text):
+        return text_hash(kind, model, text)
+
+    def get_many(self, kind, model, texts):
+        """Cached values of texts, in order, with None for the ones not cached."""
+        keys = [self.key(kind, model, text) for text in texts]
+        found = {}
+        with self.lock:
+            # Stay well under SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                found.update(self.db.execute(
+                    f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+            if found:
+                now = time.time()
+                self.db.executemany("UPDATE results SET last_used = ? WHERE key = ?",
+                                    [(now, key) for key in found])
+                self.db.commit()
+        self.stats['hit'] += len(found)
+        self.stats['miss'] += len(keys) - len(found)
+        return [json.loads(found[key]) if key in found else None for key in keys]
+
+    def put_many(self, kind, model, texts, values):
+        """Store a value per text and evict old entries if the cache is over size."""
+        now = time.time()
+        rows = []
+        for text, value in zip(texts, values):
+            value = json.dumps(value, ensure_ascii=False)
+            rows.append((self.key(kind, model, text), kind, model, value, len(value.encode('utf-8')), now))
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self.db.commit()
+        self.stats['stored'] += len(rows)
+
+    def memoize(self, kind, model, texts, compute):
+        """compute(texts) for every text, running compute only on the ones not cached.
+
+        compute takes a list of texts and returns their values in order, so
+        the misses still go through the model as one batch. Values come
+        back as they round-trip through JSON (tuples become lists).
+        """
+        texts = list(texts)
+        values = self.get_many(kind, model, texts)
+        missing = [position for position, value in enumerate(values) if value is None]
+        if missing:
+            computed = compute([texts[position] for position in missing])
+            self.put_many(kind, model, [texts[position] for position in missing], computed)
+            for position, value in zip(missing, computed):
+                values[position] = json.loads(json.dumps(value, ensure_ascii=False))
+        return values
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.db.execute("SELECT key, size FROM results ORDER BY last_used LIMIT ?",
+                                   (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            self.db.executemany("DELETE FROM results WHERE key = ?", [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+            self.stats['evicted'] += len(rows)
+
+    def size(self):
+        with self.lock:
+            return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def summary(self):
+        return ', '.join(f"{name} {count}" for name, count in sorted(self.stats.items())) or 'unused'
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python nlp_cache.py [nlp_cache.db]")
+        sys.exit(1)
+
+    cache = NlpCache(sys.argv[1] if len(sys.argv) == 2 else NLP_CACHE_PATH)
+    for kind, model, count, size in cache.db.execute(
+            "SELECT kind, model, COUNT(*), SUM(size) FROM results GROUP BY kind, model ORDER BY kind, model"):
+        print(f"{kind} ({model}): {count} entries, {size / 1024:.1f} KB")
+    print(f"{len(cache)} entries, {cache.size() / (1024 * 1024):.1f} MB in {cache.path}")
@@ -0,0 +1,152 @@
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 'full' loads pages the way a visitor's browser does; 'lean' blocks what the
+# extractors never read and stops waiting once the DOM is parsed
+CRAWL_PROFILE = os.environ.get('CRAWL_PROFILE', 'full')
+
+# Run the crawlers' browsers without a window (set to 1 on servers and in benchmarks)
+CRAWL_HEADLESS = os.environ.get('CRAWL_HEADLESS', '0') != '0'
+
+# Resource types the lean profile never downloads
+BLOCKED_RESOURCE_TYPES = {'image', 'media', 'font', 'texttrack', 'manifest'}
+
+# Load state page.goto() waits for under each profile
+LOAD_STATES = {'full': 'load', 'lean': 'domcontentloaded'}
+
+# Milliseconds to wait for more lazy-loaded items after scrolling to the bottom
+# (the first items get SCROLL_FIRST_ITEMS_MS), and scrolls made at most
+SCROLL_SETTLE_MS = int(os.environ.get('SCROLL_SETTLE_MS', '2000'))
+SCROLL_FIRST_ITEMS_MS = 10000
+SCROLL_MAX_ROUNDS = int(os.environ.get('SCROLL_MAX_ROUNDS', '50'))
+
+# Scroll to the bottom, then poll until there are more than previous items or
+# the wait runs out; resolves to the item count either way
+SCROLL_AND_COUNT = """async ([selector, previous, wait]) => {
+    const count = () => document.querySelectorAll(selector).length;
+    window.scrollTo(0, document.body.scrollHeight);
+    const deadline = Date.now() + wait;
+    while (count() <= previous && Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, 100));
+    }
+    return count();
+}"""
+
+
+def load_state(profile=CRAWL_PROFILE):
+    return LOAD_STATES.get(profile, 'load')
+
+
+def is_first_party(url, domains):
+    host = urlsplit(url).hostname or ''
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+def is_blocked(request, domains):
+    """Whether the lean profile drops a request: heavy resource types and anything
+    third-party (analytics, ads, widgets) other than a top-level navigation."""
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    if is_first_party(request.url, domains):
+        return False
+    return not (request.is_navigation_request() and request.frame.parent_frame is None)
+
+
+def lean_route_handler(domains):
+    """Route handler for the sync API. Requests it lets through fall back to
+    any handler registered earlier (such as the HTTP cache)."""
+    def handle(route):
+        if is_blocked(route.request, domains):
+            route.abort()
+        else:
+            route.fallback()
+    return handle
+
+
+def async_lean_route_handler(domains):
+    """Route handler for the async API; see lean_route_handler."""
+    async def handle(route):
+        if is_blocked(route.request, domains):
+            await route.abort()
+        else:
+            await route.fallback()
+    return handle
+
+
+def apply_profile(context, domains, profile=CRAWL_PROFILE):
+    """Install the request blocking of profile on a sync browser context.
+
+    Register this after any other routes: Playwright runs the most recently
+    registered handler first.
+    """
+    if profile == 'lean':
+        context.route('**/*', lean_route_handler(domains))
+
+
+async def async_apply_profile(context, domains, profile=CRAWL_PROFILE):
+    if profile == 'lean':
+        await context.route('**/*', async_lean_route_handler(domains))
+
+
+def first_item_html(page, item_selector):
+    """outerHTML of the first listing item, to tell when a new page of items has replaced it."""
+    item = page.query_selector(item_selector)
+    return item.evaluate('element => element.outerHTML') if item else None
+
+
+def wait_for_new_listing(page, item_selector, previous, timeout=30000):
+    """Wait until the listing shows items other than the ones whose first item was previous."""
+    page.wait_for_function(
+        """([selector, previous]) => {
+            const first = document.querySelector(selector);
+            return first !== null && first.outerHTML !== previous;
+        }""",
+        arg=[item_selector, previous], timeout=timeout)
+
+
+async def async_first_item_html(page, item_selector):
+    item = await page.query_selector(item_selector)
+    return await item.evaluate('element => element.outerHTML') if item else None
+
+
+async def async_wait_for_new_listing(page, item_selector, previous, timeout=30000):
+    await page.wait_for_function(
+        """([selector, previous]) => {
+            const first = document.querySelector(selector);
+            return first !== null && first.outerHTML !== previous;
+        }""",
+        arg=[item_selector, previous], timeout=timeout)
+
+
+def scroll_to_end(page, item_selector, settle=SCROLL_SETTLE_MS, max_rounds=SCROLL_MAX_ROUNDS):
+    """Keep scrolling a lazy-loading page until its item count stops growing; returns the count.
+
+    Items already in the DOM before a scroll say nothing about the ones it
+    loads, so each round waits for the count to pass the previous one.
+    """
+    count = 0
+    for _ in range(max_rounds):
+        loaded = page.evaluate(SCROLL_AND_COUNT, [item_selector, count, settle if count else SCROLL_FIRST_ITEMS_MS])
+        if loaded <= count:
+            break
+        count = loaded
+    return count
+
+
+async def async_scroll_to_end(page, item_selector, settle=SCROLL_SETTLE_MS, max_rounds=SCROLL_MAX_ROUNDS):
+    count = 0
+    for _ in range(max_rounds):
+        loaded = await page.evaluate(SCROLL_AND_COUNT,
+                                     [item_selector, count, settle if count else SCROLL_FIRST_ITEMS_MS])
+        if loaded <= count:
+            break
+        count = loaded
+    return count
+
+
+def log_page_timing(what, started, profile=CRAWL_PROFILE):
+    logger.info(f"{what} ready in {time.perf_counter() - started:.2f}s ({profile} profile)")
@@ -1,32 +1,58 @@
-import spacy
 from gensim import corpora
 from gensim.models import LdaModel
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
-from transformers import pipeline
 import json
+import os
 import sys
 
-# Load spacy model
-nlp = spacy.load("en_core_web_sm")
+# The NLP cache lives in the crawler package one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lazy_resources import register
+from nlp_cache import NlpCache, model_id
+
+MODEL_NAME = "en_core_web_sm"
+
+def load_model():
+    import spacy
+    return spacy.load(MODEL_NAME)
+
+# Spacy model, loaded on the first texts the cache does not have
+nlp = register(f"spacy:{MODEL_NAME}:full", load_model)
+
+# Lemmas, entities and summaries of texts processed before (NLP_CACHE_PATH)
+cache = NlpCache.from_environment()
+
+def analyze_text(doc):
+    return {
+        "lemmas": [token.lemma_ for token in doc if not token.is_stop and not token.is_punct],
+        "entities": [(ent.text, ent.label_) for ent in doc.ents]
+    }
+
+# Function to run spaCy once over many texts, skipping the ones it has seen
+def analyze_texts(texts):
+    def analyze(texts):
+        return [analyze_text(doc) for doc in nlp.get().pipe(texts)]
+
+    texts = list(texts)
+    if cache is None:
+        return analyze(texts)
+    return cache.memoize("lemmas+entities", model_id(MODEL_NAME), texts, analyze)
 
 # Function to preprocess text
 def preprocess_text(text):
-    doc = nlp(text)
-    tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct]
+    tokens = analyze_texts([text])[0]["lemmas"]
     print("Tokens:", tokens)  # Debug print
     return ' '.join(tokens)
 
 # Function to extract entities from text
 def extract_entities(text):
-    doc = nlp(text)
-    entities = [(ent.text, ent.label_) for ent in doc.ents]
-    return entities
+    return [tuple(entity) for entity in analyze_texts([text])[0]["entities"]]
 
 # Function to perform topic modeling
 def perform_topic_modeling(texts, num_topics=5):
     # Tokenize and preprocess each announcement
-    tokenized_texts = [preprocess_text(text).split() for text in texts]
+    tokenized_texts = [analysis["lemmas"] for analysis in analyze_texts(texts)]
     tokenized_texts = [text for text in tokenized_texts if text]  # Filter out empty texts
     if not tokenized_texts:
         raise ValueError("No valid texts for topic modeling")
@@ -47,10 +73,27 @@ def find_similar_documents(texts):
     return similarity_matrix
 
 # Function to summarize text using HuggingFace's transformer pipeline
-summarizer = pipeline("summarization")
+# (the pipeline's default model, named so cached summaries can be keyed by it)
+SUMMARY_MODEL = "sshleifer/distilbart-cnn-12-6"
+
+def load_summarizer():
+    from transformers import pipeline
+    return pipeline("summarization", model=SUMMARY_MODEL)
+
+summarizer = register(f"transformers:{SUMMARY_MODEL}", load_summarizer)
+
+def summarize_texts(texts):
+    def summarize(texts):
+        summaries = summarizer.get()(texts, max_length=100, min_length=30, do_sample=False) if texts else []
+        return [summary['summary_text'] for summary in summaries]
+
+    texts = list(texts)
+    if cache is None:
+        return summarize(texts)
+    return cache.memoize("summary:30-100", SUMMARY_MODEL, texts, summarize)
+
 def summarize_text(text):
-    summary = summarizer(text, max_length=100, min_length=30, do_sample=False)
-    return summary[0]['summary_text']
+    return summarize_texts([text])[0]
 
 # Main function to run all tasks on a JSON file containing announcements
 def process_announcements(json_file):
@@ -64,8 +107,9 @@ def process_announcements(json_file):
     for text in texts:
         print(text)
     
-    # Preprocess texts
-    preprocessed_texts = [preprocess_text(text) for text in texts]
+    # Preprocess texts and extract entities in one spaCy pass (or cache scan)
+    analyses = analyze_texts(texts)
+    preprocessed_texts = [' '.join(analysis["lemmas"]) for analysis in analyses]
 
     # Print out preprocessed texts for debugging
     print("Preprocessed Texts:")
@@ -73,7 +117,7 @@ def process_announcements(json_file):
         print(text)
     
     # Extract entities for each announcement
-    all_entities = [extract_entities(text) for text in texts]
+    all_entities = [[tuple(entity) for entity in analysis["entities"]] for analysis in analyses]
 
     # Perform topic modeling
     topics = perform_topic_modeling(texts)
@@ -82,7 +126,7 @@ def process_announcements(json_file):
     similarity_matrix = find_similar_documents(texts)
 
     # Summarize each announcement
-    summaries = [summarize_text(text) for text in texts]
+    summaries = summarize_texts(texts)
 
     # Structure the results
     results = []
@@ -111,6 +155,8 @@ if __name__ == "__main__":
     print("Results:")
     for result in results:
         print(result)
+    if cache is not None:
+        print(f"NLP cache: {cache.summary()}")
     print("Topics:")
     for topic in topics:
         print(topic)
@@ -0,0 +1,290 @@
+import asyncio
+import atexit
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+from urllib.robotparser import RobotFileParser
+from crawl_state import CRAWL_STATE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Requests per second a host not seen before starts at, and the bounds adaptation keeps it in
+POLITE_RATE = float(os.environ.get('POLITE_RATE', '2'))
+POLITE_MIN_RATE = float(os.environ.get('POLITE_MIN_RATE', '0.05'))
+POLITE_MAX_RATE = float(os.environ.get('POLITE_MAX_RATE', '8'))
+# Requests a host may receive back to back after a quiet spell
+POLITE_BURST = float(os.environ.get('POLITE_BURST', '2'))
+# Requests in flight at once, against any single host and overall
+POLITE_PER_HOST = int(os.environ.get('POLITE_PER_HOST', '4'))
+POLITE_CONCURRENCY = int(os.environ.get('POLITE_CONCURRENCY', '16'))
+# Healthy responses in a row before a host's rate goes up a step; a sustained run, not a lucky streak
+POLITE_RAMP_AFTER = int(os.environ.get('POLITE_RAMP_AFTER', '20'))
+# JSON file each host's rate is kept in between runs, next to the crawl state ('' to keep rates in memory)
+POLITE_STATE_PATH = os.environ.get('POLITE_STATE_PATH',
+                                   os.path.join(os.path.dirname(CRAWL_STATE_PATH), 'host_rates.json'))
+# Read each host's robots.txt Crawl-delay and never go faster than it allows (set to 0 to skip)
+POLITE_ROBOTS = os.environ.get('POLITE_ROBOTS', '1') != '0'
+
+# Responses that mean a host wants us to slow down
+BACKOFF_STATUSES = {403, 429, 503}
+BACKOFF_FACTOR = 0.5
+RAMP_FACTOR = 1.1
+# How often a request waiting on a concurrency cap checks again
+POLL_SECONDS = 0.05
+# Seconds between writes of the rates file while a crawl runs
+SAVE_SECONDS = 30
+# How long a robots.txt Crawl-delay is trusted before it is read again
+ROBOTS_MAX_AGE = timedelta(days=1)
+ROBOTS_TIMEOUT = 10
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+def is_denied(status=None, text=''):
+    """Whether a response is the site pushing back: a throttling status or an "Access Denied" page.
+
+    text is the page title, or the start of the body where there is no title.
+    """
+    return status in BACKOFF_STATUSES or "Access Denied" in (text or '')
+
+
+def robots_crawl_delay(url):
+    """Seconds robots.txt asks every crawler to leave between requests to url's host, or None."""
+    parts = urlsplit(url)
+    parser = RobotFileParser()
+    try:
+        with urlopen(Request(f"{parts.scheme}://{parts.netloc}/robots.txt"), timeout=ROBOTS_TIMEOUT) as response:
+            parser.parse(response.read().decode('utf-8', 'replace').splitlines())
+    except (OSError, ValueError) as e:
+        # No robots.txt (or no way to read it) sets no delay
+        logger.debug(f"No robots.txt for {parts.netloc}: {str(e)}")
+        return None
+    delay = parser.crawl_delay('*')
+    return float(delay) if delay else None
+
+
+class HostBucket:
+    """Token bucket and adaptive rate of one host, capped at max_rate."""
+
+    def __init__(self, rate, burst, max_rate, crawl_delay=None, robots_checked=''):
+        self.max_rate = max_rate
+        self.rate = min(rate, max_rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.resume_at = 0.0
+        self.in_flight = 0
+        self.healthy = 0
+        self.crawl_delay = crawl_delay
+        self.robots_checked = robots_checked
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class Slot:
+    """One navigation a caller holds; report() what came back before the slot is released."""
+
+    def __init__(self, host):
+        self.host = host
+        self.denied = False
+        self.retry_after = None
+
+    def report(self, status=None, text='', retry_after=None):
+        self.denied = is_denied(status, text)
+        if retry_after is not None:
+            try:
+                self.retry_after = float(retry_after)
+            except ValueError:
+                # An HTTP date; the backoff alone has to do
+                pass
+
+
+class PolitenessScheduler:
+    """Hand out navigation slots per host, as fast as each host tolerates.
+
+    Every host has a token bucket refilled at its current rate, and at most
+    per_host requests in flight (concurrency overall). A 403, 429, 503 or
+    "Access Denied" page halves the host's rate and pauses it (for
+    Retry-After when the server sends one), as does a navigation that fails
+    outright; every ramp_after healthy responses in a row raise the rate by
+    a tenth, up to max_rate or the host's robots.txt Crawl-delay, whichever
+    is slower. Thread-safe, so the sync crawlers and the detail fetcher's
+    event loop thread can share one scheduler.
+
+    With a state_path, each host's rate (and Crawl-delay) is saved as the
+    crawl goes and at exit, and the next run starts the host where this one
+    left it.
+    """
+
+    def __init__(self, rate=POLITE_RATE, min_rate=POLITE_MIN_RATE, max_rate=POLITE_MAX_RATE, burst=POLITE_BURST,
+                 per_host=POLITE_PER_HOST, concurrency=POLITE_CONCURRENCY, ramp_after=POLITE_RAMP_AFTER,
+                 state_path=POLITE_STATE_PATH, robots=POLITE_ROBOTS):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1.0, burst)
+        self.per_host = max(1, per_host)
+        self.concurrency = max(1, concurrency)
+        self.ramp_after = max(1, ramp_after)
+        self.state_path = state_path
+        self.robots = robots
+        self.hosts = {}
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.saved = self._load()
+        self.saved_at = time.monotonic()
+        if state_path:
+            atexit.register(self.save)
+
+    def _load(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Starting every host at {self.rate:.2f} requests/s: "
+                           f"cannot read {self.state_path}: {str(e)}")
+            return {}
+
+    def save(self):
+        """Write every host's current rate to state_path."""
+        if not self.state_path:
+            return
+        with self.lock:
+            for host, bucket in self.hosts.items():
+                self.saved[host] = {'rate': bucket.rate, 'crawl_delay': bucket.crawl_delay,
+                                    'robots_checked': bucket.robots_checked}
+            data = json.dumps(self.saved, indent=2, sort_keys=True)
+            self.saved_at = time.monotonic()
+        temp_path = f'{self.state_path}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save request rates to {self.state_path}: {str(e)}")
+
+    def _prepare(self, url):
+        """Set up the bucket of a host met for the first time in this process."""
+        host = host_of(url)
+        saved = self.saved.get(host, {})
+        crawl_delay = saved.get('crawl_delay')
+        robots_checked = saved.get('robots_checked', '')
+        now = datetime.now()
+        if self.robots and robots_checked < (now - ROBOTS_MAX_AGE).isoformat(timespec='seconds'):
+            crawl_delay = robots_crawl_delay(url)
+            robots_checked = now.isoformat(timespec='seconds')
+            if crawl_delay:
+                logger.info(f"{host} asks for {crawl_delay:g}s between requests (robots.txt)")
+        max_rate = min(self.max_rate, 1 / crawl_delay) if crawl_delay else self.max_rate
+        with self.lock:
+            if host not in self.hosts:
+                # A Crawl-delay leaves no room for bursts
+                self.hosts[host] = HostBucket(saved.get('rate', self.rate), 1.0 if crawl_delay else self.burst,
+                                              max_rate, crawl_delay, robots_checked)
+
+    def _bucket(self, host):
+        bucket = self.hosts.get(host)
+        if bucket is None:
+            # Not prepared: no robots.txt or saved rate to go by
+            bucket = self.hosts[host] = HostBucket(self.rate, self.burst, self.max_rate)
+        return bucket
+
+    def _try_acquire(self, host):
+        """Take a slot for host and return 0, or return how long to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            bucket = self._bucket(host)
+            if now < bucket.resume_at:
+                return bucket.resume_at - now
+            if bucket.in_flight >= self.per_host or self.in_flight >= self.concurrency:
+                return POLL_SECONDS
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                return (1 - bucket.tokens) / bucket.rate
+            bucket.tokens -= 1
+            bucket.in_flight += 1
+            self.in_flight += 1
+            return 0
+
+    def _release(self, slot, failed):
+        with self.lock:
+            bucket = self.hosts[slot.host]
+            bucket.in_flight -= 1
+            self.in_flight -= 1
+            if failed or slot.denied:
+                bucket.rate = max(self.min_rate, bucket.rate * BACKOFF_FACTOR)
+                bucket.tokens = 0
+                bucket.healthy = 0
+                pause = slot.retry_after if slot.retry_after is not None else 1 / bucket.rate
+                bucket.resume_at = max(bucket.resume_at, time.monotonic() + pause)
+                logger.warning(f"{slot.host} is pushing back; slowing to {bucket.rate:.2f} requests/s "
+                               f"and pausing {pause:.1f}s")
+            else:
+                bucket.healthy += 1
+                if bucket.healthy >= self.ramp_after and bucket.rate < bucket.max_rate:
+                    bucket.rate = min(bucket.max_rate, bucket.rate * RAMP_FACTOR)
+                    bucket.healthy = 0
+                    logger.debug(f"{slot.host} is healthy; speeding up to {bucket.rate:.2f} requests/s")
+            due = time.monotonic() - self.saved_at >= SAVE_SECONDS
+        if due:
+            self.save()
+
+    @contextmanager
+    def slot(self, url):
+        """Block until url's host may be sent a request; yields the Slot to report the response on."""
+        slot = Slot(host_of(url))
+        if slot.host not in self.hosts:
+            self._prepare(url)
+        while True:
+            wait = self._try_acquire(slot.host)
+            if not wait:
+                break
+            time.sleep(wait)
+        failed = True
+        try:
+            yield slot
+            failed = False
+        finally:
+            self._release(slot, failed)
+
+    @asynccontextmanager
+    async def aslot(self, url):
+        """slot() for coroutines: waits without blocking the event loop."""
+        slot = Slot(host_of(url))
+        if slot.host not in self.hosts:
+            await asyncio.to_thread(self._prepare, url)
+        while True:
+            wait = self._try_acquire(slot.host)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        failed = True
+        try:
+            yield slot
+            failed = False
+        finally:
+            self._release(slot, failed)
+
+    def summary(self):
+        with self.lock:
+            return ', '.join(f"{host} {bucket.rate:.2f}/s"
+                             for host, bucket in sorted(self.hosts.items())) or 'no requests'
+
+
+# Shared by every crawler in the process so all navigations to a host count
+# against the same limits
+SCHEDULER = PolitenessScheduler()
@@ -0,0 +1,243 @@
+import json
+import logging
+import os
+import re
+import sys
+import textwrap
+
+logger = logging.getLogger(__name__)
+
+# Directory crawls in progress stream their records to, one file per crawl;
+# a checkpoint file next to each lets an interrupted crawl pick up where it stopped
+CRAWL_JSONL_DIR = os.environ.get('CRAWL_JSONL_DIR', '.')
+# Bytes per S3 multipart part (S3 wants at least 5 MB for all but the last)
+S3_PART_SIZE = max(5, int(os.environ.get('S3_PART_SIZE_MB', '8'))) * 1024 * 1024
+
+
+def write_snapshot_json(records, output, indent=None):
+    """Stream records into the {"announcements": [...]} snapshot format.
+
+    With indent the bytes match json.dumps({"announcements": records},
+    indent=indent), without ever holding the whole list.
+    """
+    count = 0
+    if indent is None:
+        output.write('{"announcements": [')
+        for record in records:
+            output.write((', ' if count else '') + json.dumps(record, ensure_ascii=False))
+            count += 1
+        output.write(']}')
+        return count
+
+    pad = ' ' * indent
+    output.write('{\n' + pad + '"announcements": [')
+    for record in records:
+        text = json.dumps(record, ensure_ascii=False, indent=indent)
+        output.write((',\n' if count else '\n') + textwrap.indent(text, pad * 2))
+        count += 1
+    output.write(('\n' + pad if count else '') + ']\n}')
+    return count
+
+
+def sink_path(crawl):
+    """Records file of a crawl in progress, named after the crawl."""
+    return os.path.join(CRAWL_JSONL_DIR, re.sub(r'[^\w.-]+', '_', crawl) + '.jsonl')
+
+
+def read_records(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class MemorySink:
+    """Sink that keeps records in a list, for short crawls with nothing to resume."""
+
+    def __init__(self):
+        self.items = []
+        self.urls = set()
+        self.page = 0
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def write(self, records):
+        for record in records:
+            self.items.append(record)
+            if record.get('url'):
+                self.urls.add(record['url'])
+
+    def checkpoint(self, page):
+        self.page = page
+
+    def records(self):
+        return iter(self.items)
+
+
+class JsonlSink:
+    """Append-only JSON lines file of crawled records, one line per record.
+
+    checkpoint() makes everything written so far durable and records the
+    listing page the crawl has finished and a cursor (the last URL written).
+    Opening a path that has a checkpoint resumes it: lines written after
+    the checkpoint are dropped, urls holds what is already in the file and
+    page says which listing page to continue after. discard() removes both
+    files once the crawl's snapshot has been produced.
+
+    crawl names the crawler writing the sink. The file is named after it
+    unless a path is given, and a checkpoint left by a different crawl is
+    refused rather than resumed.
+    """
+
+    def __init__(self, crawl, path=None):
+        self.crawl = crawl
+        self.path = path = path or sink_path(crawl)
+        self.checkpoint_path = path + '.checkpoint'
+        self.state = {'crawl': crawl, 'page': 0, 'cursor': None, 'offset': 0, 'count': 0}
+        self.urls = set()
+        self.resumed = os.path.exists(self.checkpoint_path) and os.path.exists(path)
+        if self.resumed:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('crawl', crawl) != crawl:
+                raise ValueError(f"{path} holds an interrupted {checkpoint['crawl']} crawl, not {crawl}")
+            self.state.update(checkpoint)
+            with open(path, 'r+b') as f:
+                f.truncate(self.state['offset'])
+            for record in read_records(path):
+                if record.get('url'):
+                    self.urls.add(record['url'])
+            logger.info(f"Resuming {path} after page {self.state['page']} "
+                        f"({self.state['count']} records so far)")
+        elif os.path.exists(path):
+            # Output of a crawl that never reached its first checkpoint
+            os.remove(path)
+        self.file = open(path, 'ab')
+
+    @property
+    def page(self):
+        """The last listing page the checkpointed crawl finished."""
+        return self.state['page']
+
+    @property
+    def count(self):
+        return self.state['count']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, records):
+        for record in records:
+            self.file.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            if record.get('url'):
+                self.urls.add(record['url'])
+                self.state['cursor'] = record['url']
+            self.state['count'] += 1
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def checkpoint(self, page):
+        self.flush()
+        self.state.update(page=page, offset=self.file.tell())
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def records(self):
+        """The records written so far, read back from the file."""
+        if not self.file.closed:
+            self.file.flush()
+        return read_records(self.path)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def finalize(self, file_name, indent=2):
+        """Write the {"announcements": [...]} snapshot of everything in the sink; returns the count."""
+        self.flush()
+        with open(file_name, 'w', encoding='utf-8') as f:
+            count = write_snapshot_json(self.records(), f, indent)
+        logger.info(f"Saved {count} announcements to {file_name}")
+        return count
+
+    def discard(self):
+        self.close()
+        for path in (self.path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class S3JsonlSink(JsonlSink):
+    """JsonlSink that also streams its file to S3 as a multipart upload.
+
+    Each checkpoint uploads whatever whole parts have accumulated and keeps
+    the upload id and part ETags in the checkpoint, so a resumed crawl adds
+    parts to the same upload. complete() sends the rest and finishes it.
+    """
+
+    def __init__(self, crawl, bucket, key, path=None, s3=None, part_size=S3_PART_SIZE):
+        # A crawl streaming to another bucket is a different crawl
+        super().__init__(f'{crawl}-{bucket}', path)
+        if s3 is None:
+            import boto3
+            s3 = boto3.client('s3')
+        self.s3 = s3
+        self.bucket = bucket
+        self.part_size = part_size
+        if 'upload_id' not in self.state:
+            upload = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType='application/x-ndjson')
+            self.state.update(key=key, upload_id=upload['UploadId'], parts=[], uploaded=0)
+        self.key = self.state['key']
+        # Persist the upload before anything else so it can be resumed or aborted
+        self.checkpoint(self.page)
+
+    def _upload_part(self, end):
+        with open(self.path, 'rb') as f:
+            f.seek(self.state['uploaded'])
+            body = f.read(end - self.state['uploaded'])
+        number = len(self.state['parts']) + 1
+        response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.state['upload_id'],
+                                       PartNumber=number, Body=body)
+        self.state['parts'].append({'PartNumber': number, 'ETag': response['ETag']})
+        self.state['uploaded'] = end
+
+    def checkpoint(self, page):
+        self.flush()
+        end = self.file.tell()
+        while end - self.state['uploaded'] >= self.part_size:
+            self._upload_part(self.state['uploaded'] + self.part_size)
+        super().checkpoint(page)
+
+    def complete(self):
+        """Upload the remaining bytes as the last part and finish the object."""
+        self.flush()
+        end = self.file.tell()
+        if end > self.state['uploaded'] or not self.state['parts']:
+            self._upload_part(end)
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.state['upload_id'],
+                                          MultipartUpload={'Parts': self.state['parts']})
+        logger.info(f"Streamed {self.count} records to s3://{self.bucket}/{self.key}")
+
+    def abort(self):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.state['upload_id'])
+        self.discard()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python record_sink.py <records.jsonl> <announcements.json>")
+        sys.exit(1)
+
+    # Turn the records of an interrupted (or streamed) crawl into a snapshot
+    with open(sys.argv[2], 'w', encoding='utf-8') as output:
+        count = write_snapshot_json(read_records(sys.argv[1]), output, indent=2)
+    print(f"Saved {count} announcements to {sys.argv[2]}")
@@ -0,0 +1,577 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+from fuzzywuzzy import fuzz
+from announcement_store import AnnouncementStore, TextBlob
+import hashlib
+import heapq
+import math
+import re
+import time
+
+try:
+    from rapidfuzz import fuzz as rapid_fuzz, process as rapid_process
+except ImportError:
+    rapid_process = None
+
+# Size of the q-grams kept in the inverted index. partial_ratio at threshold 70
+# tolerates so many edits that trigrams never give a usable lower bound; bigrams
+# start pruning for longer query terms, shorter terms use character counts.
+GRAM_SIZE = 2
+
+# difflib, which fuzzywuzzy uses without python-Levenshtein, ignores the
+# characters that make up more than 1% of a text this long or longer. In such a
+# text partial_ratio can only line a term up at one of the term's characters
+# that are rare in it, or at its first or last characters.
+AUTOJUNK_LENGTH = 200
+DIFFLIB_SCORES = fuzz.SequenceMatcher is SequenceMatcher
+# Characters kept from each end of long values for the edge windows; terms
+# longer than this score every long value
+EDGE_LENGTH = 64
+
+# BM25 parameters and per-field term weights for ranked search
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {'title': 3.0, 'tags': 2.0, 'content': 1.0}
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Pagination defaults shared by the Flask apps
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SNIPPET_LENGTH = 200
+
+
+class TermMatcher(SequenceMatcher):
+    """SequenceMatcher that only indexes the elements of b that occur in a.
+
+    find_longest_match() never looks up anything but elements of a, so the
+    matching blocks and ratio are exactly SequenceMatcher's, without putting
+    every character of a long b into a dict first. a must be set before b,
+    as the constructor does.
+    """
+
+    def _SequenceMatcher__chain_b(self):
+        b = self.b
+        ntest = len(b) // 100 + 1 if self.autojunk and len(b) >= AUTOJUNK_LENGTH else None
+        self.b2j = b2j = {}
+        self.bjunk = set()
+        self.bpopular = set()
+        for elt in set(self.a):
+            count = b.count(elt)
+            if not count:
+                continue
+            if ntest is not None and count > ntest:
+                self.bpopular.add(elt)
+                continue
+            positions = [b.find(elt)]
+            while len(positions) < count:
+                positions.append(b.find(elt, positions[-1] + 1))
+            b2j[elt] = positions
+
+
+def partial_ratio(s1, s2):
+    """fuzz.partial_ratio of two strings, computed with TermMatcher when fuzzywuzzy uses difflib."""
+    if not DIFFLIB_SCORES:
+        return fuzz.partial_ratio(s1, s2)
+    if s1 == s2:
+        return 100
+    if not s1 or not s2:
+        return 0
+    shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    best = 0.0
+    for short_start, long_start, _ in TermMatcher(None, shorter, longer).get_matching_blocks():
+        start = max(0, long_start - short_start)
+        ratio = TermMatcher(None, shorter, longer[start:start + len(shorter)]).ratio()
+        if ratio > .995:
+            return 100
+        best = max(best, ratio)
+    return int(round(100 * best))
+
+
+def window_scores(term, windows, threshold):
+    """Yield (window, score) for the windows partial_ratio scores >= threshold when it lines term up with them."""
+    if rapid_process is not None:
+        # rapidfuzz's ratio uses the longest common subsequence, so it is
+        # never below difflib's
+        screened = rapid_process.extract(term, windows, scorer=rapid_fuzz.ratio,
+                                         score_cutoff=threshold - 0.5, limit=None)
+        windows = [window for window, _, _ in screened]
+    for window in windows:
+        ratio = TermMatcher(None, term, window).ratio()
+        score = 100 if ratio > .995 else int(round(100 * ratio))
+        if score >= threshold:
+            yield window, score
+
+
+def rare_chars(text):
+    """Characters difflib keeps in b2j for a text of AUTOJUNK_LENGTH or more."""
+    limit = len(text) // 100 + 1
+    return [char for char, count in Counter(text).items() if count <= limit]
+
+
+def fuzzy_search(query, text, threshold=70):
+    """Perform fuzzy search on text."""
+    return fuzz.partial_ratio(query.lower(), text.lower()) >= threshold
+
+
+def score_matrix(terms, texts, threshold=70):
+    """Score every term against every text in one batch.
+
+    Returns one row per term holding the fuzzywuzzy partial_ratio of each
+    text, or 0 where it is below threshold. rapidfuzz searches for the optimal
+    alignment, so its partial_ratio is never below fuzzywuzzy's heuristic one:
+    a single multi-threaded cdist call screens the whole matrix in native code
+    and only the surviving pairs are rescored with partial_ratio(), which keeps
+    fuzzywuzzy's exact matches and scores. On the merged ADGM snapshots a
+    search is about seven times faster than calling fuzzywuzzy for every pair.
+    """
+    rows = [[0] * len(texts) for _ in terms]
+    if not terms or not texts:
+        return rows
+    if rapid_process is None:
+        pairs = [(i, j) for i in range(len(terms)) for j in range(len(texts))]
+    else:
+        screened = rapid_process.cdist(terms, texts, scorer=rapid_fuzz.partial_ratio,
+                                       score_cutoff=threshold - 0.5, workers=-1)
+        pairs = set(zip(*(axis.tolist() for axis in screened.nonzero())))
+        # fuzzywuzzy scores identical strings 100 even when both are empty
+        positions = {text: j for j, text in enumerate(texts)}
+        pairs.update((i, positions[term]) for i, term in enumerate(terms) if term in positions)
+    for i, j in pairs:
+        score = partial_ratio(terms[i], texts[j])
+        if score >= threshold:
+            rows[i][j] = score
+    return rows
+
+
+def page_bounds(limit, offset):
+    """Validate limit/offset query parameters, raising ValueError when invalid."""
+    limit = int(limit) if limit not in (None, '') else DEFAULT_PAGE_SIZE
+    offset = int(offset) if offset not in (None, '') else 0
+    if limit < 1 or offset < 0:
+        raise ValueError("limit must be positive and offset must not be negative")
+    return min(limit, MAX_PAGE_SIZE), offset
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def qgrams(text, q):
+    """Count the q-grams of a string."""
+    return Counter(text[i:i + q] for i in range(len(text) - q + 1))
+
+
+@lru_cache(maxsize=None)
+def min_shared_grams(length, q, threshold):
+    """Lower bound on the q-grams two strings must share to reach the threshold.
+
+    partial_ratio compares the shorter string (``length`` characters) with a
+    window of at most the same length taken from the longer one, and scores it
+    as 2 * matches / (length + window). Every unmatched character destroys at
+    most q grams of the shorter string, which gives the q-gram lemma bound. A
+    result of zero or less means q-grams cannot be used to prune.
+    """
+    bound = None
+    for window in range(1, length + 1):
+        # Half a point of slack keeps the bound safe against intr() rounding
+        needed = next((m for m in range(min(length, window) + 1)
+                       if 200 * m >= (threshold - 0.5) * (length + window) - 1e-9), None)
+        if needed is None:
+            continue
+        shared = (length - q + 1) - q * (length - needed) - (q - 1) * (window - needed)
+        bound = shared if bound is None else min(bound, shared)
+    return bound if bound is not None else 1
+
+
+def shared_count(term_chars, text):
+    """Size of the multiset intersection of a term's character counts and a text."""
+    return sum(min(count, text.count(char)) for char, count in term_chars.items())
+
+
+def prefix_pool(postings, counts, bound):
+    """Ids of the values holding any of the rarest keys of counts.
+
+    A value sharing at least bound of the keys (with multiplicity) shares one
+    of any keys whose counts add up to more than the total less bound, so
+    only the shortest posting lists need walking.
+    """
+    needed = sum(counts.values()) - bound + 1
+    pool = set()
+    for key in sorted(counts, key=postings.count):
+        if needed <= 0:
+            break
+        pool.update(postings.items(key))
+        needed -= counts[key]
+    return pool
+
+
+class Postings:
+    """Inverted lists packed into flat arrays (CSR layout) once building is done.
+
+    Entries are collected per key while building; freeze() concatenates them
+    into one array of ids (and one of values) with a row offset per key. Keys
+    are kept sorted in a TextBlob and looked up by binary search, so a frozen
+    Postings is nothing but flat buffers and can be memory-mapped. Unkeyed
+    postings use the insertion order of their keys as row numbers.
+    """
+
+    def __init__(self, value_type=None, keyed=True):
+        self.keyed = keyed
+        self.keys = TextBlob()
+        self.offsets = array('Q', [0])
+        self.ids = array('I')
+        self.values = array(value_type) if value_type else None
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, key, item, value=None):
+        self.pending.setdefault(key, []).append((item, value))
+
+    def last(self, key):
+        """Most recently added item for key, or None."""
+        entries = self.pending.get(key)
+        return entries[-1][0] if entries else None
+
+    def freeze(self):
+        keys = self.pending
+        if self.keyed:
+            # UTF-8 byte order, which span() relies on for its binary search
+            keys = sorted(keys, key=lambda key: key.encode('utf-8'))
+        for key in keys:
+            if self.keyed:
+                self.keys.append(key)
+            for item, value in self.pending[key]:
+                self.ids.append(item)
+                if self.values is not None:
+                    self.values.append(value)
+            self.offsets.append(len(self.ids))
+        self.keys.freeze()
+        self.pending = {}
+
+    def row(self, key):
+        """Row number of key, or None when it has no entries."""
+        if not self.keyed:
+            return key if 0 <= key < len(self) else None
+        target = key.encode('utf-8')
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys.raw(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.keys) and self.keys.raw(low) == target:
+            return low
+        return None
+
+    def span(self, key):
+        """(start, end) positions of key's entries in ids/values."""
+        row = self.row(key)
+        if row is None:
+            return 0, 0
+        return self.offsets[row], self.offsets[row + 1]
+
+    def items(self, key):
+        start, end = self.span(key)
+        return self.ids[start:end]
+
+    def count(self, key):
+        """Number of entries for key."""
+        start, end = self.span(key)
+        return end - start
+
+    def entries(self):
+        """(key, items) of every row, in key order."""
+        for row in range(len(self)):
+            yield self.keys[row], self.ids[self.offsets[row]:self.offsets[row + 1]]
+
+
+class FieldIndex:
+    """Distinct lowercased values of one announcement field, indexed for candidate search.
+
+    Values shorter than AUTOJUNK_LENGTH get character and q-gram postings with
+    counts, and are listed by length. Longer values only get postings of their
+    rare characters and of their first and last EDGE_LENGTH characters, which
+    is all difflib can line a term up with (see candidates()). Packed fields
+    keep their values in a TextBlob.
+    """
+
+    def __init__(self, q=GRAM_SIZE, packed=False):
+        self.q = q
+        self.packed = packed
+        self.texts = TextBlob() if packed else []
+        self.ids = {}
+        self.lengths = array('I')
+        self.docs = Postings(keyed=False)
+        self.chars = Postings('H')
+        self.grams = Postings('H')
+        self.rare = Postings()
+        self.heads = Postings()
+        self.tails = Postings()
+        # Ids of the short values by increasing length, and their lengths
+        self.by_length = array('I')
+        self.short_lengths = array('I')
+
+    def key(self, text):
+        """Deduplication key; packed fields key on a digest rather than the text."""
+        if self.packed:
+            return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        return text
+
+    def lookup(self, text):
+        """Id of the value equal to text, or None."""
+        key = self.key(text)
+        if isinstance(self.ids, dict):
+            return self.ids.get(key)
+        ids = self.ids.items(key)
+        return ids[0] if len(ids) else None
+
+    def add(self, doc_id, text):
+        text = text.lower()
+        key = self.key(text)
+        field_id = self.ids.get(key)
+        if field_id is None:
+            field_id = len(self.texts)
+            self.ids[key] = field_id
+            self.texts.append(text)
+            self.lengths.append(len(text))
+            if len(text) < AUTOJUNK_LENGTH:
+                for char, count in Counter(text).items():
+                    self.chars.add(char, field_id, min(count, 0xFFFF))
+                for gram, count in qgrams(text, self.q).items():
+                    self.grams.add(gram, field_id, min(count, 0xFFFF))
+            else:
+                for char in rare_chars(text):
+                    self.rare.add(char, field_id)
+                self.heads.add(text[:EDGE_LENGTH], field_id)
+                self.tails.add(text[-EDGE_LENGTH:], field_id)
+        if self.docs.last(field_id) != doc_id:
+            self.docs.add(field_id, doc_id)
+
+    def freeze(self):
+        ids = Postings()
+        for key, field_id in self.ids.items():
+            ids.add(key, field_id)
+        ids.freeze()
+        self.ids = ids
+        self.docs.freeze()
+        for postings in (self.chars, self.grams, self.rare, self.heads, self.tails):
+            postings.freeze()
+        short = sorted((field_id for field_id, length in enumerate(self.lengths) if length < AUTOJUNK_LENGTH),
+                       key=self.lengths.__getitem__)
+        self.by_length = array('I', short)
+        self.short_lengths = array('I', (self.lengths[field_id] for field_id in short))
+        if self.packed:
+            self.texts.freeze()
+
+    def candidates(self, term, threshold):
+        """(ids, scores) of the values that can still score >= threshold against term.
+
+        ids still need scoring; scores already holds the partial_ratio of the
+        long values the term can only be lined up with at their edges. The
+        filters only discard values that provably cannot reach the threshold,
+        so scoring the candidates gives the same answer as scoring every value.
+        """
+        exact = self.lookup(term)
+        if not term:
+            # partial_ratio scores empty strings 0 unless both sides are empty
+            return ([] if exact is None else [exact]), {}
+        found = self.short_candidates(term, threshold)
+        scores = self.long_candidates(term, threshold, found)
+        if exact is not None:
+            found.add(exact)
+        return sorted(found), scores
+
+    def short_candidates(self, term, threshold):
+        """Ids of the values shorter than AUTOJUNK_LENGTH that pass the shared character and q-gram bounds."""
+        term_chars = Counter(term)
+        length = len(term)
+        # Values at least as long as the term are windowed by it, so a match
+        # shares char_bound of its characters and gram_bound of its q-grams
+        char_bound = min_shared_grams(length, 1, threshold)
+        gram_bound = min_shared_grams(length, self.q, threshold)
+        pool = prefix_pool(self.chars, term_chars, char_bound)
+        if gram_bound > 0:
+            term_grams = qgrams(term, self.q)
+            pool &= prefix_pool(self.grams, term_grams, gram_bound)
+        found = set()
+        for field_id in pool:
+            if self.lengths[field_id] < length:
+                continue
+            text = self.texts[field_id]
+            if shared_count(term_chars, text) < char_bound:
+                continue
+            if gram_bound > 0:
+                text_grams = qgrams(text, self.q)
+                if sum(min(count, text_grams[gram]) for gram, count in term_grams.items()) < gram_bound:
+                    continue
+            found.add(field_id)
+
+        # Values shorter than the term are the ones being windowed, so the
+        # bound depends on their own length
+        end = bisect_left(self.short_lengths, length)
+        for position in range(bisect_left(self.short_lengths, 1), end):
+            field_id = self.by_length[position]
+            if shared_count(term_chars, self.texts[field_id]) >= min_shared_grams(self.short_lengths[position], 1,
+                                                                                   threshold):
+                found.add(field_id)
+        return found
+
+    def long_candidates(self, term, threshold, found):
+        """Add the long values that need scoring to found; returns the scores of those that do not."""
+        if not DIFFLIB_SCORES or len(term) > EDGE_LENGTH:
+            found.update(field_id for field_id, length in enumerate(self.lengths) if length >= AUTOJUNK_LENGTH)
+            return {}
+        # A term character that is rare in the value lets difflib line the
+        # term up anywhere in it
+        aligned = set()
+        for char in set(term):
+            aligned.update(self.rare.items(char))
+        found.update(aligned)
+        # Otherwise it only compares the term with the value's first
+        # characters, when both start with the same one, and its last ones
+        windows = {}
+        for head, field_ids in self.heads.entries():
+            if head[0] == term[0]:
+                windows.setdefault(head[:len(term)], []).append(field_ids)
+        for tail, field_ids in self.tails.entries():
+            windows.setdefault(tail[-len(term):], []).append(field_ids)
+        scores = {}
+        for window, score in window_scores(term, list(windows), threshold):
+            for field_ids in windows[window]:
+                for field_id in field_ids:
+                    if field_id not in aligned and score > scores.get(field_id, 0):
+                        scores[field_id] = score
+        return scores
+
+
+class AnnouncementIndex:
+    """In-memory search index over an AnnouncementStore (or a list of announcement dicts)."""
+
+    def __init__(self, announcements, q=GRAM_SIZE):
+        if not isinstance(announcements, AnnouncementStore):
+            announcements = AnnouncementStore(announcements)
+        self.announcements = announcements
+        self.tags = FieldIndex(q)
+        self.titles = FieldIndex(q)
+        self.contents = FieldIndex(q, packed=True)
+        # Field-weighted term frequencies for BM25 ranking, as parallel arrays
+        # of increasing doc ids and weights per token
+        self.postings = Postings('f')
+        self.doc_lengths = array('f')
+        for doc_id, announcement in enumerate(announcements):
+            weighted = Counter()
+            for tag in announcement.get('tags', []):
+                self.tags.add(doc_id, tag)
+                for token in tokenize(tag):
+                    weighted[token] += FIELD_WEIGHTS['tags']
+            self.titles.add(doc_id, announcement.get('title', ''))
+            for token in tokenize(announcement.get('title', '')):
+                weighted[token] += FIELD_WEIGHTS['title']
+            if 'content' in announcement:
+                content = announcement['content']
+                self.contents.add(doc_id, content)
+                for token in tokenize(content):
+                    weighted[token] += FIELD_WEIGHTS['content']
+            for token, frequency in weighted.items():
+                self.postings.add(token, doc_id, frequency)
+            self.doc_lengths.append(sum(weighted.values()))
+        for field in (self.tags, self.titles, self.contents):
+            field.freeze()
+        self.postings.freeze()
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def __len__(self):
+        return len(self.announcements)
+
+    def match_scores(self, terms, threshold=70, timings=None):
+        """Best fuzzy score of every announcement where any term matches a tag, the title or the content.
+
+        When timings is a dict, the seconds spent finding candidates and
+        scoring them are added to its 'candidates' and 'scoring' entries.
+        """
+        scores = {}
+        terms = [term.lower() for term in terms]
+        candidate_seconds = scoring_seconds = 0.0
+        for field in (self.tags, self.titles, self.contents):
+            started = time.perf_counter()
+            field_ids = set()
+            # Scores the candidate search already worked out
+            known = {}
+            for term in terms:
+                term_ids, term_scores = field.candidates(term, threshold)
+                field_ids.update(term_ids)
+                for field_id, score in term_scores.items():
+                    known[field_id] = max(score, known.get(field_id, 0))
+            field_ids = sorted(field_ids)
+            if field is self.contents:
+                # Long contents are only scored for announcements that have
+                # not matched on a cheaper field yet
+                field_ids = [field_id for field_id in field_ids
+                             if any(doc_id not in scores for doc_id in field.docs.items(field_id))]
+                known = {field_id: score for field_id, score in known.items()
+                         if any(doc_id not in scores for doc_id in field.docs.items(field_id))}
+            filtered = time.perf_counter()
+            for field_id, score in known.items():
+                for doc_id in field.docs.items(field_id):
+                    scores[doc_id] = max(score, scores.get(doc_id, 0))
+            matrix = score_matrix(terms, [field.texts[field_id] for field_id in field_ids], threshold)
+            for row in matrix:
+                for field_id, score in zip(field_ids, row):
+                    if score:
+                        for doc_id in field.docs.items(field_id):
+                            scores[doc_id] = max(score, scores.get(doc_id, 0))
+            candidate_seconds += filtered - started
+            scoring_seconds += time.perf_counter() - filtered
+        if timings is not None:
+            timings['candidates'] = timings.get('candidates', 0.0) + candidate_seconds
+            timings['scoring'] = timings.get('scoring', 0.0) + scoring_seconds
+        return scores
+
+    def matching_ids(self, terms, threshold=70):
+        """Ids of announcements where any term fuzzy-matches a tag, the title or the content."""
+        return sorted(self.match_scores(terms, threshold))
+
+    def search(self, terms, threshold=70):
+        """Return the matching announcements in corpus order."""
+        return [self.announcements[doc_id] for doc_id in self.matching_ids(terms, threshold)]
+
+    def bm25(self, doc_id, tokens):
+        """BM25 score of an announcement for the given query tokens."""
+        total = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / (self.avg_doc_length or 1.0))
+        for token in tokens:
+            start, end = self.postings.span(token)
+            position = bisect_left(self.postings.ids, doc_id, start, end)
+            if position == end or self.postings.ids[position] != doc_id:
+                continue
+            matches = end - start
+            idf = math.log(1 + (len(self.doc_lengths) - matches + 0.5) / (matches + 0.5))
+            frequency = self.postings.values[position]
+            total += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return total
+
+    def ranked_search(self, terms, limit=20, offset=0, threshold=70, timings=None):
+        """Return (total, page) for the matches ranked by fuzzy score plus BM25.
+
+        Only the best offset + limit matches are kept on a heap, so the page
+        size, not the number of matches, bounds the sorting work. Each entry of
+        the page is a (score, announcement) pair. timings is passed on to
+        match_scores and also gets the BM25 ranking time under 'ranking'.
+        """
+        matches = self.match_scores(terms, threshold, timings)
+        started = time.perf_counter()
+        tokens = set(token for term in terms for token in tokenize(term))
+        scored = ((fuzzy / 100.0 + self.bm25(doc_id, tokens), -doc_id)
+                  for doc_id, fuzzy in matches.items())
+        top = heapq.nlargest(offset + limit, scored)[offset:]
+        if timings is not None:
+            timings['ranking'] = timings.get('ranking', 0.0) + time.perf_counter() - started
+        return len(matches), [(round(score, 4), self.announcements[-neg_id]) for score, neg_id in top]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Vectorizer settings shared by build() and load(); load() must reproduce the
+# tokenization the matrix was built with
+VECTORIZER_OPTIONS = {'stop_words': 'english'}
+
+
+def semantic_index_path(json_path):
+    """TF-IDF index file that sits next to a JSON snapshot."""
+    return os.path.splitext(json_path)[0] + '.tfidf.npz'
+
+
+def document_text(announcement):
+    """Text of an announcement that goes into its TF-IDF vector."""
+    return ' '.join([announcement.get('title', ''), ' '.join(announcement.get('tags', [])),
+                     announcement.get('content', '')])
+
+
+def corpus_digest(announcements):
+    """Digest of every announcement's indexed text and URL, in order, tying a saved matrix to its corpus."""
+    digest = hashlib.blake2b(digest_size=16)
+    for announcement in announcements:
+        digest.update(f"{document_text(announcement)}\x1f{announcement.get('url', '')}\x1e".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def top_k(scores, limit, offset=0, exclude=None):
+    """(score, position) pairs of the best positive scores, highest first.
+
+    argpartition keeps this linear in the number of documents; only the
+    selected offset + limit entries are sorted.
+    """
+    if exclude is not None:
+        scores[exclude] = 0.0
+    candidates = np.flatnonzero(scores > 0)
+    wanted = min(offset + limit, len(candidates))
+    if wanted == 0:
+        return []
+    best = candidates[np.argpartition(-scores[candidates], wanted - 1)[:wanted]]
+    best = best[np.lexsort((best, -scores[best]))][offset:]
+    return [(round(float(scores[position]), 4), int(position)) for position in best]
+
+
+class SemanticIndex:
+    """Persisted TF-IDF matrix over the announcements for vector search.
+
+    This is the similarity computation from parsing_old/process_announcements.py
+    kept around at query time: rows are L2-normalized, so a single sparse
+    matrix-vector product gives the cosine similarity of a query (or of another
+    announcement) against the whole corpus.
+    """
+
+    def __init__(self, vectorizer, matrix, announcements):
+        self.vectorizer = vectorizer
+        self.matrix = matrix.tocsr()
+        self.announcements = announcements
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @classmethod
+    def build(cls, announcements):
+        vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+        texts = [document_text(announcement) for announcement in announcements]
+        try:
+            matrix = vectorizer.fit_transform(texts)
+        except ValueError:
+            # Empty corpus (or nothing but stop words): a one-term vocabulary
+            # no query can hit keeps search() and save() working
+            vectorizer = TfidfVectorizer(vocabulary={'': 0}, **VECTORIZER_OPTIONS)
+            vectorizer.idf_ = np.ones(1)
+            matrix = sparse.csr_matrix((len(texts), 1))
+        return cls(vectorizer, matrix, announcements)
+
+    def save(self, path):
+        terms = self.vectorizer.get_feature_names_out()
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, corpus=np.array(corpus_digest(self.announcements)), terms=terms.astype(str),
+                     idf=self.vectorizer.idf_,
+                     data=self.matrix.data, indices=self.matrix.indices,
+                     indptr=self.matrix.indptr, shape=np.array(self.matrix.shape))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, announcements):
+        """The index saved at path, which must have been built from announcements.
+
+        Raises ValueError for an index of any other corpus, even one of the
+        same size, such as the previous crawl's while a new one is uploaded.
+        """
+        with np.load(path, allow_pickle=False) as saved:
+            corpus = str(saved['corpus']) if 'corpus' in saved.files else None
+            vocabulary = {term: i for i, term in enumerate(saved['terms'].tolist())}
+            vectorizer = TfidfVectorizer(vocabulary=vocabulary, **VECTORIZER_OPTIONS)
+            vectorizer.idf_ = saved['idf']
+            matrix = sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']),
+                                       shape=tuple(saved['shape']))
+        if matrix.shape[0] != len(announcements):
+            raise ValueError(f"{path} has {matrix.shape[0]} rows for {len(announcements)} announcements")
+        if corpus != corpus_digest(announcements):
+            raise ValueError(f"{path} was built from a different set of announcements")
+        return cls(vectorizer, matrix, announcements)
+
+    def search(self, query, limit=20, offset=0):
+        """Return (total, page) of announcements ranked by cosine similarity to query."""
+        vector = self.vectorizer.transform([query])
+        scores = (self.matrix @ vector.T).toarray().ravel()
+        page = top_k(scores, limit, offset)
+        return int(np.count_nonzero(scores)), [(score, self.announcements[doc_id]) for score, doc_id in page]
+
+    def similar(self, doc_id, limit=10):
+        """Announcements most similar to the one with the given id."""
+        scores = (self.matrix @ self.matrix[doc_id].T).toarray().ravel()
+        return [(score, self.announcements[other]) for score, other in top_k(scores, limit, exclude=doc_id)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python semantic_index.py <announcements.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    announcements = data['announcements'] if isinstance(data, dict) else data
+    output_path = semantic_index_path(sys.argv[1])
+    SemanticIndex.build(announcements).save(output_path)
+    print(f"Saved TF-IDF index for {len(announcements)} announcements to {output_path}")
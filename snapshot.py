@@ -0,0 +1,195 @@
+from array import array
+import json
+import mmap
+import os
+import sys
+from announcement_store import AnnouncementStore, TagLists, TextBlob
+from search_index import AnnouncementIndex, FieldIndex, Postings
+
+# Snapshot layout: MAGIC, an 8-byte little-endian header length, a JSON header
+# describing every section, then the sections themselves, each 8-byte aligned.
+# Sections are raw native arrays, so loading is a memory map plus one
+# memoryview per section no matter how large the corpus is.
+MAGIC = b'ADGMSNP1'
+VERSION = 3
+ALIGNMENT = 8
+
+FIELD_NAMES = ('tags', 'titles', 'contents')
+FIELD_POSTINGS = ('ids', 'docs', 'chars', 'grams', 'rare', 'heads', 'tails')
+FIELD_ARRAYS = ('lengths', 'by_length', 'short_lengths')
+
+
+def snapshot_path(json_path):
+    """Snapshot file that sits next to a JSON snapshot."""
+    return os.path.splitext(json_path)[0] + '.snap'
+
+
+def _as_blob(texts):
+    if isinstance(texts, TextBlob):
+        return texts
+    blob = TextBlob()
+    for text in texts:
+        blob.append(text)
+    blob.freeze()
+    return blob
+
+
+def _add_blob(sections, name, blob):
+    sections[f'{name}.buffer'] = blob.buffer
+    sections[f'{name}.offsets'] = blob.offsets
+
+
+def _add_postings(sections, meta, name, postings):
+    meta[name] = {'keyed': postings.keyed}
+    _add_blob(sections, f'{name}.keys', postings.keys)
+    sections[f'{name}.offsets'] = postings.offsets
+    sections[f'{name}.ids'] = postings.ids
+    if postings.values is not None:
+        sections[f'{name}.values'] = postings.values
+
+
+def _typecode(data):
+    if isinstance(data, array):
+        return data.typecode
+    if isinstance(data, memoryview):
+        return data.format
+    return 'B'
+
+
+def write_snapshot(index, path):
+    """Write an AnnouncementIndex and its store to path.
+
+    The file is written next to path and renamed into place, so processes that
+    have the previous snapshot mapped keep a consistent view of it.
+    """
+    store = index.announcements
+    sections = {}
+    meta = {'version': VERSION, 'byteorder': sys.byteorder, 'records': len(store),
+            'avg_doc_length': index.avg_doc_length}
+
+    for column in ('titles', 'dates', 'sources', 'urls'):
+        _add_blob(sections, f'store.{column}', _as_blob(getattr(store, column)))
+    for column in ('tags', 'alternate_urls'):
+        lists = getattr(store, column)
+        lists = lists if isinstance(lists, TagLists) else TagLists.from_tuples(lists)
+        _add_blob(sections, f'store.{column}.names', lists.names)
+        sections[f'store.{column}.offsets'] = lists.offsets
+        sections[f'store.{column}.ids'] = lists.ids
+    sections['store.content_kinds'] = store.content_kinds
+    _add_blob(sections, 'store.contents', store.contents)
+
+    for name in FIELD_NAMES:
+        field = getattr(index, name)
+        meta[f'{name}.field'] = {'q': field.q, 'packed': field.packed}
+        _add_blob(sections, f'{name}.texts', _as_blob(field.texts))
+        for kind in FIELD_POSTINGS:
+            _add_postings(sections, meta, f'{name}.{kind}', getattr(field, kind))
+        for column in FIELD_ARRAYS:
+            sections[f'{name}.{column}'] = getattr(field, column)
+    sections['doc_lengths'] = index.doc_lengths
+    _add_postings(sections, meta, 'postings', index.postings)
+
+    layout = {}
+    position = 0
+    for name, data in sections.items():
+        size = memoryview(data).nbytes
+        layout[name] = [position, size, _typecode(data)]
+        position += -(-size // ALIGNMENT) * ALIGNMENT
+    meta['sections'] = layout
+    header = json.dumps(meta).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, data in sections.items():
+            f.seek(data_start + layout[name][0])
+            f.write(memoryview(data).cast('B'))
+        f.truncate(data_start + position)
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path):
+    """Memory-map a snapshot and return a ready-to-search AnnouncementIndex.
+
+    Nothing is parsed or copied up front; every array and text column is a
+    view into the mapping and pages are read in as searches touch them.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an announcement snapshot")
+    header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+    header_start = len(MAGIC) + 8
+    meta = json.loads(buffer[header_start:header_start + header_length].decode('utf-8'))
+    if meta['version'] != VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta['version']} in {path}")
+    if meta['byteorder'] != sys.byteorder:
+        raise ValueError(f"{path} was written on a {meta['byteorder']}-endian machine")
+    data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+    view = memoryview(buffer)
+
+    def section(name):
+        offset, size, typecode = meta['sections'][name]
+        data = view[data_start + offset:data_start + offset + size]
+        return data if typecode == 'B' else data.cast(typecode)
+
+    def blob(name):
+        return TextBlob(section(f'{name}.buffer'), section(f'{name}.offsets'))
+
+    def postings(name):
+        loaded = Postings.__new__(Postings)
+        loaded.keyed = meta[name]['keyed']
+        loaded.keys = blob(f'{name}.keys')
+        loaded.offsets = section(f'{name}.offsets')
+        loaded.ids = section(f'{name}.ids')
+        loaded.values = section(f'{name}.values') if f'{name}.values' in meta['sections'] else None
+        loaded.pending = {}
+        return loaded
+
+    store = AnnouncementStore.__new__(AnnouncementStore)
+    for column in ('titles', 'dates', 'sources', 'urls'):
+        setattr(store, column, blob(f'store.{column}'))
+    for column in ('tags', 'alternate_urls'):
+        setattr(store, column, TagLists(blob(f'store.{column}.names'), section(f'store.{column}.offsets'),
+                                        section(f'store.{column}.ids')))
+    store.content_kinds = section('store.content_kinds')
+    store.contents = blob('store.contents')
+
+    index = AnnouncementIndex.__new__(AnnouncementIndex)
+    index.announcements = store
+    for name in FIELD_NAMES:
+        field = FieldIndex.__new__(FieldIndex)
+        field.q = meta[f'{name}.field']['q']
+        field.packed = meta[f'{name}.field']['packed']
+        field.texts = blob(f'{name}.texts')
+        for kind in FIELD_POSTINGS:
+            setattr(field, kind, postings(f'{name}.{kind}'))
+        for column in FIELD_ARRAYS:
+            setattr(field, column, section(f'{name}.{column}'))
+        setattr(index, name, field)
+    index.doc_lengths = section('doc_lengths')
+    index.avg_doc_length = meta['avg_doc_length']
+    index.postings = postings('postings')
+    return index
+
+
+def convert(json_path, output_path=None):
+    """Build a snapshot from an existing JSON snapshot and return its path."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    announcements = data['announcements'] if isinstance(data, dict) else data
+    output_path = output_path or snapshot_path(json_path)
+    write_snapshot(AnnouncementIndex(AnnouncementStore(announcements)), output_path)
+    return output_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python snapshot.py <announcements.json> [output.snap]")
+        sys.exit(1)
+
+    output_path = convert(*sys.argv[1:])
+    print(f"Saved {len(load_snapshot(output_path))} announcements to {output_path}")
@@ -0,0 +1,150 @@
+import glob
+import json
+import random
+import re
+import sys
+from collections import defaultdict
+from announcement_store import CONTENT_PREFIX
+
+# Real snapshots the synthetic corpus takes its vocabulary and shape from
+SOURCE_FILES = sorted(glob.glob('adgm_announcements*.json'))
+
+RELATIVE_DATES = ['1 day ago', '2 days ago', '3 days ago', '4 days ago', '5 days ago', '6 days ago']
+DISCLAIMER = ("Disclaimer\nThis is an external communication and is not an official statement "
+              "or announcement from ADGM.\n\n")
+
+# Synthetic sentences generated from the word chain, on top of the real ones
+SYNTHETIC_SENTENCES = 5000
+
+
+def load_sample(paths=None):
+    """Announcements from the real snapshots, deduplicated by URL."""
+    records = {}
+    for path in paths or SOURCE_FILES:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for announcement in data['announcements'] if isinstance(data, dict) else data:
+            records.setdefault(announcement.get('url') or announcement.get('title'), announcement)
+    return list(records.values())
+
+
+def body_of(announcement):
+    """Content with the navigation header, title and byline removed."""
+    content = announcement.get('content', '')
+    if content.startswith(CONTENT_PREFIX):
+        content = content.split('\n', 6)[-1]
+    return content.replace(DISCLAIMER, '')
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in re.split(r'(?<=[.!?])\s+|\n+', text) if len(sentence.split()) > 3]
+
+
+class CorpusModel:
+    """Word and sentence statistics of the real snapshots used to generate records."""
+
+    def __init__(self, sample, seed=0):
+        self.random = random.Random(seed)
+        self.titles = [announcement.get('title', '') for announcement in sample]
+        self.sources = [announcement.get('source', 'ADGM') for announcement in sample]
+        self.tags = [tag for announcement in sample for tag in announcement.get('tags', [])]
+        self.tag_counts = [len(announcement.get('tags', [])) for announcement in sample]
+        self.sentence_counts = []
+        sentences = []
+        for announcement in sample:
+            body_sentences = split_sentences(body_of(announcement))
+            self.sentence_counts.append(max(1, len(body_sentences)))
+            sentences.extend(body_sentences)
+
+        # First-order word chain over the real sentences
+        self.chain = defaultdict(list)
+        self.starts = []
+        for sentence in sentences:
+            words = sentence.split()
+            self.starts.append(words[0])
+            for current, following in zip(words, words[1:] + [None]):
+                self.chain[current].append(following)
+        self.sentences = sentences + [self.sentence() for _ in range(SYNTHETIC_SENTENCES)]
+
+    def sentence(self, max_words=60):
+        word = self.random.choice(self.starts)
+        words = [word]
+        while len(words) < max_words:
+            word = self.random.choice(self.chain[word])
+            if word is None:
+                break
+            words.append(word)
+        return ' '.join(words)
+
+    def title(self):
+        words = self.random.choice(self.titles).split()
+        # Swap a few words for ones from other titles to avoid exact copies
+        for _ in range(max(1, len(words) // 4)):
+            words[self.random.randrange(len(words))] = self.random.choice(self.random.choice(self.titles).split())
+        return ' '.join(words)
+
+    def date(self):
+        if self.random.random() < 0.3:
+            return self.random.choice(RELATIVE_DATES)
+        return f"{self.random.randint(1, 28):02d}/{self.random.randint(1, 12):02d}/{self.random.randint(2019, 2024)}"
+
+    def announcement(self, number):
+        title = self.title()
+        date = self.date()
+        source = self.random.choice(self.sources)
+        count = self.random.choice(self.sentence_counts)
+        body = ' '.join(self.random.choice(self.sentences) for _ in range(count))
+        disclaimer = DISCLAIMER if self.random.random() < 0.5 else '\n'
+        tags = self.random.sample(self.tags, min(len(self.tags), self.random.choice(self.tag_counts)))
+        slug = re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')
+        return {
+            "title": title,
+            "date": date,
+            "source": source,
+            "content": f"{CONTENT_PREFIX}{title}\n{source} {date}\n{disclaimer}{body}",
+            "tags": tags,
+            "url": f"https://www.adgm.com/media/announcements/{slug}-{number}"
+        }
+
+
+def generate_announcements(count, seed=0, sample=None):
+    """Yield count synthetic announcements shaped like the real snapshots."""
+    model = CorpusModel(sample if sample is not None else load_sample(), seed)
+    for number in range(count):
+        yield model.announcement(number)
+
+
+def sample_queries(count, seed=0, sample=None):
+    """Multi-term queries like the ones /search receives: tags, title words and typos."""
+    sample = sample if sample is not None else load_sample()
+    rng = random.Random(seed)
+    tags = [tag for announcement in sample for tag in announcement.get('tags', [])]
+    words = [word.lower() for announcement in sample for word in announcement.get('title', '').split() if len(word) > 3]
+    queries = []
+    for _ in range(count):
+        terms = []
+        for _ in range(rng.randint(1, 3)):
+            term = rng.choice(tags) if tags and rng.random() < 0.5 else rng.choice(words)
+            if rng.random() < 0.2 and len(term) > 4:
+                # Drop a character to simulate a typo
+                position = rng.randrange(len(term))
+                term = term[:position] + term[position + 1:]
+            terms.append(term)
+        queries.append(terms)
+    return queries
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python synthetic_corpus.py <count> <output.json> [seed]")
+        sys.exit(1)
+
+    count, output_path = int(sys.argv[1]), sys.argv[2]
+    seed = int(sys.argv[3]) if len(sys.argv) == 4 else 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        # Streamed so a million records never sit in memory at once
+        f.write('{"announcements": [\n')
+        for number, announcement in enumerate(generate_announcements(count, seed)):
+            f.write((',\n' if number else '') + json.dumps(announcement, ensure_ascii=False))
+        f.write('\n]}\n')
+    print(f"Saved {count} synthetic announcements to {output_path}")
@@ -0,0 +1,68 @@
+import os
+from collections import Counter
+from lazy_resources import register
+from nlp_cache import NlpCache, model_id
+
+# Components the tags never read: noun chunks need the tagger, parser and
+# attribute ruler (for POS) and entities need ner, but nothing needs lemmas
+DISABLED_COMPONENTS = ['lemmatizer']
+
+# Texts per nlp.pipe batch, and worker processes for big batches (1 keeps
+# it in-process, which is faster for a listing page's worth of texts)
+TAG_BATCH_SIZE = int(os.environ.get('TAG_BATCH_SIZE', '64'))
+TAG_PROCESSES = int(os.environ.get('TAG_PROCESSES', '1'))
+
+MODEL_NAME = "en_core_web_sm"
+
+def load_model():
+    import spacy
+    return spacy.load(MODEL_NAME, disable=DISABLED_COMPONENTS)
+
+# The English NLP model, loaded once per process on the first texts that
+# miss the cache (or by lazy_resources.warm_up)
+model = register(f"spacy:{MODEL_NAME}", load_model)
+
+# Entity types kept as tags
+TAG_LABELS = ['ORG', 'PERSON', 'GPE', 'PRODUCT']
+
+# Tags of texts tagged before, by any crawler (NLP_CACHE_PATH); opened on the
+# first texts tagged, not on import
+cache = register('nlp_cache', NlpCache.from_environment)
+MODEL_ID = model_id(MODEL_NAME)
+
+def tags_from_doc(doc, max_tags=5):
+    # Extract named entities
+    entities = [ent.text.lower() for ent in doc.ents if ent.label_ in TAG_LABELS]
+
+    # Extract noun phrases
+    noun_phrases = [chunk.text.lower() for chunk in doc.noun_chunks if len(chunk.text.split()) > 1]
+
+    # Combine entities and noun phrases
+    potential_tags = entities + noun_phrases
+
+    # Count occurrences and get the most common tags
+    tag_counts = Counter(potential_tags)
+    top_tags = [tag for tag, _ in tag_counts.most_common(max_tags)]
+
+    return top_tags
+
+def extract_tags(text, max_tags=5):
+    # Process the text with spaCy
+    return extract_tags_batch([text], max_tags)[0]
+
+def extract_tags_batch(texts, max_tags=5, batch_size=TAG_BATCH_SIZE, n_process=TAG_PROCESSES):
+    """Tags of every text, in order; texts not in the cache go through one nlp.pipe run."""
+    def tag(texts):
+        if not texts:
+            return []
+        # Worker processes only pay off when each gets several batches
+        processes = n_process if len(texts) >= batch_size * n_process else 1
+        docs = model.get().pipe(texts, batch_size=batch_size, n_process=processes)
+        return [tags_from_doc(doc, max_tags) for doc in docs]
+
+    texts = list(texts)
+    nlp_cache = cache.get() if texts else None
+    if nlp_cache is None:
+        return tag(texts)
+    # The labels and tag count shape the result as much as the model does
+    return nlp_cache.memoize(f"tags:{max_tags}:{','.join(TAG_LABELS)}", MODEL_ID, texts, tag)